@@ -2,12 +2,35 @@
 # from MacAutoSymbolizer.mac_symbolize import symbolize
 # from MacAutoSymbolizer.src.subprocess_atos import SubProcessAtos, UnSymbolLine, SymbolizedLine
 
-from MacAutoSymbolizer.src.utilities import Arch, read_config
-from MacAutoSymbolizer.src.symbolizer import Symbolizer
+"""
+Exports are imported on first use, so `import MacAutoSymbolizer` and the command line start
+fast; config.ini is read the first time an option is needed (see utilities.LazyConfigParser).
+"""
+
+import importlib
+
+_EXPORTS = {
+    'Arch': 'MacAutoSymbolizer.src.utilities',
+    'read_config': 'MacAutoSymbolizer.src.utilities',
+    'Symbolizer': 'MacAutoSymbolizer.src.symbolizer',
+    'BatchReport': 'MacAutoSymbolizer.src.symbolizer',
+}
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_EXPORTS))
 
-read_config()
 
 __all__ = [
     'Arch',
     'Symbolizer',
-]
\ No newline at end of file
+    'BatchReport',
+]
@@ -0,0 +1,373 @@
+"""
+Command-line batch driver
+
+    maccrash-symbolizer crash_logs/ 'inbox/**/*.ips' -o symbolized/ --processes 4
+
+Inputs can be files, directories (walked recursively) or glob patterns. The
+version and architecture of each report are read from its header, with
+--version/--arch as fallbacks. Reports are symbolized in batches with
+Symbolizer.symbolize_many, optionally spread over several processes, and
+already symbolized inputs are skipped so an interrupted run can be resumed.
+With -f parquet the frames of all reports are exported instead, as Parquet parts of one
+directory (see analytics.FrameWriter); reports already in the directory are skipped.
+
+    maccrash-prefetch 45.10.0.32891 --arch arm64 --max-bandwidth 20
+
+downloads symbols ahead of time, see MacAutoSymbolizer.src.prefetcher.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from MacAutoSymbolizer.src.prefetcher import PrefetchTarget, SymbolPrefetcher
+from MacAutoSymbolizer.src.scanner import get_arch
+from MacAutoSymbolizer.src.signature import crash_signature
+from MacAutoSymbolizer.src.symbol_cache import SymbolCache
+from MacAutoSymbolizer.src.symbolizer import BatchReport, Symbolizer
+from MacAutoSymbolizer.src.utilities import (
+    max_cached_symbol_count,
+    max_downloaded_versions,
+    prefetch_archs,
+    prefetch_max_bandwidth_mb,
+    prefetch_versions,
+    prefetch_window,
+    version_search,
+)
+
+logger = logging.getLogger(__name__)
+
+CRASH_EXTENSIONS = ('.ips', '.crash', '.diag', '.spin')
+
+# version and architecture are in the first lines of every supported format
+HEADER_BYTES = 64 * 1024
+
+# output directory of -f parquet without -o
+FRAMES_DIR = 'symbolized_frames'
+
+
+@dataclass
+class CrashFile:
+    path: str
+    output: str
+    version: str | None = None
+    arch: str | None = None
+
+
+def _glob_base(pattern: str) -> str:
+    """Directory part of a glob pattern before the first wildcard"""
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or '.'
+
+
+def find_crash_files(inputs: list[str], extensions: tuple = CRASH_EXTENSIONS) -> list[tuple[str, str]]:
+    """
+    Expand files, directories and glob patterns into crash files.
+    :return: (path, name relative to the input it was found under), sorted and de-duplicated
+    """
+    found: dict[str, str] = {}
+
+    def add(path: str, rel: str):
+        if path.endswith(extensions) and os.path.isfile(path):
+            found.setdefault(os.path.abspath(path), rel)
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in files:
+                    path = os.path.join(root, name)
+                    add(path, os.path.relpath(path, item))
+        elif os.path.isfile(item):
+            add(item, os.path.basename(item))
+        else:
+            matches = glob.glob(item, recursive=True)
+            if not matches:
+                logger.warning(f'[{__name__}] no match for {item}')
+            base = _glob_base(item)
+            for path in matches:
+                add(path, os.path.relpath(path, base))
+    return sorted(found.items())
+
+
+def output_path(path: str, rel: str, output_dir: str | None, fmt: str) -> str:
+    """Next to the input by default, or under output_dir keeping the relative layout"""
+    suffix = f'.symbolized.{"json" if fmt == "json" else "txt"}'
+    if not output_dir:
+        return path + suffix
+    return os.path.join(output_dir, rel + suffix)
+
+
+def infer_report_info(path: str) -> tuple[str | None, str | None]:
+    """Read the app version and architecture from the report header"""
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_BYTES).decode('utf-8', errors='replace')
+
+    version = arch = None
+    if path.endswith('.ips'):
+        # first line is the metadata json, the body follows
+        meta_line, _, body = head.partition('\n')
+        try:
+            meta = json.loads(meta_line)
+            version = version_search(f"{meta.get('app_version', '')}.{meta.get('build_version', '')}")
+        except ValueError:
+            pass
+        if not version:
+            short = re.search(r'"CFBundleShortVersionString"\s*:\s*"([^"]+)"', body)
+            build = re.search(r'"CFBundleVersion"\s*:\s*"([^"]+)"', body)
+            if short and build:
+                version = version_search(f'{short.group(1)}.{build.group(1)}')
+        cpu_type = re.search(r'"cpuType"\s*:\s*"([^"]+)"', body)
+        if cpu_type:
+            arch = get_arch(cpu_type.group(1))
+
+    for line in head.splitlines():
+        key, _, value = line.strip().partition(':')
+        if not version and key in ('Version', 'App Version'):
+            version = version_search(value)
+        elif not arch and key in ('Code Type', 'Architecture'):
+            arch = get_arch(value)
+        if version and arch:
+            break
+    return version, arch.value if arch else None
+
+
+def format_text(blocks: list[list]) -> str:
+    return '\n'.join('\n'.join(['-' * 100] + [str(line) for line in block]) for block in blocks) + '\n'
+
+
+def format_json(crash: CrashFile, blocks: list[list]) -> str:
+    return json.dumps({
+        'input': crash.path,
+        'version': crash.version,
+        'arch': crash.arch,
+        'signature': str(crash_signature(blocks) or ''),
+        'blocks': [[str(line) for line in block] for block in blocks],
+    }, ensure_ascii=False, indent=1)
+
+
+def _write_atomic(path: str, content: str):
+    # the output only appears once complete, so resume never trusts a partial file
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+_symbolizer: Symbolizer | None = None
+
+
+def _get_symbolizer(max_concurrent: int) -> Symbolizer:
+    # one Symbolizer per process, reused for every batch it handles
+    # with [symbols] symbol_cache_path set, frames symbolized by earlier runs are not sent to atos again
+    global _symbolizer
+    if _symbolizer is None:
+        _symbolizer = Symbolizer(max_concurrent_symbolize=max_concurrent, symbol_cache=SymbolCache.from_config())
+    return _symbolizer
+
+
+def _configure_logging(level: str):
+    # importing the package configures no logging, the command line does
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger('MacAutoSymbolizer').setLevel(level.upper())
+
+
+def symbolize_batch(crash_files: list[CrashFile], fmt: str, max_concurrent: int) -> list[tuple[str, str | None]]:
+    """
+    Symbolize one batch and write its outputs. Runs in worker processes.
+    :return: (input path, error message or None) per file
+    """
+    symbolizer = _get_symbolizer(max_concurrent)
+    results = symbolizer.symbolize_many(
+        [BatchReport(x.path, x.version, x.arch) for x in crash_files],
+        return_exceptions=True
+    )
+    if fmt == 'parquet':
+        return export_batch(crash_files, results)
+
+    summary = []
+    for crash, blocks in zip(crash_files, results):
+        if isinstance(blocks, BaseException):
+            summary.append((crash.path, str(blocks) or type(blocks).__name__))
+            continue
+        try:
+            _write_atomic(crash.output, format_json(crash, blocks) if fmt == 'json' else format_text(blocks))
+            summary.append((crash.path, None))
+        except OSError as e:
+            summary.append((crash.path, str(e)))
+    return summary
+
+
+def export_batch(crash_files: list[CrashFile], results: list) -> list[tuple[str, str | None]]:
+    """Frames of one batch as one Parquet part in the output directory, keyed by input path"""
+    # polars, only for -f parquet
+    from MacAutoSymbolizer.src.analytics import FrameWriter
+
+    summary = []
+    done = []
+    for crash, blocks in zip(crash_files, results):
+        if isinstance(blocks, BaseException):
+            summary.append((crash.path, str(blocks) or type(blocks).__name__))
+        else:
+            done.append((crash, blocks))
+    if not done:
+        return summary
+    try:
+        with FrameWriter(done[0][0].output, batch_size=sys.maxsize) as writer:
+            for crash, blocks in done:
+                writer.add(crash.path, blocks, crash.version, crash.arch)
+        summary += [(crash.path, None) for crash, _ in done]
+    except OSError as e:
+        summary += [(crash.path, str(e)) for crash, _ in done]
+    return summary
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='maccrash-symbolizer',
+        description='Symbolize macOS crash reports (.ips/.crash/.diag/.spin) in bulk.'
+    )
+    parser.add_argument('inputs', nargs='+', help='crash files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir',
+                        help=f'write outputs here instead of next to the inputs (parquet: default {FRAMES_DIR})')
+    parser.add_argument('-f', '--format', choices=('text', 'json', 'parquet'), default='text',
+                        help='output format, parquet exports the frames of all reports to one directory')
+    parser.add_argument('--version', dest='app_version',
+                        help='app version for reports whose header has none')
+    parser.add_argument('--arch', choices=('arm64', 'x86_64'),
+                        help='architecture for reports whose header has none')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='worker processes, each with its own Symbolizer (default: 1)')
+    parser.add_argument('-t', '--threads', type=int, default=20,
+                        help='concurrent atos calls per process (default: 20)')
+    parser.add_argument('-b', '--batch-size', type=int, default=50,
+                        help='reports symbolized together, sharing downloads and atos calls (default: 50)')
+    parser.add_argument('--force', action='store_true',
+                        help='re-symbolize inputs that already have an output (parquet: adds their frames again)')
+    parser.add_argument('--log-level', default='WARNING', help='logging level (default: WARNING)')
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    _configure_logging(args.log_level)
+
+    parquet = args.format == 'parquet'
+    frames_dir = args.output_dir or FRAMES_DIR
+    exported = set()
+    if parquet and not args.force:
+        from MacAutoSymbolizer.src.analytics import exported_reports
+        exported = exported_reports(frames_dir)
+
+    crash_files = []
+    skipped = failed = 0
+    for path, rel in find_crash_files(args.inputs):
+        output = frames_dir if parquet else output_path(path, rel, args.output_dir, args.format)
+        if not args.force and (path in exported if parquet else os.path.exists(output)):
+            skipped += 1
+            continue
+        version, arch = infer_report_info(path)
+        version, arch = version or args.app_version, arch or args.arch
+        if not version or not arch:
+            print(f'FAILED {path}: cannot infer {"version" if not version else "architecture"}, '
+                  f'pass --version/--arch', file=sys.stderr)
+            failed += 1
+            continue
+        crash_files.append(CrashFile(path, output, version, arch))
+
+    total = len(crash_files)
+    print(f'{total} reports to symbolize, {skipped} already done', file=sys.stderr)
+    if not crash_files:
+        return 1 if failed else 0
+
+    # reports of one version land in the same batch, so they share downloads and atos calls
+    crash_files.sort(key=lambda x: (x.version, x.arch, x.path))
+    batch_size = max(args.batch_size, 1)
+    batches = [crash_files[i:i + batch_size] for i in range(0, total, batch_size)]
+
+    start = time.monotonic()
+    done = 0
+
+    def report(summary):
+        nonlocal done, failed
+        for path, error in summary:
+            done += 1
+            if error:
+                failed += 1
+                print(f'FAILED {path}: {error}', file=sys.stderr)
+        print(f'[{done}/{total}] {time.monotonic() - start:.1f}s', file=sys.stderr)
+
+    if args.processes <= 1:
+        for batch in batches:
+            report(symbolize_batch(batch, args.format, args.threads))
+    else:
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = {pool.submit(symbolize_batch, batch, args.format, args.threads): batch for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    report(future.result())
+                except Exception as e:  # noqa: BLE001 - a dead worker fails its batch, the others go on
+                    report([(x.path, f'worker failed: {e}') for x in futures[future]])
+
+    print(f'{done - failed} symbolized, {failed} failed, {skipped} skipped', file=sys.stderr)
+    return 1 if failed else 0
+
+
+def build_prefetch_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='maccrash-prefetch',
+        description='Download and extract symbols ahead of the first crash of a version.'
+    )
+    parser.add_argument('versions', nargs='*',
+                        help='versions to prefetch (default: [prefetch] versions in config.ini)')
+    parser.add_argument('--arch', action='append', choices=('arm64', 'x86_64'),
+                        help='architecture, repeatable (default: [prefetch] archs in config.ini)')
+    parser.add_argument('--backup', action='store_true', help='download from the backup symbol server')
+    parser.add_argument('--max-bandwidth', type=float, default=None,
+                        help='bandwidth cap in MB/s, 0 for none (default: [prefetch] max_bandwidth_mb)')
+    parser.add_argument('--off-peak', action='store_true',
+                        help='wait for the [prefetch] window of config.ini before each download')
+    parser.add_argument('--log-level', default='INFO', help='logging level (default: INFO)')
+    return parser
+
+
+def prefetch_main(argv: list[str] | None = None) -> int:
+    args = build_prefetch_parser().parse_args(argv)
+    _configure_logging(args.log_level)
+
+    versions = args.versions or prefetch_versions()
+    targets = [PrefetchTarget(v, a, args.backup) for v in versions for a in args.arch or prefetch_archs()]
+    if not targets:
+        print('no versions to prefetch, pass them or set [prefetch] versions', file=sys.stderr)
+        return 2
+
+    bandwidth = prefetch_max_bandwidth_mb() if args.max_bandwidth is None else args.max_bandwidth
+    prefetcher = SymbolPrefetcher(
+        Symbolizer(),
+        max_bytes_per_second=bandwidth * 1024 * 1024 if bandwidth > 0 else None,
+        window=prefetch_window() if args.off_peak else '',
+        cache_budget=max_cached_symbol_count(),
+        retention=max_downloaded_versions()
+    )
+    results = asyncio.run(prefetcher.prefetch(targets, wait_for_window=args.off_peak))
+    for target, ok in results.items():
+        print(f'{"OK" if ok else "FAILED"} {target.version} {target.arch}', file=sys.stderr)
+    print(f'{len(results)} prefetched, {len(targets) - len(results)} already cached or over budget', file=sys.stderr)
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
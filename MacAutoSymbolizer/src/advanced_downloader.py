@@ -4,21 +4,25 @@ Specially optimized for large file (.7z etc.) download experience
 """
 
 import asyncio
-import aiohttp
-import aiofiles
+import base64
 import hashlib
+import logging
 import os
 import time
-import base64
-
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Optional, Dict, List, Callable, Tuple
-from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING
+
 from tenacity import retry, stop_after_attempt, wait_exponential
-import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from MacAutoSymbolizer.src import metrics
+from MacAutoSymbolizer.src.resource_config import get_resource_config
+
+# aiohttp and aiofiles are imported when a download starts, most runs find the symbols cached
+if TYPE_CHECKING:
+    import aiohttp
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -49,7 +53,31 @@ class ChunkInfo:
     end: int
     size: int
     completed: bool = False
-    temp_file: Optional[str] = None
+    temp_file: str | None = None
+
+def _count_retry(retry_state):
+    metrics.inc('download_retries_total')
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by all chunks of one downloader, caps the total download rate
+    """
+
+    def __init__(self, max_bytes_per_second: float):
+        self.rate = max_bytes_per_second
+        # allow a burst of at most one second of traffic
+        self._tokens = max_bytes_per_second
+        self._updated = time.monotonic()
+
+    async def consume(self, size: int):
+        """Take size bytes from the bucket, sleeping until the rate allows them"""
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # reserve before sleeping, concurrent chunks queue up behind each other's debt
+        self._tokens -= size
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
 
 class AdvancedDownloader:
     def __init__(self,
@@ -57,9 +85,10 @@ class AdvancedDownloader:
                  max_concurrent_chunks: int = 8,
                  timeout: int = 300,
                  max_retries: int = 3,
-                 progress_callback: Optional[Callable[[DownloadProgress], None]] = None,
-                 headers: Optional[Dict[str, str]] = None,
-                 basic_token: Optional[str] = None):
+                 progress_callback: Callable[[DownloadProgress], None] | None = None,
+                 headers: dict[str, str] | None = None,
+                 basic_token: str | None = None,
+                 max_bytes_per_second: float | None = None):
         """
         Initialize downloader
 
@@ -71,56 +100,63 @@ class AdvancedDownloader:
             progress_callback: Progress callback function
             headers: Custom HTTP headers
             basic_token: Basic authentication token (encoded base64 string)
+            max_bytes_per_second: Bandwidth cap for the whole download, None means unlimited
         """
         self.chunk_size = chunk_size
         self.max_concurrent_chunks = max_concurrent_chunks
-        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.timeout = timeout
         self.max_retries = max_retries
         self.progress_callback = progress_callback
-        self.semaphore = asyncio.Semaphore(max_concurrent_chunks)
+        # starts at max_concurrent_chunks, backs off when chunks slow down or fail
+        self.semaphore = get_resource_config().download_limiter(max_concurrent_chunks)
+        self.rate_limiter = BandwidthLimiter(max_bytes_per_second) if max_bytes_per_second else None
 
         # Set request headers
         self.headers = headers or {}
         if basic_token:
             self.headers['Authorization'] = f'Basic {basic_token}'
 
-    async def get_file_info(self, url: str) -> Tuple[int, bool]:
+    def _session(self) -> 'aiohttp.ClientSession':
+        import aiohttp
+        return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout), headers=self.headers)
+
+    async def get_file_info(self, url: str) -> tuple[int, bool]:
         """
         Get file information
 
         Returns:
             (file_size, supports_range)
         """
-        async with aiohttp.ClientSession(timeout=self.timeout, headers=self.headers) as session:
-            async with session.head(url) as response:
-                if response.status == 401:
-                    raise aiohttp.ClientResponseError(
-                        request_info=response.request_info,
-                        history=response.history,
-                        status=401,
-                        message="HTTP 401: Unauthorized - Check your Basic token"
-                    )
-                if response.status == 404:
-                    raise aiohttp.ClientResponseError(
-                        request_info=response.request_info,
-                        history=response.history,
-                        status=404,
-                        message="HTTP 404: Could not find resource"
-                    )
-
-                response.raise_for_status()
-
-                # Get file size
-                content_length = response.headers.get('Content-Length')
-                file_size = int(content_length) if content_length else 0
-
-                # Check if range requests are supported
-                accept_ranges = response.headers.get('Accept-Ranges', '').lower()
-                supports_range = accept_ranges == 'bytes'
-
-                return file_size, supports_range
-
-    def _create_chunks(self, file_size: int) -> List[ChunkInfo]:
+        import aiohttp
+        async with self._session() as session, session.head(url) as response:
+            if response.status == 401:
+                raise aiohttp.ClientResponseError(
+                    request_info=response.request_info,
+                    history=response.history,
+                    status=401,
+                    message="HTTP 401: Unauthorized - Check your Basic token"
+                )
+            if response.status == 404:
+                raise aiohttp.ClientResponseError(
+                    request_info=response.request_info,
+                    history=response.history,
+                    status=404,
+                    message="HTTP 404: Could not find resource"
+                )
+
+            response.raise_for_status()
+
+            # Get file size
+            content_length = response.headers.get('Content-Length')
+            file_size = int(content_length) if content_length else 0
+
+            # Check if range requests are supported
+            accept_ranges = response.headers.get('Accept-Ranges', '').lower()
+            supports_range = accept_ranges == 'bytes'
+
+            return file_size, supports_range
+
+    def _create_chunks(self, file_size: int) -> list[ChunkInfo]:
         """Create download chunks"""
         chunks = []
         for i in range(0, file_size, self.chunk_size):
@@ -138,29 +174,47 @@ class AdvancedDownloader:
 
         return chunks
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def _download_chunk(self, session: aiohttp.ClientSession, url: str,
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10), before_sleep=_count_retry)
+    async def _download_chunk(self, session: 'aiohttp.ClientSession', url: str,
                             chunk: ChunkInfo, temp_dir: str) -> ChunkInfo:
         """Download a single chunk"""
         async with self.semaphore:
-            chunk.temp_file = os.path.join(temp_dir, f"chunk_{chunk.index:06d}.tmp")
-
-            # Merge Range header and Authorization header
-            request_headers = self.headers.copy()
-            request_headers['Range'] = f'bytes={chunk.start}-{chunk.end}'
-
-            async with session.get(url, headers=request_headers) as response:
-                if response.status not in (206, 200):  # 206 Partial Content or 200 OK
-                    raise aiohttp.ClientError(f"HTTP {response.status}")
-
-                async with aiofiles.open(chunk.temp_file, 'wb') as f:
-                    async for data in response.content.iter_chunked(8192):
-                        await f.write(data)
-
-                chunk.completed = True
-                return chunk
-
-    def _merge_chunks(self, chunks: List[ChunkInfo], output_file: str):
+            start = time.perf_counter()
+            try:
+                chunk = await self._fetch_chunk(session, url, chunk, temp_dir)
+            except Exception as e:
+                self.semaphore.record(time.perf_counter() - start, e)
+                raise
+            # seconds per full chunk, the last chunk is usually shorter
+            self.semaphore.record((time.perf_counter() - start) * self.chunk_size / max(chunk.size, 1))
+            return chunk
+
+    async def _fetch_chunk(self, session: 'aiohttp.ClientSession', url: str,
+                           chunk: ChunkInfo, temp_dir: str) -> ChunkInfo:
+        """One Range request, written to its own temp file"""
+        import aiofiles
+        import aiohttp
+        chunk.temp_file = os.path.join(temp_dir, f"chunk_{chunk.index:06d}.tmp")
+
+        # Merge Range header and Authorization header
+        request_headers = self.headers.copy()
+        request_headers['Range'] = f'bytes={chunk.start}-{chunk.end}'
+
+        async with session.get(url, headers=request_headers) as response:
+            if response.status not in (206, 200):  # 206 Partial Content or 200 OK
+                raise aiohttp.ClientError(f"HTTP {response.status}")
+
+            async with aiofiles.open(chunk.temp_file, 'wb') as f:
+                async for data in response.content.iter_chunked(8192):
+                    if self.rate_limiter:
+                        await self.rate_limiter.consume(len(data))
+                    await f.write(data)
+
+            chunk.completed = True
+            metrics.inc('download_bytes_total', chunk.size)
+            return chunk
+
+    def _merge_chunks(self, chunks: list[ChunkInfo], output_file: str):
         """Merge chunk files"""
         logger.info(f"Merging {len(chunks)} chunks...")
 
@@ -183,7 +237,7 @@ class AdvancedDownloader:
             except OSError:
                 pass
 
-    def _calculate_speed_and_eta(self, downloaded: int, total: int, elapsed: float) -> Tuple[float, float]:
+    def _calculate_speed_and_eta(self, downloaded: int, total: int, elapsed: float) -> tuple[float, float]:
         """Calculate download speed and estimated time remaining"""
         if elapsed == 0:
             return 0.0, 0.0
@@ -251,7 +305,7 @@ class AdvancedDownloader:
             logger.info(f"Starting download of {len(chunks)} chunks...")
 
             # Download chunks
-            async with aiohttp.ClientSession(timeout=self.timeout, headers=self.headers) as session:
+            async with self._session() as session:
                 # Create download tasks
                 tasks = []
                 for chunk in chunks:
@@ -292,31 +346,47 @@ class AdvancedDownloader:
             # Clean up temp files
             self._cleanup_temp_files(temp_dir)
 
+            self._observe_download(file_size, time.time() - progress.start_time)
             logger.info(f"Download completed: {filepath}")
             return True
 
         except Exception as e:
+            metrics.inc('download_failures_total')
             logger.error(f"Download failed: {e}")
             return False
 
     async def _simple_download(self, url: str, filepath: str) -> bool:
         """Simple download mode (no chunking)"""
+        import aiofiles
+        start_time = time.time()
+        size = 0
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout, headers=self.headers) as session:
-                async with session.get(url) as response:
-                    response.raise_for_status()
+            async with self._session() as session, session.get(url) as response:
+                response.raise_for_status()
 
-                    async with aiofiles.open(filepath, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            await f.write(chunk)
+                async with aiofiles.open(filepath, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(8192):
+                        if self.rate_limiter:
+                            await self.rate_limiter.consume(len(chunk))
+                        await f.write(chunk)
+                        size += len(chunk)
 
+            metrics.inc('download_bytes_total', size)
+            self._observe_download(size, time.time() - start_time)
             logger.info(f"Simple download completed: {filepath}")
             return True
 
         except Exception as e:
+            metrics.inc('download_failures_total')
             logger.error(f"Simple download failed: {e}")
             return False
 
+    @staticmethod
+    def _observe_download(size: int, elapsed: float):
+        metrics.observe('download_seconds', elapsed)
+        if elapsed > 0:
+            metrics.observe('download_throughput_bytes_per_second', size / elapsed)
+
     @staticmethod
     def _format_size(size_bytes: float) -> str:
         """Format file size"""
@@ -0,0 +1,300 @@
+"""
+Corpus-level frame statistics
+Symbolized frames of many reports in one polars DataFrame, one row per frame (FRAME_SCHEMA).
+`function` is normalized with signature.normalize_symbol, so a function groups together
+across builds. Every statistic takes a DataFrame or a LazyFrame, e.g. scan_frames over
+Parquet files, and runs on the streaming engine, so the corpus does not have to fit in memory.
+
+FrameWriter exports frames in batches as a directory of Parquet or Arrow IPC parts. Images,
+functions, versions and archs are Categorical, i.e. dictionary-encoded in the files.
+"""
+
+import glob
+import logging
+import os
+import time
+from collections.abc import Iterable
+
+import polars as pl
+
+from MacAutoSymbolizer.src.scanner import CrashScanner, DiagLine, RawLine, TheadLine
+from MacAutoSymbolizer.src.signature import normalize_symbol
+from MacAutoSymbolizer.src.word_frequency import KEYWORDS, TOKEN_PATTERN
+
+logger = logging.getLogger(__name__)
+
+FRAME_SCHEMA = {
+    'report_id': pl.String,
+    'thread': pl.Int32,      # thread number, the block index for blocks without a thread line
+    'crashed': pl.Boolean,
+    'frame_idx': pl.Int32,   # 0 is the top of the stack
+    'image': pl.Categorical(),
+    'address': pl.String,
+    'function': pl.Categorical(),  # normalized, '?' when unsymbolized
+    'symbol': pl.String,     # atos output with file and line, '' when unsymbolized
+    'version': pl.Categorical(),
+    'arch': pl.Categorical(),
+}
+
+FRAME_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+Frames = pl.DataFrame | pl.LazyFrame
+
+
+def _empty_columns() -> dict[str, list]:
+    return {name: [] for name in FRAME_SCHEMA}
+
+
+def _append_frames(columns: dict[str, list], report_id: str, stack_blocks: list[list],
+                   version: str, arch: str) -> int:
+    count = 0
+    for block_idx, block in enumerate(stack_blocks):
+        head = block[0] if block else None
+        thread = head.threadIdx if isinstance(head, TheadLine) else block_idx
+        crashed = isinstance(head, TheadLine) and head.crashed
+        frame_idx = 0
+        for line in block:
+            if not isinstance(line, (RawLine, DiagLine)):
+                continue
+            symbol = str(line.symbolizedRes) if line.isSymbolized else ''
+            columns['report_id'].append(report_id)
+            columns['thread'].append(thread)
+            columns['crashed'].append(crashed)
+            columns['frame_idx'].append(frame_idx)
+            columns['image'].append(line.binary.name if line.binary else '')
+            columns['address'].append(line.addressesToSymbolicate or '')
+            columns['function'].append(normalize_symbol(symbol))
+            columns['symbol'].append(symbol)
+            columns['version'].append(version)
+            columns['arch'].append(arch)
+            frame_idx += 1
+        count += frame_idx
+    return count
+
+
+def frames_dataframe(reports: Iterable[tuple[str, list[list], str, str]]) -> pl.DataFrame:
+    """
+    :param reports: (report id, thread blocks from the Symbolizer, version, arch)
+    """
+    columns = _empty_columns()
+    for report_id, stack_blocks, version, arch in reports:
+        _append_frames(columns, report_id, stack_blocks, version, arch)
+    return pl.DataFrame(columns, schema=FRAME_SCHEMA)
+
+
+def frames_from_outputs(outputs: Iterable[tuple[str, str, str, str]]) -> pl.DataFrame:
+    """
+    frames_dataframe of symbolized text outputs, e.g. the web result cache or the batch CLI
+    :param outputs: (report id, output, version, arch)
+    """
+    scanner = CrashScanner()
+
+    def reports():
+        for report_id, output, version, arch in outputs:
+            scan_res = scanner.scan_crash(output)
+            if scan_res:
+                yield report_id, scan_res.stack_blocks, version, arch
+
+    return frames_dataframe(reports())
+
+
+def write_frames(frames: Frames, path: str):
+    """Write frames to one file, Arrow IPC for .arrow paths and Parquet otherwise"""
+    lazy = isinstance(frames, pl.LazyFrame)
+    if path.endswith(FRAME_FORMATS['arrow']):
+        frames.sink_ipc(path) if lazy else frames.write_ipc(path)
+    elif lazy:
+        frames.sink_parquet(path)
+    else:
+        frames.write_parquet(path)
+
+
+def scan_frames(source: str | list[str]) -> pl.LazyFrame:
+    """
+    Lazily read frames from Parquet or Arrow IPC files, globs allowed
+    :param source: files, globs or a FrameWriter directory
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        source = frame_parts(source)
+    first = source if isinstance(source, str) else (source[0] if source else '')
+    if first.endswith(FRAME_FORMATS['arrow']):
+        return pl.scan_ipc(source)
+    return pl.scan_parquet(source)
+
+
+def frame_parts(path: str) -> list[str]:
+    """Part files of a FrameWriter directory"""
+    return sorted(x for ext in FRAME_FORMATS.values() for x in glob.glob(os.path.join(path, f'part-*{ext}')))
+
+
+def exported_reports(path: str) -> set[str]:
+    """Ids of the reports already in a FrameWriter directory, only the report_id column is read"""
+    if not frame_parts(path):
+        return set()
+    ids = _collect(scan_frames(path).select(pl.col('report_id').unique()))
+    return set(ids['report_id'].to_list())
+
+
+class FrameWriter:
+    """
+    Export the frames of symbolized reports in batches: every batch_size frames become one part
+    file in the directory path, written to a temporary name and renamed once complete, so
+    memory stays bounded and several processes can write to the same directory.
+
+        with FrameWriter('frames/') as writer:
+            writer.add(report_id, symbolizer.symbolize(path, version, arch), version, arch)
+        scan_frames('frames/')
+
+    :param path: output directory
+    :param batch_size: frames per part file
+    :param fmt: 'parquet' or 'arrow' (Arrow IPC)
+    """
+
+    def __init__(self, path: str, batch_size: int = 500_000, fmt: str = 'parquet'):
+        if fmt not in FRAME_FORMATS:
+            raise ValueError(f'Unknown frame format {fmt}, expected one of {list(FRAME_FORMATS)}')
+        self.path = path
+        self.batch_size = max(batch_size, 1)
+        self.fmt = fmt
+        self.parts: list[str] = []
+        self.frame_count = 0
+        self._columns = _empty_columns()
+        self._buffered = 0
+        os.makedirs(path, exist_ok=True)
+
+    def add(self, report_id: str, stack_blocks: list[list], version: str, arch: str) -> int:
+        """
+        :param stack_blocks: thread blocks returned by the Symbolizer
+        :return: number of frames added
+        """
+        count = _append_frames(self._columns, report_id, stack_blocks, version, arch)
+        self._buffered += count
+        self.frame_count += count
+        if self._buffered >= self.batch_size:
+            self.flush()
+        return count
+
+    def flush(self) -> str | None:
+        """Write the buffered frames as a new part, returns its path"""
+        if not self._buffered:
+            return None
+        frames = pl.DataFrame(self._columns, schema=FRAME_SCHEMA)
+        self._columns = _empty_columns()
+        self._buffered = 0
+
+        name = f'part-{os.getpid()}-{time.time_ns()}-{len(self.parts):05d}{FRAME_FORMATS[self.fmt]}'
+        part = os.path.join(self.path, name)
+        tmp_path = os.path.join(self.path, f'.tmp-{name}')
+        write_frames(frames, tmp_path)
+        os.replace(tmp_path, part)
+        self.parts.append(part)
+        logger.info(f'[{__name__}] wrote {frames.height} frames to {part}')
+        return part
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # frames added before an error are still exported
+        self.close()
+
+
+def _collect(frames: pl.LazyFrame) -> pl.DataFrame:
+    return frames.collect(engine='streaming')
+
+
+def _select(frames: Frames, crashed_only: bool, top_frames: int | None) -> pl.LazyFrame:
+    frames = frames.lazy()
+    if crashed_only:
+        frames = frames.filter(pl.col('crashed'))
+    if top_frames:
+        frames = frames.filter(pl.col('frame_idx') < top_frames)
+    return frames
+
+
+def _top(frames: pl.LazyFrame, column: str, n: int, by: list[str]) -> pl.DataFrame:
+    counted = frames.group_by(*by, column).agg(
+        pl.col('report_id').n_unique().alias('reports'),
+        pl.len().alias('frames'),
+    )
+    # ties go to the value with more frames, then alphabetically, so results are stable
+    rank = pl.int_range(pl.len(), dtype=pl.UInt32) + 1
+    ranked = counted.sort('reports', 'frames', column, descending=[True, True, False]).with_columns(
+        (rank.over(by) if by else rank).alias('rank')
+    )
+    return _collect(ranked.filter(pl.col('rank') <= n).sort(*by, 'rank'))
+
+
+def top_functions(frames: Frames, n: int = 10, by: list[str] | None = None,
+                  crashed_only: bool = True, top_frames: int | None = None) -> pl.DataFrame:
+    """
+    Functions in the most reports
+    :param by: group columns, ['version'] by default, [] for the whole corpus
+    :param crashed_only: only frames of crashed threads
+    :param top_frames: only the top frames of each thread
+    :return: by..., function, reports, frames, rank
+    """
+    by = ['version'] if by is None else by
+    selected = _select(frames, crashed_only, top_frames).filter(pl.col('function') != '?')
+    return _top(selected, 'function', n, by)
+
+
+def top_images(frames: Frames, n: int = 10, by: list[str] | None = None,
+               crashed_only: bool = True, top_frames: int | None = None) -> pl.DataFrame:
+    """Like top_functions, for images"""
+    by = ['version'] if by is None else by
+    return _top(_select(frames, crashed_only, top_frames), 'image', n, by)
+
+
+def top_words(frames: Frames, n: int = 10, by: list[str] | None = None,
+              crashed_only: bool = True, top_frames: int | None = None) -> pl.DataFrame:
+    """WordFrequency over a corpus: identifiers of the symbolized functions, tokenized in polars"""
+    by = ['version'] if by is None else by
+    words = (
+        _select(frames, crashed_only, top_frames)
+        .with_columns(pl.col('function').cast(pl.String).str.to_lowercase().str.extract_all(TOKEN_PATTERN).alias('word'))
+        .explode('word')
+        .filter(pl.col('word').is_not_null() & (pl.col('word').str.len_chars() > 1)
+                & ~pl.col('word').is_in(list(KEYWORDS)))
+    )
+    return _top(words, 'word', n, by)
+
+
+def crash_rates(frames: Frames, column: str = 'function', top_frames: int = 1) -> pl.DataFrame:
+    """
+    Share of the reports of each version whose crashed thread has the value in its top frames
+    :param column: 'function' or 'image'
+    :return: version, column, reports, total, rate
+    """
+    frames = frames.lazy()
+    totals = frames.group_by('version').agg(pl.col('report_id').n_unique().alias('total'))
+    hits = (
+        _select(frames, True, top_frames)
+        .group_by('version', column)
+        .agg(pl.col('report_id').n_unique().alias('reports'))
+    )
+    rates = hits.join(totals, on='version').with_columns((pl.col('reports') / pl.col('total')).alias('rate'))
+    return _collect(rates.sort('version', 'rate', column, descending=[False, True, False]))
+
+
+def crash_rate_deltas(frames: Frames, base: str, target: str, column: str = 'function',
+                      top_frames: int = 1) -> pl.DataFrame:
+    """
+    How the crash rates changed from version base to version target, regressions first
+    :return: column, base_rate, target_rate, delta
+    """
+    rates = crash_rates(frames.lazy().filter(pl.col('version').is_in([base, target])), column, top_frames)
+
+    def rate_of(version: str, name: str) -> pl.DataFrame:
+        return rates.filter(pl.col('version') == version).select(column, pl.col('rate').alias(name))
+
+    return (
+        rate_of(base, 'base_rate')
+        .join(rate_of(target, 'target_rate'), on=column, how='full', coalesce=True)
+        .fill_null(0.0)
+        .with_columns((pl.col('target_rate') - pl.col('base_rate')).alias('delta'))
+        .sort('delta', column, descending=[True, False])
+    )
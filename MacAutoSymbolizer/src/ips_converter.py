@@ -8,21 +8,139 @@ including proper formatting, spacing, and symbol information.
 """
 
 import json
-import re
-from typing import Dict, List, Optional, Union, Any
+from dataclasses import dataclass, field, fields
+from typing import Any
+
 from MacAutoSymbolizer.src.utilities import safe_read_file
 
+# Optional fast decoders, stdlib json is the fallback
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKENDS = ('msgspec', 'orjson', 'json')
+
+
+def default_json_backend() -> str:
+    """Pick the fastest installed JSON decoder"""
+    if msgspec is not None:
+        return 'msgspec'
+    if orjson is not None:
+        return 'orjson'
+    return 'json'
+
+
+@dataclass(slots=True)
+class IPSImage:
+    """An entry of ``usedImages``"""
+    base: int = 0
+    size: int = 0
+    arch: str = ''
+    uuid: str = ''
+    name: str = ''
+    path: str = ''
+    CFBundleIdentifier: str | None = None
+    CFBundleShortVersionString: str | None = None
+    CFBundleVersion: str | None = None
+
+
+@dataclass(slots=True)
+class IPSFrame:
+    """A stack frame of a thread"""
+    imageIndex: int | None = None
+    imageOffset: int = 0
+    symbol: str = ''
+    symbolLocation: int = 0
+
+
+_IMAGE_FIELDS = frozenset(x.name for x in fields(IPSImage))
+_FRAME_FIELDS = frozenset(x.name for x in fields(IPSFrame))
+
+
+def _image_from_dict(image: dict[str, Any]) -> IPSImage:
+    return IPSImage(**{k: v for k, v in image.items() if k in _IMAGE_FIELDS})
+
+
+def _frame_from_dict(frame: dict[str, Any]) -> IPSFrame:
+    return IPSFrame(**{k: v for k, v in frame.items() if k in _FRAME_FIELDS})
+
+
+class IPSThread:
+    """
+    A thread of the report whose frames are decoded on first access.
+
+    With msgspec the thread fields are kept as raw JSON until they are read,
+    with the other backends the frame dicts are turned into IPSFrame lazily.
+    """
+    __slots__ = ('_fields', '_frames')
+
+    def __init__(self, thread_fields: dict[str, Any]):
+        self._fields = thread_fields
+        self._frames: list[IPSFrame] | None = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._fields.get(key, default)
+        if msgspec is not None and isinstance(value, msgspec.Raw):
+            value = msgspec.json.decode(value)
+            self._fields[key] = value
+        return value
+
+    @property
+    def decoded(self) -> bool:
+        return self._frames is not None
+
+    @property
+    def frames(self) -> list[IPSFrame]:
+        if self._frames is None:
+            raw_frames = self._fields.pop('frames', None)
+            if raw_frames is None:
+                self._frames = []
+            elif msgspec is not None and isinstance(raw_frames, msgspec.Raw):
+                try:
+                    self._frames = msgspec.json.decode(raw_frames, type=list[IPSFrame])
+                except msgspec.ValidationError:
+                    self._frames = [_frame_from_dict(x) for x in msgspec.json.decode(raw_frames)]
+            else:
+                self._frames = [_frame_from_dict(x) for x in raw_frames]
+        return self._frames
+
+
+@dataclass
+class IPSReport:
+    """A loaded .ips document, the per-report state of IPSConverter"""
+    data: dict[str, Any] = field(default_factory=dict)
+    used_images: list[IPSImage] = field(default_factory=list)
+    threads: list[IPSThread] = field(default_factory=list)
+
 
 class IPSConverter:
-    """Advanced IPS file converter that produces Mac Console-compatible output"""
+    """
+    Advanced IPS file converter that produces Mac Console-compatible output.
+
+    The converter keeps no per-report state, every loaded document lives in
+    its own IPSReport, so one instance can be shared between threads.
+    """
     
-    def __init__(self):
-        self.data: Dict[str, Any] = {}
-        self.used_images: List[Dict[str, Any]] = []
-        self.threads: List[Dict[str, Any]] = []
-        
-    def convert(self, ips_content: Optional[str] = None, 
-                json_file_path: Optional[str] = None) -> str:
+    def __init__(self, json_backend: str | None = None):
+        """
+        Args:
+            json_backend: 'msgspec', 'orjson' or 'json', defaults to the fastest installed one
+        """
+        self.json_backend = json_backend or default_json_backend()
+        if self.json_backend not in JSON_BACKENDS:
+            raise ValueError(f"Unsupported JSON backend: {self.json_backend}")
+        if self.json_backend == 'msgspec' and msgspec is None \
+                or self.json_backend == 'orjson' and orjson is None:
+            raise ValueError(f"JSON backend {self.json_backend} is not installed")
+        
+    def convert(self, ips_content: str | None = None, 
+                json_file_path: str | None = None) -> str:
         """
         Convert IPS JSON to Mac Console format
         
@@ -33,22 +151,37 @@ class IPSConverter:
         Returns:
             Formatted crash report text
         """
-        self._load_data(ips_content, json_file_path)
-        return self._format_report()
+        return self._format_report(self.load(ips_content, json_file_path))
+
+    def load(self, ips_content: str | None = None,
+             json_file_path: str | None = None) -> IPSReport:
+        """
+        Load IPS JSON without rendering it, for callers that work on the
+        structured ``usedImages``/``threads`` data directly.
+        Thread frames stay undecoded until ``IPSThread.frames`` is read.
+
+        Args:
+            ips_content: Raw IPS file content as string
+            json_file_path: Path to IPS JSON file
+
+        Returns:
+            The decoded IPSReport
+        """
+        return self._load_data(ips_content, json_file_path)
     
-    def _load_data(self, ips_content: Optional[str], json_file_path: Optional[str]):
+    def _load_data(self, ips_content: str | None, json_file_path: str | None) -> IPSReport:
         """Load and parse IPS data"""
         json_content = None
         
         if json_file_path:
             # 使用安全读取文件
             file_content = safe_read_file(json_file_path)
-            lines = file_content.splitlines()
+            first_line, _, rest = file_content.partition('\n')
             
             # 检查第一行是否包含元数据
-            if lines and lines[0].strip().startswith('{"app_name"'):
+            if first_line.strip().startswith('{"app_name"'):
                 # 第一行是元数据，从第二行开始是实际JSON
-                json_content = '\n'.join(lines[1:])
+                json_content = rest
             else:
                 # 整个文件都是JSON内容
                 json_content = file_content
@@ -66,47 +199,74 @@ class IPSConverter:
             raise ValueError("No JSON content found")
             
         try:
-            self.data = json.loads(json_content)
-            self.used_images = self.data.get('usedImages', [])
-            self.threads = self.data.get('threads', [])
-        except json.JSONDecodeError as e:
+            if self.json_backend == 'msgspec':
+                return self._decode_msgspec(json_content)
+            return self._decode_eager(json_content)
+        except ValueError as e:
+            # json/orjson decode errors and msgspec.DecodeError are all ValueErrors
             raise ValueError(f"Invalid JSON format: {e}")
+
+    def _decode_msgspec(self, json_content: str) -> IPSReport:
+        """Decode only the top level, images are typed and thread fields stay raw"""
+        document = msgspec.json.decode(json_content, type=dict[str, msgspec.Raw])
+        raw_images = document.pop('usedImages', None)
+        raw_threads = document.pop('threads', None)
+        report = IPSReport(data={key: msgspec.json.decode(value) for key, value in document.items()})
+        try:
+            report.used_images = msgspec.json.decode(raw_images, type=list[IPSImage]) if raw_images else []
+        except msgspec.ValidationError:
+            report.used_images = [_image_from_dict(x) for x in msgspec.json.decode(raw_images)]
+        report.threads = [
+            IPSThread(x)
+            for x in msgspec.json.decode(raw_threads, type=list[dict[str, msgspec.Raw]])
+        ] if raw_threads else []
+        return report
+
+    def _decode_eager(self, json_content: str) -> IPSReport:
+        """Decode the whole document with orjson or json, frames are typed lazily"""
+        loads = orjson.loads if self.json_backend == 'orjson' else json.loads
+        data = loads(json_content)
+        return IPSReport(
+            data=data,
+            used_images=[_image_from_dict(x) for x in data.pop('usedImages', None) or []],
+            threads=[IPSThread(x) for x in data.pop('threads', None) or []]
+        )
     
-    def _format_report(self) -> str:
+    def _format_report(self, report: IPSReport) -> str:
         """Format the complete crash report"""
         sections = []
         
         # Header section
-        sections.append(self._format_header())
+        sections.append(self._format_header(report))
         
         # Exception information
-        exception_info = self._format_exception()
+        exception_info = self._format_exception(report)
         if exception_info:
             sections.append(exception_info + "\n")
         
         # Application specific information
-        app_info = self._format_application_specific_info()
+        app_info = self._format_application_specific_info(report)
         if app_info:
             sections.append(app_info + "\n")
         
         # Application Specific Backtrace
-        asi_backtraces = self._format_asi_backtraces()
+        asi_backtraces = self._format_asi_backtraces(report)
         if asi_backtraces:
             sections.append(asi_backtraces)
         
         # Thread information
-        thread_info = self._format_threads()
+        thread_info = self._format_threads(report)
         if thread_info:
             sections.append(thread_info)
         
         # Binary images
-        binary_info = self._format_binary_images()
+        binary_info = self._format_binary_images(report)
         if binary_info:
             sections.append(binary_info)
         
         return '\n\n'.join(sections) + '\n'
     
-    def _format_header(self) -> str:
+    def _format_header(self, report: IPSReport) -> str:
         """Format the crash report header exactly like Mac Console"""
         lines = []
         
@@ -119,16 +279,16 @@ class IPSConverter:
         ])
         
         # Process information
-        proc_name = self.data.get('procName', 'Unknown')
-        pid = self.data.get('pid', 'Unknown')
+        proc_name = report.data.get('procName', 'Unknown')
+        pid = report.data.get('pid', 'Unknown')
         lines.append(f"Process:               {proc_name} [{pid}]")
         
-        proc_path = self.data.get('procPath', '')
+        proc_path = report.data.get('procPath', '')
         if proc_path:
             lines.append(f"Path:                  {proc_path}")
         
         # Bundle information
-        bundle_info = self.data.get('bundleInfo', {})
+        bundle_info = report.data.get('bundleInfo', {})
         if bundle_info:
             bundle_id = bundle_info.get('CFBundleIdentifier', '')
             if bundle_id:
@@ -140,32 +300,32 @@ class IPSConverter:
                 lines.append(f"Version:               {version} ({build})")
         
         # Code type - add "(Native)" for ARM-64
-        cpu_type = self.data.get('cpuType', '')
+        cpu_type = report.data.get('cpuType', '')
         if cpu_type:
             if cpu_type == 'ARM-64':
                 cpu_type = 'ARM-64 (Native)'
             lines.append(f"Code Type:             {cpu_type}")
         
         # Parent process
-        parent_proc = self.data.get('parentProc', '')
-        parent_pid = self.data.get('parentPid', '')
+        parent_proc = report.data.get('parentProc', '')
+        parent_pid = report.data.get('parentPid', '')
         if parent_proc and parent_pid:
             lines.append(f"Parent Process:        {parent_proc} [{parent_pid}]")
         
         # User ID
-        user_id = self.data.get('userID', '')
+        user_id = report.data.get('userID', '')
         if user_id:
             lines.append(f"User ID:               {user_id}")
         
         lines.append("")
         
         # Date/Time
-        capture_time = self.data.get('captureTime', '')
+        capture_time = report.data.get('captureTime', '')
         if capture_time:
             lines.append(f"Date/Time:             {capture_time}")
         
         # OS Version
-        os_version = self.data.get('osVersion', {})
+        os_version = report.data.get('osVersion', {})
         if os_version:
             train = os_version.get('train', '')
             build = os_version.get('build', '')
@@ -175,14 +335,14 @@ class IPSConverter:
         lines.append("Report Version:        12")
         
         # Anonymous UUID (this is the incident ID)
-        incident = self.data.get('incident', '')
+        incident = report.data.get('incident', '')
         if incident:
             lines.append(f"Anonymous UUID:        {incident}")
         
         lines.append("")
         
         # Sleep/Wake UUID
-        sleep_wake_uuid = self.data.get('sleepWakeUUID', '')
+        sleep_wake_uuid = report.data.get('sleepWakeUUID', '')
         if sleep_wake_uuid:
             lines.append(f"Sleep/Wake UUID:       {sleep_wake_uuid}")
             lines.append("")
@@ -190,8 +350,8 @@ class IPSConverter:
             lines.append("")
         
         # Time information
-        uptime = self.data.get('uptime', '')
-        wake_time = self.data.get('wakeTime', '')
+        uptime = report.data.get('uptime', '')
+        wake_time = report.data.get('wakeTime', '')
         if uptime:
             lines.append(f"Time Awake Since Boot: {uptime} seconds")
         if wake_time:
@@ -200,19 +360,19 @@ class IPSConverter:
         lines.append("")
         
         # System Integrity Protection
-        sip_enabled = self.data.get('sip', 'enabled')  # Default to enabled
+        sip_enabled = report.data.get('sip', 'enabled')  # Default to enabled
         lines.append(f"System Integrity Protection: {sip_enabled}")
         lines.append("")
         
         # Crashed thread information
-        faulting_thread = self.data.get('faultingThread')
+        faulting_thread = report.data.get('faultingThread')
         if faulting_thread is not None:
             # Find the crashed thread to get its name and queue
             crashed_thread_name = ""
             crashed_thread_queue = ""
             
-            if faulting_thread < len(self.threads):
-                thread = self.threads[faulting_thread]
+            if faulting_thread < len(report.threads):
+                thread = report.threads[faulting_thread]
                 crashed_thread_name = thread.get('name', '')
                 crashed_thread_queue = thread.get('queue', '')
             
@@ -226,9 +386,9 @@ class IPSConverter:
         
         return '\n'.join(lines)
     
-    def _format_exception(self) -> str:
+    def _format_exception(self, report: IPSReport) -> str:
         """Format exception information exactly like Mac Console"""
-        exception_data = self.data.get('exception', {})
+        exception_data = report.data.get('exception', {})
         if not exception_data:
             return ""
         
@@ -249,7 +409,7 @@ class IPSConverter:
             lines.append(f"Exception Codes:       {codes}")
         
         # Termination information
-        termination = self.data.get('termination', {})
+        termination = report.data.get('termination', {})
         if termination:
             namespace = termination.get('namespace', '')
             code = termination.get('code', '')
@@ -265,10 +425,10 @@ class IPSConverter:
         
         return '\n'.join(lines)
     
-    def _format_application_specific_info(self) -> str:
+    def _format_application_specific_info(self, report: IPSReport) -> str:
         """Format application specific information"""
         # Look for termination reason or other app-specific info
-        termination = self.data.get('termination', {})
+        termination = report.data.get('termination', {})
         if termination:
             namespace = termination.get('namespace', '')
             code = termination.get('code', '')
@@ -277,22 +437,22 @@ class IPSConverter:
                 return "Application Specific Information:\nabort() called"
         
         # Check exception for SIGABRT signal
-        exception = self.data.get('exception', {})
+        exception = report.data.get('exception', {})
         if exception:
             signal = exception.get('signal', '')
             if signal == 'SIGABRT':
                 return "Application Specific Information:\nabort() called"
         
         # Check for other application specific info
-        app_specific = self.data.get('applicationSpecificInformation', '')
+        app_specific = report.data.get('applicationSpecificInformation', '')
         if app_specific:
             return f"Application Specific Information:\n{app_specific}"
         
         return ""
     
-    def _format_asi_backtraces(self) -> str:
+    def _format_asi_backtraces(self, report: IPSReport) -> str:
         """Format Application Specific Backtrace information"""
-        asi_backtraces = self.data.get('asiBacktraces', [])
+        asi_backtraces = report.data.get('asiBacktraces', [])
         if not asi_backtraces:
             return ""
         
@@ -309,65 +469,67 @@ class IPSConverter:
         
         return '\n'.join(lines)
     
-    def _format_threads(self) -> str:
+    def _format_threads(self, report: IPSReport) -> str:
         """Format thread information exactly like Mac Console"""
-        if not self.threads:
+        if not report.threads:
             return ""
         
         formatted_threads = []
-        faulting_thread = self.data.get('faultingThread')
         
-        for thread_idx, thread in enumerate(self.threads):
-            thread_lines = []
-            
-            # Thread header
-            thread_header = f"Thread {thread_idx}"
-            
-            # Check if this is the crashed thread
-            if thread_idx == faulting_thread:
-                thread_header += " Crashed"
-            
-            # Add thread name if available
-            thread_name = thread.get('name', '')
-            if thread_name:
-                thread_header += f":: {thread_name}"
-            
-            # Add dispatch queue if available
-            queue = thread.get('queue', '')
-            if queue:
-                thread_header += f" Dispatch queue: {queue}"
-            
-            # If no additional info, add colon at the end
-            if not thread_name and not queue and thread_idx != faulting_thread:
-                thread_header += ":"
-            
-            thread_lines.append(thread_header)
+        for thread_idx, thread in enumerate(report.threads):
+            thread_lines = [self._format_thread_header(report, thread_idx, thread)]
             
             # Format stack frames
-            frames = thread.get('frames', [])
-            for frame_idx, frame in enumerate(frames):
-                frame_line = self._format_frame(frame_idx, frame)
+            for frame_idx, frame in enumerate(thread.frames):
+                frame_line = self._format_frame(report, frame_idx, frame)
                 thread_lines.append(frame_line)
             
             formatted_threads.append('\n'.join(thread_lines))
         
         return '\n\n'.join(formatted_threads)
     
-    def _format_frame(self, frame_idx: int, frame: Dict[str, Any]) -> str:
+    def _format_thread_header(self, report: IPSReport, thread_idx: int, thread: IPSThread) -> str:
+        """Format a thread header line exactly like Mac Console"""
+        faulting_thread = report.data.get('faultingThread')
+
+        # Thread header
+        thread_header = f"Thread {thread_idx}"
+        
+        # Check if this is the crashed thread
+        if thread_idx == faulting_thread:
+            thread_header += " Crashed"
+        
+        # Add thread name if available
+        thread_name = thread.get('name', '')
+        if thread_name:
+            thread_header += f":: {thread_name}"
+        
+        # Add dispatch queue if available
+        queue = thread.get('queue', '')
+        if queue:
+            thread_header += f" Dispatch queue: {queue}"
+        
+        # If no additional info, add colon at the end
+        if not thread_name and not queue and thread_idx != faulting_thread:
+            thread_header += ":"
+        
+        return thread_header
+    
+    def _format_frame(self, report: IPSReport, frame_idx: int, frame: IPSFrame) -> str:
         """Format a single stack frame exactly like Mac Console"""
         # Get frame information
-        image_index = frame.get('imageIndex')
-        image_offset = frame.get('imageOffset', 0)
-        symbol = frame.get('symbol', '')
-        symbol_location = frame.get('symbolLocation', 0)
+        image_index = frame.imageIndex
+        image_offset = frame.imageOffset
+        symbol = frame.symbol
+        symbol_location = frame.symbolLocation
         
         # Get image information
         image_name = ''
         image_base = 0
-        if image_index is not None and image_index < len(self.used_images):
-            image_info = self.used_images[image_index]
-            image_name = image_info.get('name', '')
-            image_base = image_info.get('base', 0)
+        if image_index is not None and image_index < len(report.used_images):
+            image_info = report.used_images[image_index]
+            image_name = image_info.name
+            image_base = image_info.base
         
         # Format frame number (left-aligned, followed by spaces)
         frame_num = f"{frame_idx}"
@@ -427,57 +589,61 @@ class IPSConverter:
         
         return any(image_name.startswith(pattern) for pattern in system_patterns)
     
-    def _format_binary_images(self) -> str:
+    def _format_binary_images(self, report: IPSReport) -> str:
         """Format binary images section exactly like Mac Console"""
-        if not self.used_images:
+        if not report.used_images:
             return ""
         
         lines = ["Binary Images:"]
         
-        for image in self.used_images:
-            base = image.get('base', 0)
-            size = image.get('size', 0)
-            name = image.get('name', '')
-            uuid = image.get('uuid', '').lower()
-            path = image.get('path', '')
-            
-            # Calculate end address
-            end_address = base + size - 1 if size > 0 else base
-            
-            # Format addresses
-            base_hex = f"0x{base:x}" if base else "0x0"
-            end_hex = f"0x{end_address:x}" if end_address else "0x0"
-            
-            # Pad addresses for alignment
-            base_padded = f"{base_hex:>16}"
-            end_padded = f"{end_hex:>16}"
-            
-            # Get version information
-            version_info = ""
-            if 'CFBundleShortVersionString' in image:
-                version_info = f" ({image['CFBundleShortVersionString']})"
-            elif 'CFBundleVersion' in image:
-                version_info = f" ({image['CFBundleVersion']})"
-            
-            # Get identifier
-            identifier = image.get('CFBundleIdentifier', name)
-            if not identifier:
-                identifier = "*"
-            
-            # Format UUID
-            if uuid and uuid != "00000000-0000-0000-0000-000000000000":
-                uuid_formatted = f"<{uuid}>"
-            else:
-                uuid_formatted = "<*>"
-            
-            # Build the line
-            image_line = f"{base_padded} -        {end_padded} {identifier}{version_info} {uuid_formatted} {path}"
-            lines.append(image_line)
+        for image in report.used_images:
+            lines.append(self._format_binary_image(image))
         
         return '\n'.join(lines)
 
+    def _format_binary_image(self, image: IPSImage) -> str:
+        """Format a single Binary Images line exactly like Mac Console"""
+        base = image.base
+        size = image.size
+        name = image.name
+        uuid = image.uuid.lower()
+        path = image.path
+        
+        # Calculate end address
+        end_address = base + size - 1 if size > 0 else base
+        
+        # Format addresses
+        base_hex = f"0x{base:x}" if base else "0x0"
+        end_hex = f"0x{end_address:x}" if end_address else "0x0"
+        
+        # Pad addresses for alignment
+        base_padded = f"{base_hex:>16}"
+        end_padded = f"{end_hex:>16}"
+        
+        # Get version information
+        version_info = ""
+        if image.CFBundleShortVersionString is not None:
+            version_info = f" ({image.CFBundleShortVersionString})"
+        elif image.CFBundleVersion is not None:
+            version_info = f" ({image.CFBundleVersion})"
+        
+        # Get identifier
+        identifier = image.CFBundleIdentifier if image.CFBundleIdentifier is not None else name
+        if not identifier:
+            identifier = "*"
+        
+        # Format UUID
+        if uuid and uuid != "00000000-0000-0000-0000-000000000000":
+            uuid_formatted = f"<{uuid}>"
+        else:
+            uuid_formatted = "<*>"
+        
+        # Build the line
+        image_line = f"{base_padded} -        {end_padded} {identifier}{version_info} {uuid_formatted} {path}"
+        return image_line
+
 
-def convert_ips_file(input_file: str, output_file: Optional[str] = None) -> str:
+def convert_ips_file(input_file: str, output_file: str | None = None) -> str:
     """
     Convenient function to convert IPS file
     
@@ -0,0 +1,269 @@
+"""
+Hot-path metrics
+Counters and duration histograms for scanning, binary resolution, atos calls, symbol
+downloads and extraction. Values go to pluggable sinks; with no sink installed (the
+default) every call returns after one check, so instrumentation costs nothing measurable.
+
+    from MacAutoSymbolizer.src import metrics
+    sink = metrics.InMemorySink()
+    metrics.set_sinks(sink)
+    ...
+    print(sink.render_prometheus())
+
+Durations are in seconds (names ending in _seconds), counters end in _total.
+"""
+
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+# histograms that are not durations
+BUCKETS = {
+    'download_throughput_bytes_per_second': tuple(x * 1024 * 1024 for x in (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)),
+    'atos_batch_addresses': (1, 2, 5, 10, 25, 50, 100, 256),
+}
+
+PROMETHEUS_PREFIX = 'mac_symbolizer_'
+
+
+@dataclass
+class Histogram:
+    buckets: tuple
+    counts: list = field(default_factory=list)
+    sum: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """(upper bound, observations <= bound), as Prometheus expects"""
+        total, res = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            res.append((bound, total))
+        return res
+
+
+class MetricsSink(ABC):
+    """Receives every counter increment and histogram observation"""
+
+    @abstractmethod
+    def inc(self, name: str, value: float, labels: dict):
+        ...
+
+    @abstractmethod
+    def observe(self, name: str, value: float, labels: dict):
+        ...
+
+
+class InMemorySink(MetricsSink):
+    """Keeps counters and histograms in process, thread-safe, renders the Prometheus text format"""
+
+    def __init__(self, buckets: dict[str, tuple] | None = None):
+        self.buckets = dict(BUCKETS, **(buckets or {}))
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple[str, tuple]:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float, labels: dict):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def histogram(self, name: str, **labels) -> Histogram | None:
+        with self._lock:
+            return self._histograms.get(self._key(name, labels))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """Counters and histogram count/sum, keyed by name{labels}"""
+        def label_text(labels: tuple) -> str:
+            return '{' + ','.join(f'{k}={v}' for k, v in labels) + '}' if labels else ''
+
+        with self._lock:
+            return {
+                'counters': {f'{name}{label_text(labels)}': value for (name, labels), value in self._counters.items()},
+                'histograms': {
+                    f'{name}{label_text(labels)}': {'count': h.count, 'sum': h.sum}
+                    for (name, labels), h in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self, prefix: str = PROMETHEUS_PREFIX) -> str:
+        def labels_text(labels: tuple, extra: tuple = ()) -> str:
+            items = [f'{k}="{_escape(v)}"' for k, v in labels + extra]
+            return '{' + ','.join(items) + '}' if items else ''
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, (h.cumulative(), h.sum, h.count)) for key, h in self._histograms.items()),
+                key=lambda x: x[0]
+            )
+
+        out, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                out.append(f'# TYPE {prefix}{name} counter')
+                typed.add(name)
+            out.append(f'{prefix}{name}{labels_text(labels)} {_number(value)}')
+        for (name, labels), (cumulative, total, count) in histograms:
+            if name not in typed:
+                out.append(f'# TYPE {prefix}{name} histogram')
+                typed.add(name)
+            for bound, observed in cumulative:
+                out.append(f'{prefix}{name}_bucket{labels_text(labels, (("le", _number(bound)),))} {observed}')
+            out.append(f'{prefix}{name}_bucket{labels_text(labels, (("le", "+Inf"),))} {count}')
+            out.append(f'{prefix}{name}_sum{labels_text(labels)} {_number(total)}')
+            out.append(f'{prefix}{name}_count{labels_text(labels)} {count}')
+        return '\n'.join(out) + '\n'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class OpenTelemetrySink(MetricsSink):
+    """
+    Forwards to an OpenTelemetry meter. Needs opentelemetry-api; an SDK with an
+    exporter must be configured by the application, otherwise the API is a no-op.
+    """
+
+    def __init__(self, meter_name: str = 'MacAutoSymbolizer'):
+        from opentelemetry import metrics as otel_metrics  # optional dependency
+        self._meter = otel_metrics.get_meter(meter_name)
+        self._instruments: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _instrument(self, name: str, factory):
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self._instruments.get(name)
+                if instrument is None:
+                    instrument = self._instruments[name] = factory(name)
+        return instrument
+
+    def inc(self, name: str, value: float, labels: dict):
+        self._instrument(name, self._meter.create_counter).add(value, labels)
+
+    def observe(self, name: str, value: float, labels: dict):
+        unit = 's' if name.endswith('_seconds') else ''
+        self._instrument(name, lambda x: self._meter.create_histogram(x, unit=unit)).record(value, labels)
+
+
+_sinks: tuple[MetricsSink, ...] = ()
+
+
+def set_sinks(*sinks: MetricsSink):
+    """Replace the installed sinks, no arguments disables metrics"""
+    global _sinks
+    _sinks = tuple(sinks)
+
+
+def get_sinks() -> tuple[MetricsSink, ...]:
+    return _sinks
+
+
+def enabled() -> bool:
+    return bool(_sinks)
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not _sinks:
+        return
+    for sink in _sinks:
+        sink.inc(name, value, labels)
+
+
+def observe(name: str, value: float, **labels):
+    if not _sinks:
+        return
+    for sink in _sinks:
+        sink.observe(name, value, labels)
+
+
+class _Timer:
+    __slots__ = ('labels', 'name', 'start')
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+_NULL_TIMER = nullcontext()
+
+
+def timer(name: str, **labels):
+    """Context manager observing the duration of its block, also usable around awaits"""
+    if not _sinks:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def configure_from_env(default: str = 'off') -> InMemorySink | None:
+    """
+    Install sinks from MAC_SYMBOLIZER_METRICS, a comma separated list of memory, otel or off
+    :return: the in-memory sink when installed
+    """
+    names = {x.strip().lower() for x in os.getenv('MAC_SYMBOLIZER_METRICS', default).split(',') if x.strip()}
+    sinks: list[MetricsSink] = []
+    memory = None
+    if 'memory' in names:
+        memory = InMemorySink()
+        sinks.append(memory)
+    if 'otel' in names:
+        try:
+            sinks.append(OpenTelemetrySink())
+        except ImportError:
+            logger.warning(f'[{__name__}] opentelemetry-api is not installed, otel metrics disabled')
+    set_sinks(*sinks)
+    return memory
@@ -0,0 +1,209 @@
+"""
+Symbol prefetcher
+Downloads and extracts the symbols of upcoming or recently requested versions in the
+background, so the first crash of a new release does not pay for the download.
+"""
+
+import asyncio
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from datetime import time as dtime
+
+from MacAutoSymbolizer.src.resource_config import LoopLocalSemaphore
+from MacAutoSymbolizer.src.scanner import get_arch
+from MacAutoSymbolizer.src.symbolizer import Symbolizer
+from MacAutoSymbolizer.src.utilities import (
+    max_cached_symbol_count,
+    max_downloaded_versions,
+    prefetch_archs,
+    prefetch_max_bandwidth_mb,
+    prefetch_versions,
+    prefetch_window,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PrefetchTarget:
+    version: str
+    arch: str
+    isBackup: bool = False
+
+
+def parse_window(window: str) -> tuple[dtime, dtime] | None:
+    """
+    Parse an off-peak window such as '01:00-06:00', it may wrap past midnight ('22:00-06:00')
+    :return: (start, end), None for an empty window
+    """
+    if not window:
+        return None
+    try:
+        start, end = (datetime.strptime(x.strip(), '%H:%M').time() for x in window.split('-'))
+    except ValueError:
+        raise ValueError(f'Invalid prefetch window: {window}, expected HH:MM-HH:MM')
+    return start, end
+
+
+def seconds_until_window(window: tuple[dtime, dtime] | None, now: datetime | None = None) -> float:
+    """Seconds until the window opens, 0 when inside it or when there is no window"""
+    if window is None:
+        return 0
+    now = now or datetime.now()
+    start, end = window
+    current = now.time()
+    inside = start <= current < end if start <= end else (current >= start or current < end)
+    if inside:
+        return 0
+    next_start = datetime.combine(now.date(), start)
+    if next_start <= now:
+        next_start += timedelta(days=1)
+    return (next_start - now).total_seconds()
+
+
+def configured_targets() -> list[PrefetchTarget]:
+    """The [prefetch] versions of config.ini, for every configured architecture"""
+    return [PrefetchTarget(version, arch) for version in prefetch_versions() for arch in prefetch_archs()]
+
+
+class SymbolPrefetcher:
+    """
+    :param symbolizer: downloads go through its download_symbols, sharing the locks with request-time downloads
+    :param max_bytes_per_second: bandwidth cap of prefetch downloads, None means unlimited
+    :param window: off-peak window, see parse_window; empty means any time
+    :param cache_budget: most versions a prefetch plans
+    :param retention: versions the download cleanup keeps; a prefetch only downloads as many new versions
+        as fit next to cache_budget recently used ones, so it never evicts what requests are reading
+    """
+
+    def __init__(
+            self,
+            symbolizer: Symbolizer,
+            max_bytes_per_second: float | None = None,
+            window: str = '',
+            cache_budget: int | None = None,
+            retention: int | None = None
+    ):
+        self.symbolizer = symbolizer
+        # fewer connections than request-time downloads, the cap is shared by all of them
+        self.downloader = Symbolizer.create_downloader(max_bytes_per_second, max_concurrent_chunks=4)
+        self.window = parse_window(window)
+        self.cache_budget = cache_budget
+        self.retention = retention
+        self.current: PrefetchTarget | None = None
+        self.results: dict[PrefetchTarget, bool] = {}
+        # prefetch downloads run one at a time, later ones wait for the earlier ones
+        self._running = LoopLocalSemaphore(1)
+        self._active = 0
+
+    @classmethod
+    def from_config(cls, symbolizer: Symbolizer) -> 'SymbolPrefetcher':
+        bandwidth = prefetch_max_bandwidth_mb()
+        return cls(
+            symbolizer,
+            max_bytes_per_second=bandwidth * 1024 * 1024 if bandwidth > 0 else None,
+            window=prefetch_window(),
+            cache_budget=max_cached_symbol_count(),
+            retention=max_downloaded_versions()
+        )
+
+    @property
+    def busy(self) -> bool:
+        return self._active > 0
+
+    def plan(self, targets: list[PrefetchTarget]) -> list[PrefetchTarget]:
+        """
+        De-duplicate the targets, keep at most cache_budget versions and drop the ones already cached.
+        New versions are limited to the headroom left in the retention. Targets earlier in the list
+        win when the budget is exceeded.
+        """
+        headroom = max(self.retention - (self.cache_budget or 0), 0) if self.retention else None
+        planned, versions, new_versions = [], [], []
+        for target in dict.fromkeys(targets):
+            if get_arch(target.arch) is None:
+                logger.warning(f'[{__name__}] skip {target.version}: unknown architecture {target.arch}')
+                continue
+            if target.version not in versions:
+                if self.cache_budget and len(versions) >= self.cache_budget:
+                    logger.info(f'[{__name__}] skip {target.version}: cache budget of {self.cache_budget} versions')
+                    continue
+                versions.append(target.version)
+            if Symbolizer.symbols_cached(target.version, get_arch(target.arch)):
+                continue
+            if target.version not in new_versions:
+                if headroom is not None and len(new_versions) >= headroom:
+                    logger.info(f'[{__name__}] skip {target.version}: no headroom left in the {self.retention} '
+                                f'kept versions')
+                    continue
+                new_versions.append(target.version)
+            planned.append(target)
+        return planned
+
+    async def prefetch(self, targets: list[PrefetchTarget], wait_for_window: bool = True) -> dict[PrefetchTarget, bool]:
+        """
+        Download the planned targets one after another
+        :param wait_for_window: wait for the off-peak window before each download; a run waiting
+            for the window is not busy and does not hold back other runs
+        :return: target -> success
+        """
+        results = {}
+        for target in self.plan(targets):
+            if wait_for_window:
+                delay = seconds_until_window(self.window)
+                if delay:
+                    logger.info(f'[{__name__}] waiting {delay / 3600:.1f}h for the off-peak window')
+                    await asyncio.sleep(delay)
+            # downloads run one at a time, a download of another run finishes first
+            self._active += 1
+            try:
+                async with self._running:
+                    results[target] = await self._prefetch_one(target)
+            finally:
+                self._active -= 1
+        return results
+
+    async def _prefetch_one(self, target: PrefetchTarget) -> bool:
+        arch = get_arch(target.arch)
+        # a request or another run may have downloaded it in the meantime
+        if Symbolizer.symbols_cached(target.version, arch):
+            return True
+
+        logger.info(f'[{__name__}] prefetching {target.version} {arch.value}')
+        self.current = target
+        try:
+            ok, _ = await self.symbolizer.download_symbols(
+                target.version, arch, target.isBackup, downloader=self.downloader
+            )
+        except Exception as e:  # noqa: BLE001 - a failed target is recorded, the next one still runs
+            logger.warning(f'[{__name__}] prefetch of {target.version} {arch.value} failed: {e}')
+            ok = False
+        finally:
+            self.current = None
+        self.results[target] = ok
+        return ok
+
+    async def run_forever(self, targets_source: Callable[[], list[PrefetchTarget]], interval: float):
+        """
+        Prefetch whatever targets_source returns every interval seconds
+        :param targets_source: called in a worker thread, may read files or databases
+        """
+        while True:
+            try:
+                targets = await asyncio.to_thread(targets_source)
+                if targets:
+                    await self.prefetch(targets)
+            except Exception as e:  # noqa: BLE001 - the next round retries
+                logger.warning(f'[{__name__}] prefetch round failed: {e}')
+            await asyncio.sleep(interval)
+
+    def status(self) -> dict:
+        def describe(target: PrefetchTarget) -> dict:
+            return {'version': target.version, 'arch': target.arch, 'isBackup': target.isBackup}
+
+        return {
+            'busy': self.busy,
+            'current': describe(self.current) if self.current else None,
+            'results': [dict(describe(x), success=ok) for x, ok in self.results.items()],
+        }
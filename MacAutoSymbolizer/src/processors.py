@@ -1,123 +1,79 @@
 
-from .multi_process_symbolizer import (
-    SymbolizedItem
-)
-
-from MacAutoSymbolizer.src.enums import (
-    CrashLineType
-)
-
-from MacAutoSymbolizer.tools.hash import crash_tag
+from MacAutoSymbolizer.src.scanner import DiagLine, RawLine, SymbolizedLine, TheadLine
+from MacAutoSymbolizer.src.signature import crash_frames, crash_tag
 
 """
 Examples for symbolizer result processor
+Each takes the thread blocks returned by Symbolizer.symbolize / symbolize_many
 """
 
 
-def symbolized_item_tostring(item: SymbolizedItem, need_info: bool = True) -> list[str]:
+def symbolized_blocks_tostring(stack_blocks: list[list], crash_info: dict | None = None) -> list[str]:
     res = []
-    if item:
-        if need_info:
+    if stack_blocks:
+        if crash_info:
             res.append('''
-            _FeedbackID_ `{0}`
+            _Incident_ `{0}`
             _Arch_ `{1}`
             _Version_ `{2}`
             '''.format(
-                item.crash_id,
-                item.app_arch,
-                item.version
+                crash_info.get('Incident Identifier', ''),
+                crash_info.get('Code Type', ''),
+                crash_info.get('version', '')
             ))
-        stack = ""
-        for line in item.symbolized_lines:
-            # idx return_code useful_output error
-            if line.error:
-                stack += f'{line.idx} {line.error}\n'
-            else:
-                stack += f'{line.idx} {line.useful_output}\n'
-        res.append("```\n" + stack + "\n```")
+        res.append("```\n" + '\n'.join(symbolized_blocks_tolist(stack_blocks)) + "\n```")
     return res
 
-def symbolized_items_tolist(
-    items: list[SymbolizedItem],
-    stack_blocks: list
-) -> list[str]:
-    sorted_symbolized_lines = {}
-    # extract symbolized items
-    for a_item in items:
-        for a_line in a_item.symbolized_lines:
-            sorted_symbolized_lines[a_line.idx] = a_line.error if a_line.error else a_line.useful_output
+
+def symbolized_blocks_tolist(stack_blocks: list[list]) -> list[str]:
     tmp_results = []
     for a_block in stack_blocks:
-        # stack_blocks is sorted
-        thread_res = []
-        stack_line_idx = 0
-        for line in a_block:
-            line_idx = line[0]
-            line_type = line[1]
-            line_info = line[2]
-            if not line_info:
-                continue
-            if line_type == CrashLineType.THREAD:
-                thread_res.append(str(line_info[-1]))
-            elif line_type == CrashLineType.RAW:
-                symbolized_res = sorted_symbolized_lines.get(line_idx)
-                if symbolized_res:
-                    thread_res.append(f'{stack_line_idx}   {symbolized_res}')
-                else:
-                    thread_res.append(' '.join(line_info))
-                stack_line_idx += 1
-            elif line_type == CrashLineType.SYMBOLED:
-                thread_res.append(str(line_info[0]))
-                stack_line_idx += 1
-        if thread_res:
-            tmp_results += thread_res
+        tmp_results += [str(line) for line in a_block if isinstance(line, (TheadLine, RawLine, DiagLine))]
     return tmp_results
 
 
+def _frame_offset(line: RawLine) -> str:
+    if isinstance(line, SymbolizedLine):
+        return (line.info[8] if len(line.info) > 8 else '') or ''
+    try:
+        return str(int(line.addressesToSymbolicate, 16) - int(line.binary.loadAddress, 16))
+    except (AttributeError, TypeError, ValueError):
+        return ''
 
 
-def symbolized_items_totable(
-        items: list[SymbolizedItem],
-        stack_blocks: list
-):
+def symbolized_blocks_totable(stack_blocks: list[list]):
     results: dict = {
         'title': ['#', 'package', 'address', 'function', 'offset'],
         'rows': [],
-        # 'hash': '',
         'tags': []
     }
 
-    def add_a_result(row:list[str]):
+    def add_a_result(row: list[str]):
         results['rows'].append(row)
 
-
-    # extract symbolized items
-    sorted_symbolized_lines = {}
-    for a_item in items:
-        for a_line in a_item.symbolized_lines:
-            sorted_symbolized_lines[a_line.idx] = a_line.error if a_line.error else a_line.useful_output
-
     # build results
-    packages = []
-    functions = []
     for a_block in stack_blocks:
         # stack_blocks is sorted
         for line in a_block:
-            line_idx = line[0]
-            line_type = line[1]
-            line_info = line[2]
-            if not line_info:
-                continue
-            if line_type == CrashLineType.THREAD:
-                add_a_result([str(line_info[-1])])
-            elif line_type == CrashLineType.RAW:
-                symbolized_res = sorted_symbolized_lines.get(line_idx)
-                if symbolized_res:
-                    packages.append(line_info[1])
-                    functions.append(symbolized_res)
-                add_a_result([line_info[0], line_info[1], line_info[2], symbolized_res or line_info[3], line_info[4]])
-            elif line_type == CrashLineType.SYMBOLED:
-                add_a_result(list(line_info[-1]))
-    results['tags'] = crash_tag(packages, functions)
+            if isinstance(line, TheadLine):
+                add_a_result([line.line])
+            elif isinstance(line, RawLine):
+                add_a_result([
+                    str(line.threadIdx),
+                    line.binary.name if line.binary else '',
+                    line.addressesToSymbolicate or '',
+                    str(line.symbolizedRes) if line.isSymbolized else '',
+                    _frame_offset(line)
+                ])
+            elif isinstance(line, DiagLine):
+                add_a_result([
+                    str(line.diagIdx),
+                    line.binary.name if line.binary else '',
+                    line.addressesToSymbolicate or '',
+                    str(line.symbolizedRes) if line.isSymbolized else '',
+                    ''
+                ])
+
+    # tags come from the app frames of the crashed thread
+    results['tags'] = crash_tag(*crash_frames(stack_blocks))
     return results
-
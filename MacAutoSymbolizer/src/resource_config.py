@@ -3,9 +3,23 @@
 用于控制符号化过程中的资源使用，防止"Too many open files"错误
 """
 
+import asyncio
+import errno
+import logging
 import os
 import resource
-import logging
+import statistics
+import threading
+import weakref
+from collections import deque
+from collections.abc import Callable
+
+from MacAutoSymbolizer.src import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +32,15 @@ class ResourceConfig:
         self.max_concurrent_symbolize = 20      # 最大并发符号化任务数
         self.max_concurrent_file_search = 10    # 最大并发文件搜索数
         self.subprocess_timeout = 30            # 子进程超时时间（秒）
+        self.max_subprocess_output_mb = 8       # 子进程stdout/stderr各自保留的最大输出（MB）
         self.file_search_limit = 5              # 文件搜索结果限制
+        self.max_concurrent_jobs = 4            # Web后台同时执行的符号化任务数
+        self.max_queued_jobs = 32               # Web后台最多等待的任务数
+        self.max_upload_mb = 200                # Web上传文件大小上限（MB）
+        self.adaptive_concurrency = True        # 运行时根据atos延迟和系统压力调整并发数
+        self.min_concurrent_symbolize = 2       # 自适应调整时符号化并发数的下限
+        self.max_concurrent_symbolize_ceiling = 0  # 自适应调整时的上限，0表示按文件描述符限制计算
+        self.min_concurrent_chunks = 1          # 自适应调整时下载分片并发数的下限
         
         # 从环境变量读取配置
         self._load_from_env()
@@ -31,7 +53,19 @@ class ResourceConfig:
         self.max_concurrent_symbolize = int(os.getenv('MAC_SYMBOLIZER_MAX_CONCURRENT', self.max_concurrent_symbolize))
         self.max_concurrent_file_search = int(os.getenv('MAC_SYMBOLIZER_MAX_FILE_SEARCH', self.max_concurrent_file_search))
         self.subprocess_timeout = int(os.getenv('MAC_SYMBOLIZER_SUBPROCESS_TIMEOUT', self.subprocess_timeout))
+        self.max_subprocess_output_mb = int(
+            os.getenv('MAC_SYMBOLIZER_MAX_SUBPROCESS_OUTPUT_MB', self.max_subprocess_output_mb)
+        )
         self.file_search_limit = int(os.getenv('MAC_SYMBOLIZER_FILE_SEARCH_LIMIT', self.file_search_limit))
+        self.max_concurrent_jobs = int(os.getenv('MAC_SYMBOLIZER_MAX_JOBS', self.max_concurrent_jobs))
+        self.max_queued_jobs = int(os.getenv('MAC_SYMBOLIZER_MAX_QUEUED_JOBS', self.max_queued_jobs))
+        self.max_upload_mb = int(os.getenv('MAC_SYMBOLIZER_MAX_UPLOAD_MB', self.max_upload_mb))
+        self.adaptive_concurrency = os.getenv('MAC_SYMBOLIZER_ADAPTIVE', '1').lower() not in ('0', 'false', 'no', 'off')
+        self.min_concurrent_symbolize = int(os.getenv('MAC_SYMBOLIZER_MIN_CONCURRENT', self.min_concurrent_symbolize))
+        self.max_concurrent_symbolize_ceiling = int(
+            os.getenv('MAC_SYMBOLIZER_CONCURRENT_CEILING', self.max_concurrent_symbolize_ceiling)
+        )
+        self.min_concurrent_chunks = int(os.getenv('MAC_SYMBOLIZER_MIN_DOWNLOAD_CHUNKS', self.min_concurrent_chunks))
     
     def _auto_adjust_limits(self):
         """根据系统资源自动调整限制"""
@@ -57,11 +91,43 @@ class ResourceConfig:
                     new_soft_limit = min(hard_limit, 4096)
                     resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft_limit, hard_limit))
                     logger.info(f"已将文件描述符软限制从 {soft_limit} 增加到 {new_soft_limit}")
+                    soft_limit = new_soft_limit
                 except (ValueError, OSError) as e:
                     logger.warning(f"无法增加文件描述符限制: {e}")
+
+            # 每个atos子进程在本进程占用约4个描述符（管道和子进程句柄），最多用掉一半的软限制
+            if self.max_concurrent_symbolize_ceiling <= 0:
+                self.max_concurrent_symbolize_ceiling = max(
+                    self.max_concurrent_symbolize,
+                    min(self.max_concurrent_symbolize * 4, soft_limit // 8)
+                )
             
         except Exception as e:
             logger.warning(f"获取系统资源信息失败: {e}")
+            if self.max_concurrent_symbolize_ceiling <= 0:
+                self.max_concurrent_symbolize_ceiling = self.max_concurrent_symbolize
+
+    def symbolize_limiter(self, initial: int | None = None) -> 'AdaptiveSemaphore':
+        """符号化（atos调用）的并发限制，从initial开始，在下限和上限之间自适应调整"""
+        initial = initial or self.max_concurrent_symbolize
+        return AdaptiveSemaphore(
+            initial,
+            minimum=min(self.min_concurrent_symbolize, initial),
+            maximum=max(self.max_concurrent_symbolize_ceiling, initial),
+            name='symbolize',
+            adaptive=self.adaptive_concurrency
+        )
+
+    def download_limiter(self, max_chunks: int) -> 'AdaptiveSemaphore':
+        """下载分片的并发限制，从max_chunks开始，只在下限和max_chunks之间调整"""
+        return AdaptiveSemaphore(
+            max_chunks,
+            minimum=min(self.min_concurrent_chunks, max_chunks),
+            maximum=max_chunks,
+            name='download',
+            adaptive=self.adaptive_concurrency,
+            window=8
+        )
     
     def get_config_summary(self) -> str:
         """获取配置摘要"""
@@ -70,22 +136,23 @@ class ResourceConfig:
 - 最大并发符号化任务: {self.max_concurrent_symbolize}
 - 最大并发文件搜索: {self.max_concurrent_file_search}
 - 子进程超时时间: {self.subprocess_timeout}秒
+- 子进程输出上限: {self.max_subprocess_output_mb}MB
 - 文件搜索结果限制: {self.file_search_limit}
+- 最大并发后台任务: {self.max_concurrent_jobs}
+- 最大等待后台任务: {self.max_queued_jobs}
+- 上传文件大小上限: {self.max_upload_mb}MB
+- 自适应并发: {'开启' if self.adaptive_concurrency else '关闭'}（符号化 {self.min_concurrent_symbolize}~{self.max_concurrent_symbolize_ceiling}）
 """
 
     @staticmethod
     def check_system_resources():
         """检查系统资源状态"""
         try:
-            # 检查文件描述符使用情况
-            import psutil
-            process = psutil.Process()
-            open_files = len(process.open_files())
-            
+            # 检查文件描述符使用情况（包括管道和socket）
             soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
-            usage_percent = (open_files / soft_limit) * 100
+            usage_percent = fd_usage() * 100
             
-            logger.info(f"当前打开文件数: {open_files}/{soft_limit} ({usage_percent:.1f}%)")
+            logger.info(f"当前打开文件数: {round(usage_percent * soft_limit / 100)}/{soft_limit} ({usage_percent:.1f}%)")
             
             if usage_percent > 80:
                 logger.warning(f"文件描述符使用率过高: {usage_percent:.1f}%")
@@ -93,13 +160,328 @@ class ResourceConfig:
             
             return True
         
-        except ImportError:
-            logger.warning("psutil未安装，无法检查系统资源")
-            return True
         except Exception as e:
             logger.warning(f"检查系统资源失败: {e}")
             return True
 
 
-# 全局配置实例
-resource_config = ResourceConfig()
+def fd_usage() -> float:
+    """本进程已打开的文件描述符（文件、管道、socket）占软限制的比例"""
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        import psutil
+        open_fds = psutil.Process().num_fds()
+    except (ImportError, AttributeError):
+        open_fds = len(os.listdir('/dev/fd'))
+    return open_fds / soft_limit
+
+
+def cpu_load() -> float:
+    """1分钟平均负载除以CPU数，大于1表示有进程在排队等待CPU"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def system_pressure() -> tuple[float, float]:
+    """(文件描述符使用率, 每个CPU的负载)"""
+    return fd_usage(), cpu_load()
+
+
+class LoopLocalSemaphore:
+    """
+    每个事件循环各自持有一个asyncio.Semaphore。
+    asyncio.Semaphore会绑定到第一次使用它的事件循环，长期存在的对象（如共享的Symbolizer）
+    被多个事件循环使用时需要用这个类代替。
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._value)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def locked(self) -> bool:
+        return self._semaphore().locked()
+
+    async def acquire(self) -> bool:
+        return await self._semaphore().acquire()
+
+    def release(self):
+        self._semaphore().release()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class _LoopSlots:
+    __slots__ = ('active', 'waiters')
+
+    def __init__(self):
+        self.active = 0
+        self.waiters: deque = deque()
+
+
+class AdaptiveSemaphore:
+    """
+    上限可在运行时调整的信号量，用法与LoopLocalSemaphore相同（每个事件循环各自计数，共用同一个上限）。
+    调用方通过record()报告每次调用的耗时或异常，每window次调用按AIMD调整一次上限：
+    - 出现超时或其他异常、文件描述符使用率超过fd_threshold、每个CPU的负载超过load_threshold、
+      延迟中位数超过基线的latency_tolerance倍时，上限乘以backoff
+    - 否则窗口内有调用排队等待时，上限加1
+    出现"Too many open files"时立即减半。上限始终在[minimum, maximum]之间。
+    基线是各类调用（kind）见过的最低延迟中位数，每个窗口缓慢上浮，以适应负载变化。
+
+    :param probe: 返回(文件描述符使用率, CPU负载)，默认system_pressure
+    """
+
+    def __init__(
+            self,
+            initial: int,
+            minimum: int = 1,
+            maximum: int | None = None,
+            name: str = '',
+            adaptive: bool = True,
+            window: int = 20,
+            latency_tolerance: float = 2.0,
+            backoff: float = 0.7,
+            fd_threshold: float = 0.8,
+            load_threshold: float = 2.0,
+            probe: Callable[[], tuple[float, float]] | None = None
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or initial)
+        self.name = name
+        self.adaptive = adaptive
+        self.window = window
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.fd_threshold = fd_threshold
+        self.load_threshold = load_threshold
+        self.probe = probe or system_pressure
+        self._limit = min(max(initial, self.minimum), self.maximum)
+        self._slots_by_loop: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # record()可能来自不同线程中的事件循环
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._failures = 0
+        self._latencies: dict[str, list[float]] = {}
+        self._baselines: dict[str, float] = {}
+        self._saturated = False
+
+    @property
+    def value(self) -> int:
+        return self._limit
+
+    def _slots(self) -> _LoopSlots:
+        loop = asyncio.get_running_loop()
+        slots = self._slots_by_loop.get(loop)
+        if slots is None:
+            slots = self._slots_by_loop[loop] = _LoopSlots()
+        return slots
+
+    def locked(self) -> bool:
+        return self._slots().active >= self._limit
+
+    async def acquire(self) -> bool:
+        slots = self._slots()
+        if slots.active >= self._limit or slots.waiters:
+            self._saturated = True
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            slots.waiters.append(waiter)
+            try:
+                while True:
+                    await waiter
+                    if slots.active < self._limit:
+                        break
+                    # 上限在唤醒后又被调低，回到队首继续等
+                    waiter = loop.create_future()
+                    slots.waiters.appendleft(waiter)
+            except asyncio.CancelledError:
+                if waiter in slots.waiters:
+                    slots.waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # 已被唤醒但被取消，把名额交给下一个
+                    self._wake(slots)
+                raise
+        slots.active += 1
+        return True
+
+    def release(self):
+        slots = self._slots()
+        slots.active -= 1
+        self._wake(slots)
+
+    def _wake(self, slots: _LoopSlots):
+        free = self._limit - slots.active
+        while free > 0 and slots.waiters:
+            waiter = slots.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def set_limit(self, limit: int, reason: str = ''):
+        limit = min(max(limit, self.minimum), self.maximum)
+        old, self._limit = self._limit, limit
+        if limit == old:
+            return
+        logger.info(f"[{__name__}] {self.name or '并发'}上限 {old} -> {limit} {reason}")
+        metrics.inc('concurrency_adjustments_total', limiter=self.name, direction='up' if limit > old else 'down')
+        if limit > old:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            for loop, slots in list(self._slots_by_loop.items()):
+                if loop is running:
+                    self._wake(slots)
+                elif not loop.is_closed():
+                    loop.call_soon_threadsafe(self._wake, slots)
+
+    def record(self, latency: float, error: BaseException | None = None, kind: str = ''):
+        """
+        报告一次调用的结果
+        :param latency: 调用耗时（秒），不含排队时间
+        :param error: 调用抛出的异常
+        :param kind: 耗时不可比的调用（如单个地址和批量的atos）分别计算基线
+        """
+        if not self.adaptive:
+            return
+        if isinstance(error, OSError) and error.errno == errno.EMFILE:
+            self.set_limit(self._limit // 2, '(too many open files)')
+            return
+        with self._lock:
+            self._calls += 1
+            if error is not None:
+                self._failures += 1
+            else:
+                self._latencies.setdefault(kind, []).append(latency)
+            if self._calls < self.window:
+                return
+            failures, latencies, saturated = self._failures, self._latencies, self._saturated
+            self._calls, self._failures, self._latencies, self._saturated = 0, 0, {}, False
+            slow = []
+            for key, values in latencies.items():
+                median = statistics.median(values)
+                baseline = self._baselines.get(key)
+                if baseline is not None and median > baseline * self.latency_tolerance:
+                    slow.append(f'{key or "latency"} {median:.3f}s/{baseline:.3f}s')
+                # 基线每个窗口最多上浮5%，长期变慢的环境也能重新校准
+                self._baselines[key] = median if baseline is None else min(median, baseline * 1.05)
+        self._adjust(failures, slow, saturated)
+
+    def _adjust(self, failures: int, slow: list[str], saturated: bool):
+        try:
+            fds, load = self.probe()
+        except Exception as e:  # noqa: BLE001 - a failing probe must not stop the limit from adapting
+            logger.warning(f"[{__name__}] 获取系统压力失败: {e}")
+            fds, load = 0.0, 0.0
+        reasons = []
+        if failures:
+            reasons.append(f'{failures} failures')
+        if fds > self.fd_threshold:
+            reasons.append(f'fd usage {fds:.0%}')
+        if load > self.load_threshold:
+            reasons.append(f'cpu load {load:.1f}')
+        reasons += slow
+        if reasons:
+            self.set_limit(min(int(self._limit * self.backoff), self._limit - 1), f'({", ".join(reasons)})')
+        elif saturated:
+            self.set_limit(self._limit + 1, '(saturated)')
+
+    def status(self) -> dict:
+        return {
+            'limit': self._limit,
+            'minimum': self.minimum,
+            'maximum': self.maximum,
+            'adaptive': self.adaptive,
+            'baselines': dict(self._baselines),
+        }
+
+
+class InterProcessFileLock:
+    """
+    基于fcntl.flock的跨进程异步文件锁，多个Web worker进程共享同一个符号目录时，
+    保证同一版本只由一个进程下载。等待时轮询而不是阻塞线程，可以被取消。
+    没有fcntl的平台上退化为空操作。
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.2):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    async def acquire(self):
+        if fcntl is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+# 全局配置实例，第一次使用时才创建：构造时会读取环境变量、调整文件描述符限制并写日志，导入模块时不做这些
+_resource_config: ResourceConfig | None = None
+_resource_config_lock = threading.Lock()
+
+
+def get_resource_config() -> ResourceConfig:
+    global _resource_config
+    if _resource_config is None:
+        with _resource_config_lock:
+            if _resource_config is None:
+                _resource_config = ResourceConfig()
+    return _resource_config
+
+
+def __getattr__(name: str):
+    # 兼容 from MacAutoSymbolizer.src.resource_config import resource_config
+    if name == 'resource_config':
+        return get_resource_config()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
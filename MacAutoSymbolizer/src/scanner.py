@@ -2,32 +2,24 @@
 # https://developer.apple.com/documentation/Xcode/adding-identifiable-symbol-names-to-a-crash-report
 import asyncio
 import logging
-import re
 import time
 import os
 from MacAutoSymbolizer.src.utilities import (
     Arch,
-    crash_identifiers,
-    arch_x86_regex,
-    arch_arm64_regex,
-    stack_line_regex,
-    symbolized_line_regex,
-    binary_image_regex,
-    thread_start_regex,
+    ConfigSnapshot,
+    config_snapshot,
     version_search,
-    binary_with_version,
-    diag_line_regex,
-    get_atos_tool_path,
-    safe_read_file
+    iter_file_lines
 )
-from MacAutoSymbolizer.src.ips_converter import IPSConverter
+from MacAutoSymbolizer.src.ips_converter import IPSConverter, IPSReport, IPSImage, IPSFrame
+from MacAutoSymbolizer.src import metrics
+from dataclasses import dataclass, field
 from enum import Enum
-from pydantic import BaseModel
+from collections.abc import Iterable
+from pydantic import BaseModel, ConfigDict
 from typing import Any, Literal
 
 
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
@@ -43,6 +35,9 @@ class CrashLineType(int, Enum):
 
 
 class ImageBinary(BaseModel):
+    # validators are built on first use instead of at import
+    model_config = ConfigDict(defer_build=True)
+
     uuid: str = ''
     name: str = ''
     loadAddress: str = ''
@@ -65,6 +60,16 @@ class ScannedLine(BaseModel):
     class Config:
         # This ensures subclasses are properly handled
         use_enum_values = True
+        defer_build = True
+
+    def atos_args(self) -> list[str]:
+        """atos arguments of this line without the program, empty when there is nothing to symbolize"""
+        return []
+
+    def cmd_args(self, config: ConfigSnapshot | None = None) -> list[str]:
+        """The full atos command line, with the atos of config (None follows config_snapshot())"""
+        atos_args = self.atos_args()
+        return [(config or config_snapshot()).atos_tool_path(), *atos_args] if atos_args else []
 
     def __str__(self):
         return self.line
@@ -93,10 +98,11 @@ class RawLine(ScannedLine):
     def __str__(self):
         return f'{self.threadIdx}{self.space1}{self.binary.name}{self.space2}{self.addressesToSymbolicate}{self.space3}{self.symbolizedRes}' if self.isSymbolized else self.line
 
-    def cmd_args(self):
+    def atos_args(self) -> list[str]:
+        """atos arguments of this frame without the program: -arch <arch> -o <path> -l <load address> <address>"""
         if not self.binary or not self.binary.path() or not self.binary.loadAddress or not self.addressesToSymbolicate:
             return []
-        return [get_atos_tool_path(), '-arch', self.binary.binaryArc.value, '-o', self.binary.path(), '-l', self.binary.loadAddress, str(self.addressesToSymbolicate)]
+        return ['-arch', self.binary.binaryArc.value, '-o', self.binary.path(), '-l', self.binary.loadAddress, str(self.addressesToSymbolicate)]
 
 
 class SymbolizedLine(RawLine):
@@ -116,50 +122,63 @@ class DiagLine(ScannedLine):
     def __str__(self):
         return f'{self.prefix}{self.diagIdx}  {self.symbolizedRes}  ({self.binary.name})  [{self.addressesToSymbolicate}]' if self.isSymbolized else self.line
 
-    def cmd_args(self):
+    def atos_args(self) -> list[str]:
         if not self.binary or not self.binary.path() or not self.binary.loadAddress or not self.addressesToSymbolicate:
             return []
         if self.isSymbolized:
             return []
-        return [get_atos_tool_path(), '-arch', self.binary.binaryArc.value, '-o', self.binary.path(), '-l', self.binary.loadAddress,
+        return ['-arch', self.binary.binaryArc.value, '-o', self.binary.path(), '-l', self.binary.loadAddress,
                 str(self.addressesToSymbolicate)]
 
 
 class ScanResult(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     crash_info: dict
     stack_blocks: list
     version_in_stack: str | None
     images_dict: dict[str, ImageBinary]
 
 
-def get_arch(line: str) -> Arch:
-    if line:
-        info = re.findall(arch_x86_regex(), line.lower().rstrip())
-        if info:
-            return Arch.osx
-    info = re.findall(arch_arm64_regex(), line.lower().rstrip())
-    if info:
-        return Arch.arm
-    return None
+def get_arch(line: str, config: ConfigSnapshot | None = None) -> Arch:
+    return (config or config_snapshot()).get_arch(line)
+
+
+@dataclass
+class ScanContext:
+    """Per-scan state, so one CrashScanner can serve concurrent scans"""
+    config: ConfigSnapshot
+    crash_identifiers: list[str]
+    crash_info: dict = field(default_factory=dict)
+    images_dict: dict[str, ImageBinary] = field(default_factory=dict)
+    version_in_stack: str | None = None
+
+    def to_result(self, stack_blocks: list) -> ScanResult:
+        return ScanResult(
+            crash_info=self.crash_info or {},
+            stack_blocks=stack_blocks or [],
+            version_in_stack=self.version_in_stack or '',
+            images_dict=self.images_dict or {}
+        )
 
 
 class CrashScanner:
-    def __init__(self):
-        self.crash_info = {}
-        self.images_dict: dict[str, ImageBinary] = {}
-        self.keys_in_stack: list = []
-        self.CRASH_IDENTIFIERS = crash_identifiers()
-        self.version_in_stack = None
+    def __init__(self, config: ConfigSnapshot | None = None):
+        """
+        :param config: fixed config for this scanner, None follows config_snapshot(); assigning
+            self.config swaps it for the scans that start afterwards
+        """
+        self.config = config
         self.ips_converter = IPSConverter()
-        # self.binary_images_in_stack: dict[str, ImageBinary] = {}
 
-    def _reset(self):
-        self.crash_info = {}
-        self.version_in_stack = None
-        self.images_dict: dict = {}
-        self.keys_in_stack: list = []
-        # self.binary_images_in_stack: dict[str, ImageBinary] = {}
+    @property
+    def CRASH_IDENTIFIERS(self) -> tuple[str, ...]:
+        return (self.config or config_snapshot()).crash_identifiers
 
+    def new_context(self) -> ScanContext:
+        # every scan pins one snapshot, a reload in the middle of a scan does not affect it
+        config = self.config or config_snapshot()
+        return ScanContext(config=config, crash_identifiers=list(config.crash_identifiers))
 
     @staticmethod
     def is_info_line(crash_line: str, crash_identifiers: list):
@@ -172,55 +191,57 @@ class CrashScanner:
         return False, '', ''
 
     @staticmethod
-    def is_raw_stack_line(crash_line: str):
-        match = re.match(
-            stack_line_regex(),
-            crash_line.rstrip())
+    def is_raw_stack_line(crash_line: str, config: ConfigSnapshot | None = None):
+        match = (config or config_snapshot()).stack_line_regex.match(crash_line.rstrip())
         if match:
             return True, match.groups()
         else:
             return False, []
 
     @staticmethod
-    def is_symboled_line(crash_line: str):
-        match = re.search(symbolized_line_regex(), crash_line.rstrip())
+    def is_symboled_line(crash_line: str, config: ConfigSnapshot | None = None):
+        match = (config or config_snapshot()).symbolized_line_regex.search(crash_line.rstrip())
         if match:
             return True, match.groups()
         else:
             return False, []
 
     @staticmethod
-    def is_binary_image_line(crash_line: str):
-        match = re.fullmatch(binary_image_regex(), crash_line.rstrip())
+    def is_binary_image_line(crash_line: str, config: ConfigSnapshot | None = None):
+        match = (config or config_snapshot()).binary_image_regex.fullmatch(crash_line.rstrip())
         if match:
             return True, match.groups()
         else:
             return False, []
 
     @staticmethod
-    def is_thread_start_line(crash_line: str):
-        match = re.search(thread_start_regex(), crash_line.rstrip())
+    def is_thread_start_line(crash_line: str, config: ConfigSnapshot | None = None):
+        match = (config or config_snapshot()).thread_start_regex.search(crash_line.rstrip())
         if match:
             return True, match.groups() + (crash_line,)
         else:
             return False, []
 
     @staticmethod
-    def is_diag_line(crash_line: str):
-        match = re.search(diag_line_regex(), crash_line)
+    def is_diag_line(crash_line: str, config: ConfigSnapshot | None = None):
+        match = (config or config_snapshot()).diag_line_regex.search(crash_line)
         if match:
             return True, match.groups()
         else:
             return False, []
 
-    async def _scan_crash_line(self, crash_line: str, idx: int):
+    async def _scan_crash_line(self, crash_line: str, idx: int, ctx: ScanContext):
+        return self._scan_line(crash_line, idx, ctx)
+
+    def _scan_line(self, crash_line: str, idx: int, ctx: ScanContext):
         crash_line = crash_line.replace('\n', '')
         crash_line = crash_line.removeprefix('b\'')
         strip_crash_line = crash_line.strip()
         if not strip_crash_line:
             return ScannedLine(idx=idx, type=CrashLineType.BLANK, line=crash_line)
 
-        ok, thread_info_groups = CrashScanner.is_thread_start_line(strip_crash_line)
+        config = ctx.config
+        ok, thread_info_groups = CrashScanner.is_thread_start_line(strip_crash_line, config)
         if ok:
             (thread_idx, is_crash_info, _, is_backtrace_info, _) = thread_info_groups
             if is_backtrace_info:
@@ -239,12 +260,12 @@ class CrashScanner:
             )
             return sxx
 
-        ok, key, value = CrashScanner.is_info_line(strip_crash_line, self.CRASH_IDENTIFIERS)
+        ok, key, value = CrashScanner.is_info_line(strip_crash_line, ctx.crash_identifiers)
         if ok:
-            self.crash_info[key] = value
+            ctx.crash_info[key] = value
             return ScannedLine(idx=idx, type=CrashLineType.INFO, info=[(key, value)], line=strip_crash_line)
 
-        ok, stack_groups = CrashScanner.is_raw_stack_line(crash_line)
+        ok, stack_groups = CrashScanner.is_raw_stack_line(crash_line, config)
         if ok:
             (_, thread_idx, space1, image_name, space2, addr_to_symbolicate, space3, load_addr) = stack_groups
             return RawLine(
@@ -259,28 +280,28 @@ class CrashScanner:
                 space2=space2,
                 space3=space3
             )
-        ok, binary_image_groups = CrashScanner.is_binary_image_line(crash_line)
+        ok, binary_image_groups = CrashScanner.is_binary_image_line(crash_line, config)
         if ok:
             if len(binary_image_groups) == 5:
                 [load_addr, name_from_binary, arch, uuid, path] = binary_image_groups
                 image_name = os.path.basename(path) if path else ''
-                if not self.images_dict.get(image_name):
+                if not ctx.images_dict.get(image_name):
                     binary = ImageBinary(
                         uuid=uuid,
                         name=image_name,
                         loadAddress=load_addr,
                         name_from_binary=name_from_binary,
-                        binaryArc=get_arch(arch),
+                        binaryArc=config.get_arch(arch),
                     )
-                    self.images_dict[image_name] = binary
+                    ctx.images_dict[image_name] = binary
 
-                if str(crash_line).find(binary_with_version()) > 0:
+                if str(crash_line).find(config.binary_with_version) > 0:
                     version_in_stack = version_search(crash_line)
                     if version_in_stack:
-                        self.version_in_stack = version_in_stack
-                        self.crash_info['version'] = version_in_stack
+                        ctx.version_in_stack = version_in_stack
+                        ctx.crash_info['version'] = version_in_stack
             return ScannedLine(idx=idx, type=CrashLineType.BINARY, info=binary_image_groups, line=crash_line)
-        ok, symboled_groups = CrashScanner.is_symboled_line(crash_line)
+        ok, symboled_groups = CrashScanner.is_symboled_line(crash_line, config)
         if ok:
             (_, thread_idx, space1, image_name, space2, addr_to_symbolicate, space3, symbolized_func, _) = symboled_groups
             binary = ImageBinary(name=image_name) if image_name else None
@@ -296,7 +317,7 @@ class CrashScanner:
                 space2=space2,
                 space3=space3
             )
-        ok, diag_groups = CrashScanner.is_diag_line(crash_line)
+        ok, diag_groups = CrashScanner.is_diag_line(crash_line, config)
         if ok:
             (blanks, diag_idx, symbolized_func, image_name, addr_to_symbolicate) = diag_groups
             return DiagLine(
@@ -311,12 +332,16 @@ class CrashScanner:
             )
         return ScannedLine(idx=idx, type=CrashLineType.OTHERS, line=crash_line)
 
-    async def scan_crash_async(self, lines: list[str]):
-        tasks = [self._scan_crash_line(a_line, idx) for idx, a_line in enumerate(lines)]
+    async def scan_crash_async(self, lines: list[str], ctx: ScanContext | None = None):
+        ctx = ctx or self.new_context()
+        tasks = [self._scan_crash_line(a_line, idx, ctx) for idx, a_line in enumerate(lines)]
         results = await asyncio.gather(*tasks)
         return results
 
-    def _generate_result(self, results: list[ScannedLine]) -> ScanResult:
+    def _scan_lines(self, lines: Iterable[str], ctx: ScanContext) -> list[ScannedLine]:
+        return [self._scan_line(a_line, idx, ctx) for idx, a_line in enumerate(lines)]
+
+    def _generate_result(self, results: list[ScannedLine], ctx: ScanContext) -> ScanResult:
         stack_blocks = []
         _stack_lines = []
 
@@ -347,63 +372,180 @@ class CrashScanner:
                         stack_blocks.insert(0, block)
                     break
 
-        res = ScanResult(
-            crash_info=self.crash_info or {},
-            stack_blocks=stack_blocks or [],
-            version_in_stack=self.version_in_stack or '',
-            images_dict=self.images_dict or {}
-        )
-        return res
+        return ctx.to_result(stack_blocks)
 
-    def scan_crash(self, content: str | list[str]) -> ScanResult:
+    def scan_crash(self, content: str | Iterable[str]) -> ScanResult:
+        # line scanning is pure CPU work, it runs inline instead of on a private
+        # event loop so scans are reentrant and callable from a running loop
         lines = content.splitlines(keepends=True) if isinstance(content, str) else content
         start_code = time.monotonic()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            self._reset()
-            results = loop.run_until_complete(self.scan_crash_async(lines))
-            results.sort(key=lambda x: x.idx)
-            logger.info(f'[{__name__}.scan_crash] takes {time.monotonic() - start_code} seconds!')
-            return self._generate_result(results)
-        finally:
-            # 确保事件循环被正确关闭，释放资源
-            loop.close()
-
-    def scan_diagnostic(self, content: str | list[str]):
+        ctx = self.new_context()
+        results = self._scan_lines(lines, ctx)
+        elapsed = time.monotonic() - start_code
+        metrics.observe('scan_seconds', elapsed, format='crash')
+        logger.info(f'[{__name__}.scan_crash] takes {elapsed} seconds!')
+        return self._generate_result(results, ctx)
+
+    def scan_diagnostic(self, content: str | Iterable[str]):
         lines = content.splitlines(keepends=True) if isinstance(content, str) else content
         start_code = time.monotonic()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            self._reset()
-            results = loop.run_until_complete(self.scan_crash_async(lines))
-            logger.info(f'[{__name__}.scan_crash] takes {time.monotonic() - start_code} seconds!')
-            return self._generate_result(results)
-        finally:
-            # 确保事件循环被正确关闭，释放资源
-            loop.close()
-
-    def scan_file(self, file_path: str) -> ScanResult | None:
+        ctx = self.new_context()
+        results = self._scan_lines(lines, ctx)
+        elapsed = time.monotonic() - start_code
+        metrics.observe('scan_seconds', elapsed, format='diagnostic')
+        logger.info(f'[{__name__}.scan_diagnostic] takes {elapsed} seconds!')
+        return self._generate_result(results, ctx)
+
+    def _scan_ips_image(self, image: IPSImage, ctx: ScanContext) -> ImageBinary:
+        name = image.name or os.path.basename(image.path)
+        binary = ImageBinary(
+            uuid=image.uuid.lower(),
+            name=name,
+            loadAddress=f"0x{image.base:x}",
+            name_from_binary=image.CFBundleIdentifier or '',
+            binaryArc=ctx.config.get_arch(image.arch),
+        )
+        marker = ctx.config.binary_with_version
+        if marker and marker in f"{image.CFBundleIdentifier or ''} {image.path}":
+            # the fields the Binary Images line would show the version in
+            version_in_stack = version_search(' '.join(
+                filter(None, [image.CFBundleShortVersionString, image.CFBundleVersion, image.path])
+            ))
+            if version_in_stack:
+                ctx.version_in_stack = version_in_stack
+                ctx.crash_info['version'] = version_in_stack
+        return binary
+
+    def _scan_ips_frame(
+            self,
+            report: IPSReport,
+            frame_idx: int,
+            frame: IPSFrame,
+            images: list[ImageBinary | None],
+            idx: int
+    ) -> ScannedLine:
+        # one formatted Console line per frame, no reference to the report is kept
+        line = self.ips_converter._format_frame(report, frame_idx, frame)
+        image_index = frame.imageIndex
+        binary = images[image_index] if image_index is not None and image_index < len(images) else None
+        image_offset = frame.imageOffset
+        if binary is None or not isinstance(image_offset, int):
+            return ScannedLine(idx=idx, type=CrashLineType.OTHERS, line=line)
+
+        address = f"0x{int(binary.loadAddress, 16) + image_offset:x}"
+        # keep the same column layout as IPSConverter._format_frame
+        space2 = ' ' * max(30 - len(binary.name), 0) + '\t       '
+        symbol = frame.symbol
+        if symbol:
+            return SymbolizedLine(
+                idx=idx,
+                line=line,
+                binary=binary,
+                addressesToSymbolicate=address,
+                symbolizedRes=symbol,
+                threadIdx=frame_idx,
+                space1='   ',
+                space2=space2,
+            )
+        return RawLine(
+            idx=idx,
+            line=line,
+            binary=binary,
+            addressesToSymbolicate=address,
+            threadIdx=frame_idx,
+            space1='   ',
+            space2=space2,
+        )
+
+    def scan_ips(
+            self,
+            json_file_path: str | None = None,
+            ips_content: str | None = None,
+            max_threads: int | None = None
+    ) -> ScanResult:
+        """
+        Build the ScanResult straight from the IPS JSON. Frames and images come
+        from ``threads``/``usedImages``, so no Console text is rendered and
+        re-parsed; only the short header goes through the line scanner.
+        :param json_file_path: an .ips file path
+        :param ips_content: raw .ips content, used when no path is given
+        :param max_threads: keep the faulting thread plus this many others,
+            frames of the skipped threads are never decoded. None keeps all.
+        :return: ScanResult
+        """
+        start_code = time.monotonic()
+        ctx = self.new_context()
+        converter = self.ips_converter
+        report = converter.load(ips_content=ips_content, json_file_path=json_file_path)
+
+        images: list[ImageBinary | None] = []
+        for image in report.used_images:
+            binary = self._scan_ips_image(image, ctx)
+            images.append(binary)
+            if binary.name and not ctx.images_dict.get(binary.name):
+                ctx.images_dict[binary.name] = binary
+
+        header = [
+            converter._format_header(report),
+            converter._format_exception(report),
+            converter._format_application_specific_info(report),
+            converter._format_asi_backtraces(report)
+        ]
+        results: list[ScannedLine] = []
+        for section in header:
+            if not section:
+                continue
+            for a_line in section.splitlines():
+                results.append(self._scan_line(a_line, len(results), ctx))
+            results.append(ScannedLine(idx=len(results), type=CrashLineType.BLANK, line=''))
+
+        faulting_thread = report.data.get('faultingThread')
+        others = 0
+        for thread_idx, thread in enumerate(report.threads):
+            crashed = thread_idx == faulting_thread
+            if not crashed and max_threads is not None:
+                if others >= max_threads:
+                    continue
+                others += 1
+            thread_name = thread.get('name', '')
+            header_line = converter._format_thread_header(report, thread_idx, thread)
+            results.append(TheadLine(
+                idx=len(results),
+                info=[header_line],
+                line=header_line,
+                threadIdx=thread_idx,
+                threadName=thread_name,
+                crashed=crashed
+            ))
+            for frame_idx, frame in enumerate(thread.frames):
+                results.append(self._scan_ips_frame(report, frame_idx, frame, images, len(results)))
+
+        elapsed = time.monotonic() - start_code
+        metrics.observe('scan_seconds', elapsed, format='ips')
+        logger.info(f'[{__name__}.scan_ips] takes {elapsed} seconds!')
+        return self._generate_result(results, ctx)
+
+    def scan_file(self, file_path: str, max_threads: int | None = None) -> ScanResult | None:
         """
         :param file_path: a crash file path
+        :param max_threads: for .ips files, scan the faulting thread plus this many others
         :return:  """
         if not file_path or not os.path.exists(file_path):
             raise Exception(f'File {file_path} does not exist')
         if file_path.endswith('.ips'):
-            logger.info(f'[{__name__}.scan_file] is extracting ips file {file_path}...')
-            content = self.ips_converter.convert(json_file_path=file_path)
-            logger.info(f'[{__name__}.scan_file] is scanning crash file {file_path}...')
-            lines = content.splitlines(keepends=False) if isinstance(content, str) else content
-            return self.scan_crash(lines)
+            logger.info(f'[{__name__}.scan_file] is scanning ips file {file_path}...')
+            return self.scan_ips(json_file_path=file_path, max_threads=max_threads)
         elif file_path.endswith('.diag') or file_path.endswith('.spin') or file_path.endswith('.crash') or file_path.endswith('.rtf'):
             logger.info(f'[{__name__}.scan_file] is extracting diag/spin file {file_path}...')
-            content = safe_read_file(file_path)
-            return self.scan_diagnostic(content)
+            # lines are streamed from disk, large spindumps are never held in memory as one string
+            return self.scan_diagnostic(iter_file_lines(file_path))
             # content = diag_converter.convert_diag_to_text(diag_file_path=file_path)
             # lines = content.splitlines(keepends=False) if isinstance(content, str) else content
             logger.info(f'[{__name__}.scan_file] is scanning diagnostic file {file_path}...')
             # return self.scan_diagnostic(lines)
+        elif file_path.endswith('.txt'):
+            logger.info(f'[{__name__}.scan_file] is scanning crash text file {file_path}...')
+            return self.scan_crash(iter_file_lines(file_path))
 
 
 
@@ -0,0 +1,229 @@
+"""
+Crash signatures and buckets
+A signature is a stable hash of the top app frames of the crashed thread, with offsets,
+addresses, template arguments and parameter lists stripped, so the same crash in another
+report (or another build) gets the same signature. Buckets group reports by signature in
+an on-disk index keyed by the hash.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from MacAutoSymbolizer.src.scanner import (
+    DiagLine,
+    RawLine,
+    ScannedLine,
+    SymbolizedLine,
+    TheadLine,
+)
+from MacAutoSymbolizer.src.utilities import bucket_index_path, signature_top_frames
+
+logger = logging.getLogger(__name__)
+
+# hex digits of the sha1 kept as the signature
+SIGNATURE_LENGTH = 16
+
+_INLINED = re.compile(r'\s*\[inlined\]')
+# atos: "func (in Image) (file.cpp:12)", unsymbolized "0x1234 (in Image) + 12"
+_LOCATION = re.compile(r'\s+\((?:in\s+[^()]*|[^()]*:\d+)\)')
+_OFFSET = re.compile(r'\s+\+\s+(?:0x[0-9a-fA-F]+|\d+)')
+_TEMPLATE = re.compile(r'<[^<>]*>')
+_PARAMETERS = re.compile(r'\([^()]*\)')
+_ADDRESS = re.compile(r'0x[0-9a-fA-F]+')
+# compiler generated numbering: block_invoke_2, $_3, closure #1, foo.cold.1
+_NUMBERED = [
+    (re.compile(r'(block_invoke)(?:[._]\d+)+'), r'\1'),
+    (re.compile(r'\$_\d+'), '$_'),
+    (re.compile(r'#\d+'), '#'),
+    (re.compile(r'\.(?:cold|isra|part|constprop|llvm)\.\d+'), ''),
+]
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_symbol(symbol: str | None) -> str:
+    """
+    Reduce a symbolized frame to its function identity
+        'webex::Queue<int>::push(int const&) (in spark-core) (queue.cpp:42)' -> 'webex::Queue::push'
+    :return: '?' when the frame has no symbol
+    """
+    text = _INLINED.sub('', str(symbol or ''))
+    text = _LOCATION.sub('', text)
+    text = _OFFSET.sub('', text)
+    # innermost first, so nested arguments are removed completely
+    for pattern in (_TEMPLATE, _PARAMETERS):
+        while True:
+            text, count = pattern.subn('', text)
+            if not count:
+                break
+    for pattern, replacement in _NUMBERED:
+        text = pattern.sub(replacement, text)
+    text = _SPACES.sub(' ', _ADDRESS.sub('', text)).strip()
+    return text or '?'
+
+
+def _is_frame(line: ScannedLine) -> bool:
+    return isinstance(line, (RawLine, DiagLine))
+
+
+def crashed_block_index(stack_blocks: list[list]) -> int | None:
+    """The crashed thread, or the first block with frames when no thread is marked crashed (diagnostics)"""
+    first = None
+    for idx, block in enumerate(stack_blocks):
+        if not any(_is_frame(x) for x in block):
+            continue
+        if isinstance(block[0], TheadLine) and block[0].crashed:
+            return idx
+        if first is None:
+            first = idx
+    return first
+
+
+def _app_frames(frames: list) -> list:
+    """
+    Frames of images we have symbols for; before the dSYMs are resolved, frames the report
+    left unsymbolized; frames of a crash entirely in system libraries as a last resort
+    """
+    app = [x for x in frames if x.binary and x.binary.pathToDSYMFile]
+    if not app:
+        app = [x for x in frames if isinstance(x, RawLine) and not isinstance(x, SymbolizedLine)]
+    return app or frames
+
+
+@dataclass(frozen=True)
+class CrashSignature:
+    hash: str
+    frames: tuple[str, ...]  # 'image!function' of the frames the hash covers
+
+    def __str__(self):
+        return self.hash
+
+
+def signature_of(packages: list[str], functions: list[str], top_n: int | None = None) -> CrashSignature | None:
+    """
+    :param packages: image names, top frame first
+    :param functions: symbolized frames, parallel to packages
+    :return: None when none of the top frames has a symbol, such a hash would group unrelated crashes
+    """
+    top_n = top_n or signature_top_frames()
+    frames = tuple(f'{package}!{normalize_symbol(function)}' for package, function in zip(packages, functions))[:top_n]
+    if not frames or all(x.endswith('!?') for x in frames):
+        return None
+    digest = hashlib.sha1('\n'.join(frames).encode('utf-8')).hexdigest()[:SIGNATURE_LENGTH]
+    return CrashSignature(hash=digest, frames=frames)
+
+
+def crash_frames(stack_blocks: list[list], crashed: int | None = None) -> tuple[list[str], list[str]]:
+    """
+    App frames of the crashed thread
+    :param crashed: index of the crashed block, found with crashed_block_index when None
+    :return: (image names, symbolized frames), top frame first
+    """
+    if crashed is None:
+        crashed = crashed_block_index(stack_blocks)
+    if crashed is None:
+        return [], []
+    frames = _app_frames([x for x in stack_blocks[crashed] if _is_frame(x)])
+    return (
+        [x.binary.name if x.binary else '' for x in frames],
+        [x.symbolizedRes if x.isSymbolized else '' for x in frames]
+    )
+
+
+def crash_signature(stack_blocks: list[list], top_n: int | None = None, crashed: int | None = None) -> CrashSignature | None:
+    """Signature of a symbolized report, see crash_frames"""
+    return signature_of(*crash_frames(stack_blocks, crashed), top_n)
+
+
+def crash_tag(packages: list[str], functions: list[str], top_n: int | None = None) -> list[str]:
+    """Tags of a crash: its signature, then the images of the frames it covers"""
+    signature = signature_of(packages, functions, top_n)
+    if not signature:
+        return []
+    return [signature.hash] + list(dict.fromkeys(x.split('!', 1)[0] for x in signature.frames))
+
+
+@dataclass
+class Bucket:
+    signature: str
+    frames: list[str]
+    count: int
+    symbolized: bool  # a report of this bucket has been fully symbolized
+    version: str  # of the latest report
+    arch: str
+    first_seen: float
+    last_seen: float
+
+
+class BucketIndex:
+    """
+    Reports grouped by signature, in SQLite (WAL mode) so several processes can share it
+    :param path: database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'signature TEXT PRIMARY KEY, frames TEXT NOT NULL, count INTEGER NOT NULL, '
+                'symbolized INTEGER NOT NULL, version TEXT, arch TEXT, first_seen REAL, last_seen REAL)'
+            )
+
+    @classmethod
+    def from_config(cls) -> 'BucketIndex | None':
+        """The index at [signature] index_path, None when it is not configured"""
+        path = bucket_index_path()
+        return cls(path) if path else None
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a new connection per call, usable from any thread; committed and closed on exit
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _bucket(row) -> Bucket:
+        signature, frames, count, symbolized, version, arch, first_seen, last_seen = row
+        return Bucket(signature, frames.split('\n'), count, bool(symbolized), version, arch, first_seen, last_seen)
+
+    def lookup(self, signature: str) -> Bucket | None:
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM buckets WHERE signature = ?', (signature,)).fetchone()
+        return self._bucket(row) if row else None
+
+    def add(self, signature: CrashSignature, version: str, arch: str, symbolized: bool) -> Bucket:
+        """Count one more report in the bucket of signature, creating it if needed"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO buckets VALUES (?, ?, 1, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(signature) DO UPDATE SET count = count + 1, '
+                'symbolized = MAX(symbolized, excluded.symbolized), version = excluded.version, '
+                'arch = excluded.arch, last_seen = excluded.last_seen',
+                (signature.hash, '\n'.join(signature.frames), int(symbolized), version, getattr(arch, 'value', arch), now, now)
+            )
+            row = conn.execute('SELECT * FROM buckets WHERE signature = ?', (signature.hash,)).fetchone()
+        return self._bucket(row)
+
+    def buckets(self, limit: int = 50) -> list[Bucket]:
+        """Largest buckets first"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT * FROM buckets ORDER BY count DESC, last_seen DESC LIMIT ?', (limit,)).fetchall()
+        return [self._bucket(x) for x in rows]
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM buckets').fetchone()[0]
@@ -0,0 +1,299 @@
+"""
+Near-duplicate crash clustering
+Crash signatures (see signature.py) only group identical top frames. Here a crashed thread
+is a set of shingles, runs of consecutive normalized frames, sketched with MinHash; LSH
+banding over the sketches finds reports whose stacks overlap mostly, e.g. the same crash
+with an extra inlined frame or a shifted frame, without comparing against every report.
+"""
+
+import logging
+import zlib
+from collections.abc import Iterable
+
+import numpy as np
+
+from MacAutoSymbolizer.src.scanner import CrashScanner, DiagLine, RawLine
+from MacAutoSymbolizer.src.signature import crashed_block_index, normalize_symbol
+
+logger = logging.getLogger(__name__)
+
+# frames from the top of the crashed thread that are compared
+MAX_FRAMES = 32
+# frames per shingle
+SHINGLE_SIZE = 2
+
+_SHIFT = np.uint64(32)
+# odd constants combining the token hashes of a shingle
+_SHINGLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SHINGLE_FINAL = np.uint64(0xBF58476D1CE4E5B9)
+# stacks sketched per numpy step, bounds the temporary (num_perm x shingles) array
+_CHUNK = 2048
+# token hashes kept between calls, tokens repeat a lot across stacks
+_TOKEN_CACHE_SIZE = 1 << 20
+
+
+def stack_tokens(stack_blocks: list[list], max_frames: int = MAX_FRAMES) -> list[str]:
+    """
+    'image!function' of the top frames of the crashed thread, like WordFrequency picks the
+    names out of a stack but per frame, so order and image are kept
+    """
+    crashed = crashed_block_index(stack_blocks)
+    if crashed is None:
+        return []
+    frames = [x for x in stack_blocks[crashed] if isinstance(x, (RawLine, DiagLine))][:max_frames]
+    return [
+        f'{x.binary.name if x.binary else ""}!{normalize_symbol(x.symbolizedRes if x.isSymbolized else "")}'
+        for x in frames
+    ]
+
+
+def text_tokens(output: str, max_frames: int = MAX_FRAMES) -> list[str]:
+    """stack_tokens of a symbolized output, e.g. from the web result cache or the batch CLI"""
+    scan_res = CrashScanner().scan_crash(output)
+    return stack_tokens(scan_res.stack_blocks, max_frames) if scan_res else []
+
+
+class MinHashLSH:
+    """
+    MinHash sketches with LSH banding
+    :param num_perm: hash functions per sketch; a sketch keeps the low 16 bits of each
+        minimum (b-bit MinHash), num_perm * 2 bytes per stack
+    :param bands: LSH bands, num_perm must be a multiple; stacks with Jaccard similarity
+        around (1 / bands) ** (bands / num_perm) (0.71 by default) or more become candidates
+    :param threshold: estimated similarity for candidates to count as near duplicates
+    :param seed: of the hash functions, sketches are only comparable with the same seed
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.7,
+                 shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f'num_perm {num_perm} is not a multiple of bands {bands}')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+        # multiply-shift hashing: the high 32 bits of a * h + b mod 2**64, a odd
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64)
+        # odd multipliers combining the rows of a band into one 64 bit key
+        self._band_mix = rng.integers(1, 1 << 63, self.rows, dtype=np.uint64) | np.uint64(1)
+
+        self.keys: list[str] = []
+        self._key_idx: dict[str, int] = {}
+        self._sketches = np.empty((0, num_perm), dtype=np.uint16)
+        self._size = 0
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(bands)]
+        self._token_hashes: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_idx
+
+    # --- sketches --- #
+    def _token_hash(self, token: str) -> int:
+        value = self._token_hashes.get(token)
+        if value is None:
+            if len(self._token_hashes) >= _TOKEN_CACHE_SIZE:
+                self._token_hashes.clear()
+            value = self._token_hashes[token] = zlib.crc32(token.encode('utf-8'))
+        return value
+
+    def _shingle_hashes(self, token_lists: list[list[str]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Shingle i of a stack covers tokens i .. i + shingle_size - 1, a stack shorter than
+        shingle_size is one shingle
+        :return: (32 bit hash per shingle, shingles per stack)
+        """
+        lengths = np.fromiter((len(x) for x in token_lists), dtype=np.int64, count=len(token_lists))
+        tokens = np.fromiter(
+            (self._token_hash(x) for a_list in token_lists for x in a_list), dtype=np.uint64, count=int(lengths.sum())
+        )
+        counts = np.where(lengths > 0, np.maximum(lengths - self.shingle_size + 1, 1), 0)
+        if not len(tokens):
+            return np.empty(0, dtype=np.uint64), counts
+
+        ends = np.repeat(np.cumsum(lengths), counts)
+        first_shingle = np.cumsum(counts) - counts
+        starts = np.repeat(np.cumsum(lengths) - lengths - first_shingle, counts) + np.arange(counts.sum())
+        hashes = np.zeros(len(starts), dtype=np.uint64)
+        for offset in range(self.shingle_size):
+            idx = starts + offset
+            valid = idx < ends
+            # wraps around mod 2**64 on purpose; +1 keeps a missing token apart from a token hashing to 0
+            hashes = hashes * _SHINGLE_MIX + np.where(valid, tokens[np.minimum(idx, len(tokens) - 1)] + np.uint64(1), 0)
+        return (hashes * _SHINGLE_FINAL) >> _SHIFT, counts
+
+    def sketch_many(self, token_lists: list[list[str]]) -> np.ndarray:
+        """:return: (len(token_lists), num_perm) uint16, rows of stacks without tokens are all 0xFFFF"""
+        hashes, counts = self._shingle_hashes(token_lists)
+        sketches = np.full((len(token_lists), self.num_perm), 0xFFFF, dtype=np.uint16)
+        ends = np.cumsum(counts)
+        for first in range(0, len(token_lists), _CHUNK):
+            last = min(first + _CHUNK, len(token_lists))
+            start, stop = ends[first] - counts[first], ends[last - 1]
+            if start == stop:
+                continue
+            # (num_perm, shingles): the minimum per stack runs over contiguous memory
+            values = np.multiply.outer(self._a, hashes[start:stop])
+            values += self._b[:, None]
+            values >>= _SHIFT
+            non_empty = np.flatnonzero(counts[first:last]) + first
+            minimums = np.minimum.reduceat(values, ends[non_empty] - counts[non_empty] - start, axis=1)
+            sketches[non_empty] = (minimums & np.uint64(0xFFFF)).T
+        return sketches
+
+    def sketch(self, tokens: list[str]) -> np.ndarray:
+        return self.sketch_many([tokens])[0]
+
+    def _band_keys(self, sketches: np.ndarray) -> np.ndarray:
+        """:return: (len(sketches), bands) uint64"""
+        banded = sketches.reshape(len(sketches), self.bands, self.rows).astype(np.uint64)
+        # wraps around on overflow, which is fine for a hash
+        return (banded * self._band_mix).sum(axis=2, dtype=np.uint64)
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray | float:
+        """Estimated Jaccard similarity, b can hold several sketches"""
+        return (a == b).mean(axis=-1)
+
+    # --- index --- #
+    def add(self, key: str, tokens: list[str]) -> bool:
+        """:return: False when the stack has no tokens or key is already indexed"""
+        return self.add_many([key], [tokens]) == 1
+
+    def add_many(self, keys: list[str], token_lists: list[list[str]]) -> int:
+        """Sketch and index a batch, much faster than add() per stack. :return: number added"""
+        new = [
+            (key, tokens) for key, tokens in dict(zip(keys, token_lists)).items()
+            if tokens and key not in self._key_idx
+        ]
+        if not new:
+            return 0
+        sketches = self.sketch_many([tokens for _, tokens in new])
+        self._append([key for key, _ in new], sketches)
+        return len(new)
+
+    def _append(self, keys: list[str], sketches: np.ndarray):
+        first = self._size
+        needed = first + len(keys)
+        if needed > len(self._sketches):
+            grown = np.empty((max(needed, 2 * len(self._sketches), 1024), self.num_perm), dtype=np.uint16)
+            grown[:first] = self._sketches[:first]
+            self._sketches = grown
+        self._sketches[first:needed] = sketches
+        self._size = needed
+        for idx, key in enumerate(keys, first):
+            self._key_idx[key] = idx
+        self.keys.extend(keys)
+
+        band_keys = self._band_keys(sketches)
+        for band, buckets in enumerate(self._buckets):
+            for idx, band_key in enumerate(band_keys[:, band].tolist(), first):
+                buckets.setdefault(band_key, []).append(idx)
+
+    def rebuild(self, items: Iterable[tuple[str, list[str]]], batch_size: int = 10000) -> int:
+        """
+        Drop the index and add items, e.g. all historical results, in batches
+        :param items: (key, tokens)
+        :return: number of indexed stacks
+        """
+        self.keys = []
+        self._key_idx = {}
+        self._sketches = np.empty((0, self.num_perm), dtype=np.uint16)
+        self._size = 0
+        self._buckets = [{} for _ in range(self.bands)]
+
+        keys, token_lists = [], []
+        for key, tokens in items:
+            keys.append(key)
+            token_lists.append(tokens)
+            if len(keys) >= batch_size:
+                self.add_many(keys, token_lists)
+                keys, token_lists = [], []
+        self.add_many(keys, token_lists)
+        logger.info(f'[{__name__}] indexed {self._size} stacks')
+        return self._size
+
+    def _candidates(self, sketch: np.ndarray) -> set[int]:
+        band_keys = self._band_keys(sketch[None, :])[0].tolist()
+        candidates = set()
+        for buckets, band_key in zip(self._buckets, band_keys):
+            candidates.update(buckets.get(band_key, ()))
+        return candidates
+
+    def query(self, tokens: list[str], threshold: float | None = None) -> list[tuple[str, float]]:
+        """
+        Indexed stacks similar to tokens
+        :return: (key, estimated similarity), most similar first
+        """
+        if not tokens:
+            return []
+        sketch = self.sketch(tokens)
+        candidates = np.fromiter(self._candidates(sketch), dtype=np.int64)
+        if not len(candidates):
+            return []
+        scores = self.similarity(sketch, self._sketches[candidates])
+        keep = scores >= (self.threshold if threshold is None else threshold)
+        order = np.argsort(-scores[keep], kind='stable')
+        return [(self.keys[i], float(s)) for i, s in zip(candidates[keep][order], scores[keep][order])]
+
+    def clusters(self, threshold: float | None = None, min_size: int = 2) -> list[list[str]]:
+        """
+        Group indexed stacks into clusters of near duplicates. Members of an LSH bucket are
+        compared with its first member, so the work grows with the index, not its square.
+        :return: clusters as lists of keys, largest first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        parent = list(range(self._size))
+
+        def find(x: int) -> int:
+            root = x
+            while parent[root] != root:
+                root = parent[root]
+            while parent[x] != root:
+                parent[x], x = root, parent[x]
+            return root
+
+        for buckets in self._buckets:
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                head = members[0]
+                others = np.asarray(members[1:])
+                scores = self.similarity(self._sketches[head], self._sketches[others])
+                for other in others[scores >= threshold].tolist():
+                    a, b = find(head), find(other)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+
+        groups: dict[int, list[str]] = {}
+        for idx in range(self._size):
+            groups.setdefault(find(idx), []).append(self.keys[idx])
+        return sorted((x for x in groups.values() if len(x) >= min_size), key=len, reverse=True)
+
+    # --- persistence --- #
+    def save(self, path: str):
+        """Sketches and keys only, the LSH buckets are recomputed on load"""
+        np.savez_compressed(
+            path,
+            sketches=self._sketches[:self._size],
+            keys=np.asarray(self.keys, dtype=str),
+            params=np.asarray([self.num_perm, self.bands, self.shingle_size, self.seed]),
+            threshold=np.asarray(self.threshold)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'MinHashLSH':
+        with np.load(path) as data:
+            num_perm, bands, shingle_size, seed = (int(x) for x in data['params'])
+            index = cls(num_perm, bands, float(data['threshold']), shingle_size, seed)
+            sketches = data['sketches']
+            keys = data['keys'].tolist()
+        if keys:
+            index._append(keys, sketches)
+        return index
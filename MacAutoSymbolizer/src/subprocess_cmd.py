@@ -1,6 +1,13 @@
-import asyncio.subprocess
 import asyncio
+import asyncio.subprocess
 import logging
+import os
+import signal
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from MacAutoSymbolizer.src import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -11,29 +18,104 @@ __version__ = "1.0"
 __date__    = "3 May 2024"
 
 
+# 每次从管道读取的字节数
+_READ_SIZE = 64 * 1024
+# 终止进程组后等待退出的时间，超过后强制kill
+_TERMINATE_GRACE = 5.0
+
+
+@dataclass
+class CommandStats:
+    """同一程序所有调用的累计统计"""
+    calls: int = 0
+    failures: int = 0        # 非0退出码
+    timeouts: int = 0
+    truncated: int = 0       # 输出超过上限被截断的次数
+    output_bytes: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        res = asdict(self)
+        res['mean_seconds'] = self.total_seconds / self.calls if self.calls else 0.0
+        return res
+
+
+_stats: dict[str, CommandStats] = {}
+_stats_lock = threading.Lock()
+
+
+def command_stats() -> dict[str, dict]:
+    """程序名 -> 统计，包括所有SubProcessCmd实例"""
+    with _stats_lock:
+        return {name: x.to_dict() for name, x in _stats.items()}
+
+
+def reset_command_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+async def _read_bounded(stream: asyncio.StreamReader | None, limit: int) -> tuple[bytes, bool]:
+    """
+    读取到EOF，最多保留limit字节
+    超出部分继续读取并丢弃，避免子进程因管道写满而阻塞
+    :return: (数据, 是否被截断)
+    """
+    if stream is None:
+        return b'', False
+    buffer = bytearray()
+    truncated = False
+    while data := await stream.read(_READ_SIZE):
+        room = limit - len(buffer)
+        if room > 0:
+            buffer += data[:room]
+        if len(data) > room:
+            truncated = True
+    return bytes(buffer), truncated
+
+
+def _decode(data: bytes) -> str:
+    # atos输出UTF-8，个别无法解码的字节替换掉，只解码一次
+    return data.decode('utf-8', errors='replace') if data else ''
+
+
 class SubProcessCmd:
     @classmethod
     def execute(cls, cmd: str, args_list: list, **kwargs):
+        max_concurrent = kwargs.pop('max_concurrent', None)
         process = cls(cmd, **kwargs)
-        process.result = asyncio.run(process.start(args_list))
+        process.result = asyncio.run(process.start(args_list, max_concurrent))
         return process
 
     def __init__(self, cmd:str, **kwargs):
         self._program = cmd
+        self._name = os.path.basename(cmd)
         self._kwargs = kwargs
 
         self._stdin = kwargs.pop(r'stdin') if r'stdin' in kwargs else None
         self._stdout = kwargs.pop(r'stdout') if r'stdout' in kwargs else asyncio.subprocess.PIPE
         self._stderr = kwargs.pop(r'stderr') if r'stderr' in kwargs else asyncio.subprocess.PIPE
-        
-        # 如果没有指定超时时间，使用配置文件中的默认值
+
+        # 如果没有指定超时时间和输出上限，使用配置文件中的默认值
         self._timeout = kwargs.pop(r'timeout') if r'timeout' in kwargs else None
-        if self._timeout is None:
-            try:
-                from MacAutoSymbolizer.src.resource_config import resource_config
+        self._max_output = kwargs.pop(r'max_output') if r'max_output' in kwargs else None
+        try:
+            from MacAutoSymbolizer.src.resource_config import resource_config
+            if self._timeout is None:
                 self._timeout = resource_config.subprocess_timeout
-            except ImportError:
-                self._timeout = 30  # 默认30秒超时
+            if self._max_output is None:
+                self._max_output = resource_config.max_subprocess_output_mb * 1024 * 1024
+        except ImportError:
+            self._timeout = self._timeout or 30  # 默认30秒超时
+            self._max_output = self._max_output or 8 * 1024 * 1024
+
+        # 不继承父进程的其他描述符；子进程单独成组，超时时连同它启动的进程一起终止
+        # 注意：close_fds和start_new_session会让CPython不走posix_spawn，macOS上也没有vfork，
+        # 每次调用atos仍然是fork；这里选择了可靠的按进程组终止，而不是更低的启动开销
+        self._kwargs.setdefault('close_fds', True)
+        if hasattr(os, 'killpg'):
+            self._kwargs.setdefault('start_new_session', True)
 
     @property
     def stdin(self):
@@ -47,8 +129,48 @@ class SubProcessCmd:
     def stderr(self):
         return self._stderr
 
+    @property
+    def stats(self) -> CommandStats:
+        with _stats_lock:
+            return _stats.setdefault(self._name, CommandStats())
+
+    def _record(self, elapsed: float, returncode: int | None, output_bytes: int = 0,
+                truncated: bool = False, timeout: bool = False):
+        with _stats_lock:
+            stats = _stats.setdefault(self._name, CommandStats())
+            stats.calls += 1
+            stats.failures += returncode not in (0, None)
+            stats.timeouts += timeout
+            stats.truncated += truncated
+            stats.output_bytes += output_bytes
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+        if timeout:
+            metrics.inc('subprocess_timeouts_total', command=self._name)
+        if truncated:
+            metrics.inc('subprocess_truncated_total', command=self._name)
+
+    def _signal(self, process: asyncio.subprocess.Process, sig: int):
+        """给子进程所在的进程组发信号，没有单独成组时只发给子进程"""
+        try:
+            if self._kwargs.get('start_new_session'):
+                os.killpg(process.pid, sig)
+            else:
+                process.send_signal(sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def _terminate(self, process: asyncio.subprocess.Process):
+        self._signal(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=_TERMINATE_GRACE)
+        except asyncio.TimeoutError:
+            self._signal(process, signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+            await process.wait()
+
     async def cmd(self, *args):
         process = None
+        start = time.perf_counter()
         try:
             process = await asyncio.create_subprocess_exec(
                 self._program,
@@ -58,57 +180,53 @@ class SubProcessCmd:
                 stderr=self._stderr,
                 **self._kwargs
             )
-            
-            # 添加超时控制，防止进程挂起导致资源泄漏
+            if process.stdin:
+                process.stdin.close()
+
+            # 添加超时控制，防止进程挂起导致资源泄漏；输出超过上限的部分丢弃
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(), 
+                (stdout, stdout_truncated), (stderr, stderr_truncated), _ = await asyncio.wait_for(
+                    asyncio.gather(
+                        _read_bounded(process.stdout, self._max_output),
+                        _read_bounded(process.stderr, self._max_output),
+                        process.wait()
+                    ),
                     timeout=self._timeout
                 )
             except asyncio.TimeoutError:
-                # 超时时强制终止进程
-                if process:
-                    process.terminate()
-                    try:
-                        await asyncio.wait_for(process.wait(), timeout=5.0)
-                    except asyncio.TimeoutError:
-                        process.kill()
-                        await process.wait()
+                # 超时时终止整个进程组
+                await self._terminate(process)
+                self._record(time.perf_counter() - start, None, timeout=True)
                 raise asyncio.TimeoutError(f"子进程执行超时: {self._program} {' '.join(args)}")
-            
-            # 尝试安全解码输出，处理可能的编码问题
-            def safe_decode(data):
-                if not data:
-                    return ""
-                
-                # 尝试多种编码方式
-                encodings = ['utf-8', 'latin1', 'cp1252', 'iso-8859-1']
-                
-                for encoding in encodings:
-                    try:
-                        return data.decode(encoding)
-                    except UnicodeDecodeError:
-                        continue
-                
-                # 如果所有编码都失败，使用 utf-8 并替换错误字符
-                return data.decode('utf-8', errors='replace')
-            
-            return process.returncode, safe_decode(stdout), safe_decode(stderr)
-            
-        except Exception as e:
-            # 确保进程被正确清理
+
+            truncated = stdout_truncated or stderr_truncated
+            if truncated:
+                logger.warning(f"[{__name__}] {self._name} 输出超过 {self._max_output} 字节，已截断")
+            self._record(time.perf_counter() - start, process.returncode, len(stdout) + len(stderr), truncated)
+            return process.returncode, _decode(stdout), _decode(stderr)
+
+        except (Exception, asyncio.CancelledError):
+            # 确保进程被正确清理（包括任务被取消的情况）
             if process and process.returncode is None:
                 try:
-                    process.terminate()
-                    await asyncio.wait_for(process.wait(), timeout=5.0)
-                except:
-                    try:
-                        process.kill()
-                        await process.wait()
-                    except:
-                        pass
+                    await self._terminate(process)
+                except (OSError, asyncio.CancelledError) as e:
+                    # 清理失败不掩盖原始异常
+                    logger.debug(f"[{__name__}] 清理子进程 {process.pid} 失败: {e!r}")
             raise
 
-    async def start(self, args_list):
-        tasks = [self.cmd(*x) for x in args_list]
-        return await asyncio.gather(*tasks)
+    async def start(self, args_list, max_concurrent: int | None = None):
+        """
+        并发执行多组参数，结果与args_list顺序一致
+        :param max_concurrent: 同时运行的子进程数，None时使用resource_config.max_concurrent_symbolize
+        """
+        if max_concurrent is None:
+            from MacAutoSymbolizer.src.resource_config import resource_config
+            max_concurrent = resource_config.max_concurrent_symbolize
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def run(args):
+            async with semaphore:
+                return await self.cmd(*args)
+
+        return await asyncio.gather(*[run(x) for x in args_list])
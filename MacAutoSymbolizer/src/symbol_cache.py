@@ -0,0 +1,142 @@
+"""
+Symbol cache
+atos results of earlier runs keyed by a hash of the frame: symbol set, arch, image and
+addresses, not the frame number or the rest of the report. Resubmitting an edited report,
+or another report of the same build, only sends the frames that changed to atos.
+Entries are dropped by age or, past a maximum count, oldest stored first.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+from MacAutoSymbolizer.src.scanner import ImageBinary, ScannedLine
+from MacAutoSymbolizer.src.utilities import Arch, config_snapshot
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of host parameters of one statement
+_QUERY_CHUNK = 500
+
+
+def line_hash(line: ScannedLine, symbol_dir: str, arch: Arch | str, image_dict: dict | None = None) -> str | None:
+    """
+    Cache key of a frame line, None for lines without an image or address
+    :param symbol_dir: extracted symbols of the report's version, see Symbolizer.download_symbols
+    :param image_dict: binary images of the report, fills in the load address and uuid of
+        frames that do not carry them (.diag)
+    """
+    binary: ImageBinary | None = getattr(line, 'binary', None)
+    address = getattr(line, 'addressesToSymbolicate', None)
+    if not binary or not address:
+        return None
+    image: ImageBinary | None = (image_dict or {}).get(binary.name)
+    load_address = binary.loadAddress or (image.loadAddress if image else '')
+    uuid = binary.uuid or (image.uuid if image else '')
+    binary_arch = binary.binaryArc or (image.binaryArc if image else None) or arch
+    key = '\0'.join([
+        os.path.abspath(symbol_dir), getattr(binary_arch, 'value', binary_arch),
+        binary.name, uuid.lower(), load_address, str(address)
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class SymbolCache:
+    """
+    atos output by line_hash, in SQLite (WAL mode) so several processes can share it
+    :param path: database file
+    :param max_entries: keep at most this many entries, the oldest stored go first; 0 means no limit
+    :param max_age_days: drop entries stored longer ago than this; 0 means no limit
+    """
+
+    def __init__(self, path: str, max_entries: int = 0, max_age_days: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS symbols ('
+                'hash TEXT PRIMARY KEY, symbol TEXT NOT NULL, created REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS symbols_created ON symbols (created)')
+
+    @classmethod
+    def from_config(cls) -> 'SymbolCache | None':
+        """The cache at [symbols] symbol_cache_path with its size limits, None when it is not configured"""
+        config = config_snapshot()
+        if not config.symbol_cache_path:
+            return None
+        return cls(
+            config.symbol_cache_path,
+            max_entries=config.symbol_cache_max_entries,
+            max_age_days=config.symbol_cache_max_age_days
+        )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a new connection per call, usable from any thread; committed and closed on exit
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, hashes: Iterable[str]) -> dict[str, str]:
+        hashes = list(dict.fromkeys(hashes))
+        # expired entries that were not pruned yet are misses too
+        oldest = time.time() - self.max_age_days * 86400 if self.max_age_days else 0
+        found = {}
+        with self._connect() as conn:
+            for i in range(0, len(hashes), _QUERY_CHUNK):
+                chunk = hashes[i:i + _QUERY_CHUNK]
+                rows = conn.execute(
+                    f'SELECT hash, symbol FROM symbols WHERE hash IN ({", ".join("?" * len(chunk))}) '
+                    'AND created >= ?', [*chunk, oldest]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, symbols: dict[str, str]) -> int:
+        if not symbols:
+            return 0
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO symbols VALUES (?, ?, ?)',
+                [(key, symbol, now) for key, symbol in symbols.items()]
+            )
+            self._prune(conn, now)
+        return len(symbols)
+
+    def prune(self) -> int:
+        """Drop the entries past max_age_days and max_entries, put_many does it after every write"""
+        with self._connect() as conn:
+            return self._prune(conn, time.time())
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> int:
+        removed = 0
+        if self.max_age_days:
+            removed += conn.execute('DELETE FROM symbols WHERE created < ?', (now - self.max_age_days * 86400,)).rowcount
+        if self.max_entries:
+            removed += conn.execute(
+                'DELETE FROM symbols WHERE hash IN '
+                '(SELECT hash FROM symbols ORDER BY created DESC LIMIT -1 OFFSET ?)', (self.max_entries,)
+            ).rowcount
+        if removed:
+            logger.debug(f'[{__name__}] pruned {removed} symbol cache entries')
+        return removed
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM symbols').fetchone()[0]
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM symbols')
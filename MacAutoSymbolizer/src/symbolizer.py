@@ -1,27 +1,26 @@
 import asyncio
 import logging
 import os
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import weakref
 logger = logging.getLogger(__name__)
 import time
-from typing import Callable
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator, Callable, Iterable
+from dataclasses import dataclass
 from pathlib import Path
 from MacAutoSymbolizer.src.utilities import (
     Arch,
-    version_full_match,
-    get_dst_information,
-    get_download_full_url,
-    get_atos_tool_path
+    ConfigSnapshot,
+    config_snapshot,
+    get_dst_information
 )
 from MacAutoSymbolizer.src.scanner import (
     CrashScanner,
     ScanResult,
-    get_arch,
     ScannedLine,
-    SymbolizedLine,
     DiagLine,
-    CrashLineType,
     RawLine,
+    TheadLine,
     ImageBinary
 )
 from MacAutoSymbolizer.src.advanced_downloader import (
@@ -29,36 +28,155 @@ from MacAutoSymbolizer.src.advanced_downloader import (
     SevenZipValidator
 )
 from MacAutoSymbolizer.src.subprocess_cmd import SubProcessCmd
-from MacAutoSymbolizer.src.resource_config import resource_config
+from MacAutoSymbolizer.src.signature import Bucket, BucketIndex, crash_signature, crashed_block_index
+from MacAutoSymbolizer.src.symbol_cache import SymbolCache, line_hash
+from MacAutoSymbolizer.src import metrics
+from MacAutoSymbolizer.src.resource_config import get_resource_config, LoopLocalSemaphore, InterProcessFileLock
+
+
+# addresses per atos call in batch mode
+ATOS_BATCH_SIZE = 256
+
+
+@dataclass
+class BatchReport:
+    """One crash report for Symbolizer.symbolize_many"""
+    content_or_path: str
+    version: str
+    arch: str
+    isBackup: bool = False
+
+
+def _is_frame_line(line: ScannedLine) -> bool:
+    return isinstance(line, (RawLine, DiagLine))
+
+
+def _is_unresolved_frame(line: ScannedLine) -> bool:
+    return _is_frame_line(line) and not line.isSymbolized
+
+
+def _is_block_symbolized(thread_block: list) -> bool:
+    """No frame of the block is left that atos could symbolize, call after the binaries are resolved"""
+    return not any(_is_unresolved_frame(a_line) and a_line.atos_args() for a_line in thread_block)
 
 
 class Symbolizer:
     def __init__(
             self,
             result_processor: Callable | None = None,
-            max_concurrent_symbolize: int = None  # 限制并发符号化任务数量，None时使用配置文件
+            max_concurrent_symbolize: int | None = None,  # 限制并发符号化任务数量，None时使用配置文件
+            bucket_index: BucketIndex | None = None,
+            config: ConfigSnapshot | None = None,
+            incremental: bool = False,
+            symbol_cache: SymbolCache | None = None
     ):
-        self.loop = asyncio.get_event_loop()
-        self.scanner = CrashScanner()
+        """
+        :param bucket_index: group reports by crash signature; reports of a bucket that was
+            already fully symbolized only get their crashed thread symbolized
+        :param incremental: leave frames that are already symbolized (in the report, or by an
+            earlier call) as they are and resolve binaries only for the images of the others;
+            by default every frame with a dSYM goes through atos again, for file and line info
+        :param symbol_cache: reuse atos results of earlier runs by line_hash, implies incremental
+        :param config: config of this symbolizer, None follows config_snapshot() and picks up
+            read_config reloads; assign self.config to swap it for the reports that start afterwards
+        """
+        self.scanner = CrashScanner(config)
+        resource_config = get_resource_config()
         
         # 使用配置文件中的设置，如果未指定参数的话
         if max_concurrent_symbolize is None:
             max_concurrent_symbolize = resource_config.max_concurrent_symbolize
         
         # 添加信号量来控制并发数量，防止创建过多文件句柄
-        self.symbolize_semaphore = asyncio.Semaphore(max_concurrent_symbolize)
+        # 不绑定事件循环，同一个Symbolizer可以在任意事件循环中使用
+        # 上限根据atos延迟、超时、文件描述符使用率和CPU负载在运行时调整
+        self.symbolize_semaphore = resource_config.symbolize_limiter(max_concurrent_symbolize)
         self.max_concurrent_symbolize = max_concurrent_symbolize
+        self.file_search_semaphore = LoopLocalSemaphore(resource_config.max_concurrent_file_search)
+        # 同一版本的符号文件只下载一次：{loop: {(version, arch, isBackup): Lock}}
+        self._download_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
         
         # 记录资源配置
         logger.info(f"符号化器初始化: 最大并发数={max_concurrent_symbolize}")
         # logger.debug(resource_config.get_config_summary())
         
+        self.downloader = self.create_downloader()
+        self.validator = SevenZipValidator()
+        atos_path = self.config.atos_tool_path()
+        self.sub_process_cmd = SubProcessCmd(atos_path)
+        self.bucket_index = bucket_index
+        self.symbol_cache = symbol_cache
+        self.incremental = incremental or symbol_cache is not None
+        logger.debug(f"使用 atos 工具路径: {atos_path}")
+
+    @property
+    def config(self) -> ConfigSnapshot:
+        return self.scanner.config or config_snapshot()
+
+    @config.setter
+    def config(self, config: ConfigSnapshot | None):
+        self.scanner.config = config
+
+    def _needs_symbol(self, line: ScannedLine) -> bool:
+        return _is_unresolved_frame(line) if self.incremental else _is_frame_line(line)
+
+    async def _restore_symbols(
+            self,
+            lines: list,
+            symbol_dir: str,
+            arch: Arch,
+            image_dict: dict | None = None
+    ) -> list[tuple[str, ScannedLine]]:
+        """
+        Fill in frames found in self.symbol_cache, before any binary is resolved
+        :return: (line hash, line) of the frames still to symbolize, for _store_symbols
+        """
+        if self.symbol_cache is None:
+            return []
+        keyed = []
+        for a_line in lines:
+            if self._needs_symbol(a_line):
+                key = line_hash(a_line, symbol_dir, arch, image_dict)
+                if key:
+                    keyed.append((key, a_line))
+        if not keyed:
+            return []
+        cached = await asyncio.to_thread(self.symbol_cache.get_many, [key for key, _ in keyed])
+        misses = []
+        for key, a_line in keyed:
+            symbol = cached.get(key)
+            if symbol is None:
+                misses.append((key, a_line))
+                continue
+            a_line.symbolizedRes = symbol
+            a_line.isSymbolized = True
+        metrics.inc('symbol_cache_lookups_total', len(keyed) - len(misses), result='hit')
+        metrics.inc('symbol_cache_lookups_total', len(misses), result='miss')
+        logger.info(f'[{__name__}] {len(keyed) - len(misses)} of {len(keyed)} frames from the symbol cache')
+        return misses
+
+    async def _store_symbols(self, misses: list[tuple[str, ScannedLine]]):
+        """Save the frames of _restore_symbols that have been symbolized since"""
+        symbols = {key: str(a_line.symbolizedRes) for key, a_line in misses if a_line.isSymbolized}
+        if self.symbol_cache is not None and symbols:
+            await asyncio.to_thread(self.symbol_cache.put_many, symbols)
+
+    @staticmethod
+    def create_downloader(
+            max_bytes_per_second: float | None = None,
+            max_concurrent_chunks: int = 10
+    ) -> AdvancedDownloader:
+        """
+        Downloader for the symbol server, credentials come from DOWNLOAD_USER/DOWNLOAD_PASSWORD
+        :param max_bytes_per_second: bandwidth cap, None means unlimited
+        :param max_concurrent_chunks: concurrent connections per download
+        """
         username = os.getenv('DOWNLOAD_USER')
         password = os.getenv('DOWNLOAD_PASSWORD')
         basic_token = AdvancedDownloader.create_basic_token(username, password) if username and password else None
-        self.downloader = AdvancedDownloader(
+        return AdvancedDownloader(
             chunk_size=8 * 1024 * 1024,  # 8MB chunks, suitable for large files
-            max_concurrent_chunks=10,  # 10 concurrent connections
+            max_concurrent_chunks=max_concurrent_chunks,
             timeout=600,  # 10 minutes timeout
             max_retries=5,  # 5 retries
             basic_token=basic_token,
@@ -66,35 +184,202 @@ class Symbolizer:
                 'User-Agent': 'AdvancedDownloader/1.0 (Mac-Auto-Symbols)',
                 'Accept': '*/*',
                 'Accept-Encoding': 'gzip, deflate, br',
-            }
+            },
+            max_bytes_per_second=max_bytes_per_second
         )
-        self.validator = SevenZipValidator()
-        atos_path = get_atos_tool_path()
-        self.sub_process_cmd = SubProcessCmd(atos_path)
-        logger.debug(f"使用 atos 工具路径: {atos_path}")
 
     async def symbolize_async(self, thread_block: list, symbol_dir: str, arch: Arch, image_dict: dict | None = None):
-        # 提取需要处理的二进制文件
-        image_binarys: list[ImageBinary] = [a_line.binary for a_line in thread_block if isinstance(a_line, RawLine) or isinstance(a_line, SymbolizedLine) or isinstance(a_line, DiagLine)]
-        
-        # 批量更新二进制文件信息，但控制并发数量
-        async def update_with_semaphore(binary):
+        res = await self.symbolize_blocks_async([thread_block], symbol_dir, arch, image_dict)
+        return res[0]
+
+    async def symbolize_blocks_async(
+            self,
+            stack_blocks: list[list],
+            symbol_dir: str,
+            arch: Arch,
+            image_dict: dict | None = None,
+            max_blocks: int | None = None,
+            time_budget: float | None = None,
+            frame_budget: int | None = None
+    ) -> list[list]:
+        """
+        Symbolize thread blocks in one pass: binaries are resolved once per
+        image, then blocks are scheduled by priority (see _plan_blocks) and
+        their frames fanned out under the shared semaphore.
+        :param max_blocks: symbolize at most this many blocks
+        :param time_budget: seconds to spend on atos, blocks not done by then stay unsymbolized
+        :param frame_budget: stop adding blocks once this many frames are planned
+        :return: all blocks in the order they were given
+        """
+        async for _ in self.iter_blocks_async(
+                stack_blocks, symbol_dir, arch, image_dict, max_blocks, time_budget, frame_budget
+        ):
+            pass
+        return [list(thread_block) for thread_block in stack_blocks]
+
+    async def iter_blocks_async(
+            self,
+            stack_blocks: list[list],
+            symbol_dir: str,
+            arch: Arch,
+            image_dict: dict | None = None,
+            max_blocks: int | None = None,
+            time_budget: float | None = None,
+            frame_budget: int | None = None
+    ) -> AsyncIterator[tuple[int, list]]:
+        """
+        Same scheduling as symbolize_blocks_async, but yields (index, block) as
+        soon as each block is symbolized. The highest priority block (the crashed
+        thread) comes first, the others follow in completion order, and blocks
+        that were not planned or ran out of time come last, unsymbolized.
+        """
+        lines = [a_line for thread_block in stack_blocks for a_line in thread_block]
+        misses = await self._restore_symbols(lines, symbol_dir, arch, image_dict)
+        await self._resolve_binaries(lines, symbol_dir, arch, image_dict)
+
+        planned = Symbolizer._plan_blocks(stack_blocks, max_blocks, frame_budget, self._needs_symbol)
+        logger.info(f'[{__name__}] symbolizing {len(planned)} of {len(stack_blocks)} thread blocks')
+
+        # 按优先级顺序创建任务，信号量先进先出，崩溃线程最先拿到atos
+        tasks = {asyncio.create_task(self._symbolize_block(stack_blocks[idx])): idx for idx in planned}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + time_budget if time_budget else None
+        yielded = set()
+        pending = set(tasks)
+        try:
+            while pending:
+                # 优先级最高的块必须最先返回
+                waiting = pending if yielded else {next(iter(tasks))}
+                timeout = max(deadline - loop.time(), 0) if deadline is not None else None
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.warning(f'[{__name__}] time budget {time_budget}s reached, '
+                                   f'{len(pending)} thread blocks left unsymbolized')
+                    break
+                for task in sorted(done, key=lambda x: planned.index(tasks[x])):
+                    pending.discard(task)
+                    task.result()
+                    yielded.add(tasks[task])
+                    yield tasks[task], stack_blocks[tasks[task]]
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            await self._store_symbols(misses)
+
+        for idx, thread_block in enumerate(stack_blocks):
+            if idx not in yielded:
+                yield idx, thread_block
+
+    @staticmethod
+    def _plan_blocks(
+            stack_blocks: list[list],
+            max_blocks: int | None = None,
+            frame_budget: int | None = None,
+            frame_filter: Callable[[ScannedLine], bool] = _is_frame_line
+    ) -> list[int]:
+        """
+        Pick the blocks worth symbolizing, most useful first: the crashed thread,
+        then threads with the most frames that have symbols (app-owned frames).
+        Call after the binaries are resolved.
+        :param frame_filter: frames still to symbolize
+        :return: indexes into stack_blocks, in priority order
+        """
+        candidates = []
+        for idx, thread_block in enumerate(stack_blocks):
+            app_frames = sum(1 for a_line in thread_block if frame_filter(a_line) and a_line.atos_args())
+            if not app_frames:
+                continue
+            crashed = bool(thread_block) and isinstance(thread_block[0], TheadLine) and thread_block[0].crashed
+            candidates.append((not crashed, -app_frames, idx))
+        candidates.sort()
+
+        planned = []
+        frames = 0
+        for _, negative_frames, idx in candidates:
+            if max_blocks and len(planned) >= max_blocks:
+                break
+            if frame_budget and planned and frames - negative_frames > frame_budget:
+                continue
+            planned.append(idx)
+            frames -= negative_frames
+        return planned
+
+    @asynccontextmanager
+    async def _symbolize_slot(self):
+        """Hold one slot of symbolize_semaphore, recording how long the wait for it took"""
+        if not metrics.enabled():
             async with self.symbolize_semaphore:
-                return await self._update_image_binary(binary, symbol_dir, arch, image_dict)
-        
-        tasks1 = [update_with_semaphore(binary) for binary in image_binarys]
-        await asyncio.gather(*tasks1)
-        
+                yield
+            return
+        start = time.perf_counter()
+        async with self.symbolize_semaphore:
+            metrics.observe('symbolize_queue_seconds', time.perf_counter() - start)
+            yield
+
+    async def _symbolize_block(self, thread_block: list):
         # 符号化处理也需要控制并发数量
         async def symbolize_with_semaphore(a_line):
-            async with self.symbolize_semaphore:
+            async with self._symbolize_slot():
                 return await self._symbolize_line(a_line)
-        
-        tasks2 = [symbolize_with_semaphore(a_line) for a_line in thread_block]
-        return await asyncio.gather(*tasks2)
+
+        return await asyncio.gather(*[symbolize_with_semaphore(a_line) for a_line in thread_block if self._needs_symbol(a_line)])
+
+    async def _resolve_binaries(
+            self,
+            lines: list,
+            symbol_dir: str,
+            arch: Arch,
+            image_dict: dict | None = None,
+            dsym_cache: dict | None = None
+    ):
+        """
+        :param dsym_cache: (name, name_from_binary) -> dSYM path, shared between
+            calls on the same symbol_dir so each image is searched once per batch
+        """
+        with metrics.timer('resolve_binaries_seconds'):
+            # 同一个image在不同frame中可能是同一个对象（ips），也可能是不同对象（文本）
+            binaries: dict[int, ImageBinary] = {}
+            for a_line in lines:
+                if self._needs_symbol(a_line) and a_line.binary:
+                    binaries.setdefault(id(a_line.binary), a_line.binary)
+            for binary in binaries.values():
+                Symbolizer._update_image_binary(binary, arch, image_dict)
+
+            # 每个image只搜索一次dSYM
+            search_keys = {
+                (binary.name, binary.name_from_binary)
+                for binary in binaries.values() if not binary.pathToDSYMFile
+            }
+            dsym_files = {}
+            if dsym_cache is not None:
+                dsym_files = {key: dsym_cache[key] for key in search_keys if key in dsym_cache}
+                search_keys -= dsym_files.keys()
+                metrics.inc('dsym_cache_hits_total', len(dsym_files))
+            if search_keys and os.path.exists(symbol_dir):
+                async def search_with_semaphore(key):
+                    async with self.file_search_semaphore:
+                        return key, await asyncio.to_thread(Symbolizer._find_dsym_file, symbol_dir, *key)
+
+                with metrics.timer('dsym_search_seconds'):
+                    found = dict(await asyncio.gather(*[search_with_semaphore(key) for key in search_keys]))
+                metrics.inc('dsym_searches_total', sum(1 for x in found.values() if x), result='found')
+                metrics.inc('dsym_searches_total', sum(1 for x in found.values() if not x), result='missing')
+                if dsym_cache is not None:
+                    dsym_cache.update(found)
+                dsym_files.update(found)
+            if not dsym_files:
+                return
+
+            for binary in binaries.values():
+                if not binary.pathToDSYMFile:
+                    dsym_file = dsym_files.get((binary.name, binary.name_from_binary))
+                    if dsym_file:
+                        binary.pathToDSYMFile = dsym_file
 
     @staticmethod
-    async def _update_image_binary(binary: ImageBinary, symbol_dir: str, arch: Arch, image_dict: dict | None = None):
+    def _update_image_binary(binary: ImageBinary, arch: Arch, image_dict: dict | None = None):
         if not binary:
             return
         if image_dict and binary.name in image_dict:
@@ -109,50 +394,118 @@ class Symbolizer:
                 binary.uuid = binary_from_dict.uuid
         if not binary.binaryArc:
             binary.binaryArc = arch
-        if not binary.pathToDSYMFile:
-            if os.path.exists(symbol_dir):
-                dsym_file = None
-                try:
-                    # 优化文件搜索：使用生成器表达式减少内存使用，限制搜索结果数量
-                    symbol_path = Path(symbol_dir)
-                    
-                    # 首先尝试搜索primary name，最多搜索5个结果避免过度消耗资源
-                    for i, f in enumerate(symbol_path.rglob(f'{binary.name}*')):
-                        if i >= 5:  # 限制搜索结果数量
-                            break
-                        if f.is_dir():
-                            dsym_file = str(f)
-                            break
-                    
-                    # 如果没找到且有备用名称，再尝试搜索backup name
-                    if not dsym_file and binary.name_from_binary:
-                        for i, f in enumerate(symbol_path.rglob(f'{binary.name_from_binary}*')):
-                            if i >= 5:  # 限制搜索结果数量
-                                break
-                            if f.is_dir():
-                                dsym_file = str(f)
-                                break
-                                
-                    if dsym_file:
-                        binary.pathToDSYMFile = dsym_file
-                    else:
-                        return
-                except (OSError, PermissionError) as e:
-                    # 处理文件系统错误，避免程序崩溃
-                    logger.warning(f"文件搜索出错: {e}")
-                    return
+
+    @staticmethod
+    def _find_dsym_file(symbol_dir: str, name: str, name_from_binary: str = '') -> str | None:
+        try:
+            # 优化文件搜索：使用生成器表达式减少内存使用，限制搜索结果数量
+            symbol_path = Path(symbol_dir)
+
+            # 首先尝试搜索primary name，如果没找到且有备用名称，再尝试搜索backup name
+            for search_name in (name, name_from_binary):
+                if not search_name:
+                    continue
+                for i, f in enumerate(symbol_path.rglob(f'{search_name}*')):
+                    if i >= get_resource_config().file_search_limit:  # 限制搜索结果数量
+                        break
+                    if f.is_dir():
+                        return str(f)
+        except (OSError, PermissionError) as e:
+            # 处理文件系统错误，避免程序崩溃
+            logger.warning(f"文件搜索出错: {e}")
+        return None
+
+    async def _atos(self, mode: str, *args) -> tuple[int, str, str]:
+        """Run atos, its latency and failures drive the adaptive symbolize limit"""
+        metrics.inc('atos_calls_total', mode=mode)
+        start = time.perf_counter()
+        error = None
+        try:
+            return await self.sub_process_cmd.cmd(*args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe('atos_seconds', elapsed, mode=mode)
+            self.symbolize_semaphore.record(elapsed, error, kind=mode)
 
     async def _symbolize_line(self, line: ScannedLine):
-        if isinstance(line, RawLine) or isinstance(line, SymbolizedLine) or isinstance(line, DiagLine):
-            cmd_args = line.cmd_args()
-            if cmd_args:
-                return_code, stdout, stderr = await self.sub_process_cmd.cmd(*cmd_args)
+        if self._needs_symbol(line):
+            atos_args = line.atos_args()
+            if atos_args:
+                _, stdout, _ = await self._atos('single', *atos_args)
                 useful_output = max(stdout.split('\n'), key=len)
                 line.symbolizedRes = useful_output
                 line.isSymbolized = True
         return line
 
 
+    async def _symbolize_lines_batched(self, lines: list) -> list[tuple[ScannedLine, BaseException]]:
+        """
+        Symbolize frame lines from any number of reports with one atos call per
+        binary image (up to ATOS_BATCH_SIZE addresses each). Frames that share an
+        image and address across reports are looked up once. A batch that fails
+        falls back to single lookups of its frames.
+        :return: (line, error) of the frames whose single lookup failed too
+        """
+        batches: dict[tuple, list] = {}
+        for a_line in lines:
+            atos_args = a_line.atos_args() if self._needs_symbol(a_line) else []
+            if atos_args:
+                # atos_args: [-arch, arch, -o, path, -l, loadAddress, address]
+                batches.setdefault(tuple(atos_args[:-1]), []).append(a_line)
+
+        async def run_batch(image_args: tuple, addresses: list[str]) -> dict[str, str]:
+            try:
+                async with self._symbolize_slot():
+                    metrics.observe('atos_batch_addresses', len(addresses))
+                    return_code, stdout, _ = await self._atos('batch', *image_args, *addresses)
+            except Exception as e:  # noqa: BLE001 - e.g. a timeout or spawn error, the frames are looked up one by one
+                metrics.inc('atos_batch_fallbacks_total')
+                logger.warning(f'[{__name__}] atos batch for {image_args[3]} failed: {e!r}, '
+                               f'falling back to single lookups')
+                return {}
+            # atos prints one line per address, in order
+            output = stdout.splitlines()
+            if return_code != 0 or len(output) != len(addresses):
+                metrics.inc('atos_batch_fallbacks_total')
+                logger.warning(f'[{__name__}] atos batch for {image_args[3]} returned {len(output)} lines '
+                               f'for {len(addresses)} addresses, falling back to single lookups')
+                return {}
+            return dict(zip(addresses, output))
+
+        chunks = []
+        for image_args, image_lines in batches.items():
+            addresses = list(dict.fromkeys(str(a_line.addressesToSymbolicate) for a_line in image_lines))
+            for i in range(0, len(addresses), ATOS_BATCH_SIZE):
+                chunks.append((image_args, addresses[i:i + ATOS_BATCH_SIZE]))
+        logger.info(f'[{__name__}] symbolizing {len(lines)} frames with {len(chunks)} atos batches')
+
+        results = await asyncio.gather(*[run_batch(image_args, addresses) for image_args, addresses in chunks])
+        result_by_image: dict[tuple, dict] = {image_args: {} for image_args in batches}
+        for (image_args, _), result in zip(chunks, results):
+            result_by_image[image_args].update(result)
+
+        fallback = []
+        for image_args, image_lines in batches.items():
+            result = result_by_image[image_args]
+            for a_line in image_lines:
+                output = result.get(str(a_line.addressesToSymbolicate))
+                if output is None:
+                    fallback.append(a_line)
+                    continue
+                a_line.symbolizedRes = output
+                a_line.isSymbolized = True
+
+        async def symbolize_with_semaphore(a_line):
+            async with self._symbolize_slot():
+                return await self._symbolize_line(a_line)
+
+        errors = await asyncio.gather(*[symbolize_with_semaphore(a_line) for a_line in fallback],
+                                      return_exceptions=True)
+        return [(a_line, error) for a_line, error in zip(fallback, errors) if isinstance(error, BaseException)]
+
     @staticmethod
     def _cleanup_old_downloads(dst_dir: str, max_folders: int = 10):
         """
@@ -202,26 +555,63 @@ class Symbolizer:
         except Exception as e:
             logger.warning(f"Failed to cleanup old downloads: {e}")
 
+    def _download_lock(self, version: str, arch: Arch, isBackup: bool) -> asyncio.Lock:
+        locks = self._download_locks.setdefault(asyncio.get_running_loop(), {})
+        return locks.setdefault((version, arch, isBackup), asyncio.Lock())
+
+    @staticmethod
+    def symbols_cached(version: str, arch: Arch) -> bool:
+        """Whether the symbols of this version are already downloaded and extracted"""
+        dst_dir, _ = get_dst_information(version, arch)
+        return os.path.exists(dst_dir) and next(Path(dst_dir).rglob('*.dSYM'), None) is not None
+
     async def download_symbols(
             self,
             version: str,
             arch: Arch,
-            isBackup: bool = False
+            isBackup: bool = False,
+            downloader: AdvancedDownloader | None = None
     ) -> tuple[bool, str | None]:
+        """
+        :param downloader: used instead of self.downloader, e.g. a bandwidth capped one for prefetching
+        """
         if not version or not arch:
             raise ValueError("Version and architecture must be specified")
-        url = get_download_full_url(version, arch, isBackup)
-        dst_dir, filepath = get_dst_information(version, arch)
+        # 并发请求同一版本时，只有第一个请求下载，其余请求等待后直接复用
+        # 文件锁在多个worker进程之间做同样的事，它们共享同一个符号目录
+        async with self._download_lock(version, arch, isBackup):
+            lock_path = os.path.join(self.config.symbol_dir, '.locks', f'{version}_{arch}.lock')
+            async with InterProcessFileLock(lock_path):
+                ok, dst_dir = await self._download_symbols(version, arch, isBackup, downloader)
+        if not ok:
+            metrics.inc('symbol_downloads_total', result='failed')
+        return ok, dst_dir
+
+    async def _download_symbols(
+            self,
+            version: str,
+            arch: Arch,
+            isBackup: bool = False,
+            downloader: AdvancedDownloader | None = None
+    ) -> tuple[bool, str | None]:
+        config = self.config
+        url = config.download_url(version, arch, isBackup)
+        dst_dir, filepath = config.dst_information(version, arch)
         if os.path.exists(dst_dir):
             dsym_files = list(Path(dst_dir).rglob('*.dSYM'))
             if dsym_files:
                 logger.info(f"✅ Symbols already exist in {dst_dir}")
                 logger.info(f"📂 Found {len(dsym_files)} .dSYM files, skipping download")
+                metrics.inc('symbol_downloads_total', result='cached')
+                # the cleanup removes the oldest folders first, a version in use counts as new
+                Path(dst_dir).parent.touch()
                 return True, dst_dir
 
 
-        # Clean up old downloads before starting new download
-        Symbolizer._cleanup_old_downloads(dst_dir, max_folders=10)
+        # Clean up old downloads before starting new download, [symbols] max_downloaded_versions <= 0 keeps all
+        max_folders = config.max_downloaded_versions
+        if max_folders > 0:
+            Symbolizer._cleanup_old_downloads(dst_dir, max_folders=max_folders)
 
         os.makedirs(dst_dir, exist_ok=True)
 
@@ -241,7 +631,7 @@ class Symbolizer:
             start_time = time.time()
 
             try:
-                success = await self.downloader.download_file(url, filepath)
+                success = await (downloader or self.downloader).download_file(url, filepath)
                 end_time = time.time()
 
                 # Clear progress display - no logging needed for this
@@ -255,18 +645,22 @@ class Symbolizer:
                     logger.info(f"📊 File size: {AdvancedDownloader._format_size(file_size)}")
                     logger.info(f"⏱️  Total time: {duration:.1f}s")
                     logger.info(f"⚡ Average speed: {AdvancedDownloader._format_size(avg_speed)}/s")
+                    metrics.observe('symbol_download_seconds', duration)
 
                     # Validate 7z file
                     logger.info("🔍 Validating 7z file integrity...")
 
 
-                    if self.validator.validate_7z_file(filepath):
+                    with metrics.timer('validate_seconds'):
+                        valid = self.validator.validate_7z_file(filepath)
+                    if valid:
                         logger.info("✅ 7z file validation passed")
 
                         # Calculate file hash
                         logger.info("🔐 Calculating file hash...")
-                        md5_hash = self.validator.calculate_file_hash(filepath, 'md5')
-                        sha256_hash = self.validator.calculate_file_hash(filepath, 'sha256')
+                        with metrics.timer('validate_seconds'):
+                            md5_hash = self.validator.calculate_file_hash(filepath, 'md5')
+                            sha256_hash = self.validator.calculate_file_hash(filepath, 'sha256')
 
                         logger.info(f"📝 MD5: {md5_hash}")
                         logger.info(f"📝 SHA256: {sha256_hash}")
@@ -274,7 +668,8 @@ class Symbolizer:
                         # Extract 7z file contents
                         logger.info("📦 Extracting 7z file contents...")
                         try:
-                            extraction_success = SevenZipValidator.extract_7z_file(filepath, dst_dir)
+                            with metrics.timer('extract_seconds'):
+                                extraction_success = SevenZipValidator.extract_7z_file(filepath, dst_dir)
                             if extraction_success:
                                 logger.info("✅ 7z file extracted successfully")
 
@@ -291,6 +686,7 @@ class Symbolizer:
                             logger.error(f"❌ 7z file extraction error: {e}")
                             logger.info("💡 7z file is valid but extraction failed, keeping the file for manual extraction")
 
+                        metrics.inc('symbol_downloads_total', result='downloaded')
                         return True, dst_dir
 
                     else:
@@ -324,43 +720,310 @@ class Symbolizer:
                     return False, None
         return False, None
 
-    def symbolize(
+    def scan(self, content_or_path: str) -> ScanResult:
+        if os.path.exists(content_or_path):
+            return self.scanner.scan_file(content_or_path)
+        return self.scanner.scan_crash(content_or_path)
+
+    async def _scan_report(
             self,
             content_or_path: str,
             version: str,
-            arch: str,
-            isBackup: bool = False
-    ):
+            arch: str
+    ) -> tuple[ScanResult, str, Arch]:
         if not content_or_path:
             raise Exception("Empty content_or_path provided for symbolization.")
-        if not version or not version_full_match(version):
+        config = self.config
+        if not version or not config.version_full_match(version):
             raise Exception("Invalid or unsupported version format. version should be later than 44.0.0.0000")
         version = version.strip()
         if not arch:
             raise Exception("Empty architecture provided.")
-        if os.path.exists(content_or_path):
-            scan_res: ScanResult = self.scanner.scan_file(content_or_path)
-        else:
-            scan_res: ScanResult = self.scanner.scan_crash(content_or_path)
+
+        # 扫描是纯CPU操作，放到线程中避免阻塞事件循环
+        scan_res: ScanResult = await asyncio.to_thread(self.scan, content_or_path)
 
         if scan_res:
             if scan_res.crash_info and scan_res.crash_info.get('version'):
                 version = scan_res.crash_info.get('version')
 
-        arch: Arch = get_arch(arch) or Arch.osx
-        ok, symbol_dir = self.loop.run_until_complete(self.download_symbols(
-            version=version,
-            arch=arch,
-            isBackup=isBackup
-        ))
+        arch: Arch = config.get_arch(arch) or Arch.osx
+        return scan_res, version, arch
+
+    async def _prepare_report(
+            self,
+            content_or_path: str,
+            version: str,
+            arch: str,
+            isBackup: bool = False
+    ) -> tuple[ScanResult, str, str, Arch]:
+        with metrics.timer('report_stage_seconds', stage='scan'):
+            scan_res, version, arch = await self._scan_report(content_or_path, version, arch)
+        with metrics.timer('report_stage_seconds', stage='download'):
+            ok, symbol_dir = await self.download_symbols(
+                version=version,
+                arch=arch,
+                isBackup=isBackup
+            )
         if not ok:
             raise Exception("Failed to download or validate symbol files.")
-        res: list = []
-        for thread_block in scan_res.stack_blocks[:10]:
-            res.append(self.loop.run_until_complete(self.symbolize_async(thread_block, symbol_dir, arch, scan_res.images_dict)))
+        return scan_res, version, symbol_dir, arch
 
-        logger.debug('Symbolization process completed')
+    async def symbolize_async_report(
+            self,
+            content_or_path: str,
+            version: str,
+            arch: str,
+            isBackup: bool = False
+    ) -> list[list]:
+        """
+        Scan, download symbols and symbolize a crash report on the running event loop.
+        A single Symbolizer can serve any number of concurrent calls.
+        :param content_or_path: crash content or a crash file path
+        :param version: app version, overridden by the version found in the report
+        :param arch: 'arm64' or 'x86_64'
+        :param isBackup: download symbols from the backup server
+        :return: symbolized thread blocks
+        """
+        res, _ = await self.symbolize_report_async(content_or_path, version, arch, isBackup)
         return res
 
+    async def symbolize_report_async(
+            self,
+            content_or_path: str,
+            version: str,
+            arch: str,
+            isBackup: bool = False
+    ) -> tuple[list[list], bool]:
+        """
+        Same as symbolize_async_report, and also tells whether the result is complete.
+        A result is partial when blocks were cut by stack_block_limit, symbol_frame_budget
+        or symbol_time_budget, or when a bucket hit only symbolized the crashed thread.
+        :return: (thread blocks, every block was fully symbolized)
+        """
+        if self.bucket_index is not None:
+            res, _, complete = await self._symbolize_bucketed(content_or_path, version, arch, isBackup)
+            return res, complete
+        config = self.config
+        scan_res, _, symbol_dir, arch = await self._prepare_report(content_or_path, version, arch, isBackup)
+        with metrics.timer('report_stage_seconds', stage='symbolize'):
+            res: list = await self.symbolize_blocks_async(
+                scan_res.stack_blocks,
+                symbol_dir,
+                arch,
+                scan_res.images_dict,
+                max_blocks=config.stack_block_limit,
+                time_budget=config.symbol_time_budget,
+                frame_budget=config.symbol_frame_budget
+            )
 
+        logger.debug('Symbolization process completed')
+        return res, all(_is_block_symbolized(thread_block) for thread_block in res)
 
+    async def symbolize_bucketed_async(
+            self,
+            content_or_path: str,
+            version: str,
+            arch: str,
+            isBackup: bool = False
+    ) -> tuple[list[list], Bucket | None]:
+        """
+        Symbolize the crashed thread first and look its signature up in self.bucket_index.
+        The other threads are only symbolized when the bucket is new or has not been fully
+        symbolized yet, repeats of a known crash cost one thread's worth of atos calls.
+        :return: (thread blocks, the bucket of the report or None without a signature)
+        """
+        res, bucket, _ = await self._symbolize_bucketed(content_or_path, version, arch, isBackup)
+        return res, bucket
+
+    async def _symbolize_bucketed(
+            self,
+            content_or_path: str,
+            version: str,
+            arch: str,
+            isBackup: bool = False
+    ) -> tuple[list[list], Bucket | None, bool]:
+        """symbolize_bucketed_async, plus whether every block of the result was fully symbolized"""
+        config = self.config
+        scan_res, version, symbol_dir, arch = await self._prepare_report(content_or_path, version, arch, isBackup)
+        stack_blocks = scan_res.stack_blocks
+        with metrics.timer('report_stage_seconds', stage='symbolize'):
+            crashed = crashed_block_index(stack_blocks)
+            signature = None
+            bucket = None
+            if crashed is not None:
+                # the other blocks are resolved in symbolize_blocks_async, if they are symbolized at all
+                crashed_block = stack_blocks[crashed]
+                misses = await self._restore_symbols(crashed_block, symbol_dir, arch, scan_res.images_dict)
+                await self._resolve_binaries(crashed_block, symbol_dir, arch, scan_res.images_dict)
+                await self._symbolize_block(crashed_block)
+                await self._store_symbols(misses)
+                signature = crash_signature(stack_blocks, crashed=crashed)
+            if signature and self.bucket_index is not None:
+                bucket = await asyncio.to_thread(self.bucket_index.lookup, signature.hash)
+
+            others = [thread_block for idx, thread_block in enumerate(stack_blocks) if idx != crashed]
+            if bucket and bucket.symbolized:
+                metrics.inc('crash_bucket_lookups_total', result='hit')
+                logger.info(f'[{__name__}] crash {signature} seen {bucket.count} times, '
+                            f'skipping {len(stack_blocks) - 1} other thread blocks')
+                complete = True
+                # the other blocks were left as scanned, the output itself is partial
+                output_complete = not others
+            else:
+                metrics.inc('crash_bucket_lookups_total', result='miss' if signature else 'unsigned')
+                max_blocks = config.stack_block_limit
+                if max_blocks and crashed is not None:
+                    max_blocks -= 1
+                complete = not others
+                if others and (max_blocks or not config.stack_block_limit):
+                    await self.symbolize_blocks_async(
+                        others,
+                        symbol_dir,
+                        arch,
+                        scan_res.images_dict,
+                        max_blocks=max_blocks,
+                        time_budget=config.symbol_time_budget,
+                        frame_budget=config.symbol_frame_budget
+                    )
+                    # blocks cut by the block limit, frame or time budget still have frames to symbolize
+                    complete = all(_is_block_symbolized(thread_block) for thread_block in others)
+                output_complete = complete
+
+            if signature and self.bucket_index is not None:
+                # a bucket only counts as symbolized once every thread of a report was
+                bucket = await asyncio.to_thread(self.bucket_index.add, signature, version, arch, complete)
+        return [list(thread_block) for thread_block in stack_blocks], bucket, output_complete
+
+    async def symbolize_iter(
+            self,
+            content_or_path: str,
+            version: str,
+            arch: str,
+            isBackup: bool = False
+    ) -> AsyncIterator[tuple[int, list]]:
+        """
+        Streaming variant of symbolize_async_report: yields (index, block) as
+        soon as each block is done, the crashed thread first. ``index`` is the
+        position of the block in the full report.
+        """
+        config = self.config
+        scan_res, _, symbol_dir, arch = await self._prepare_report(content_or_path, version, arch, isBackup)
+        async for idx, thread_block in self.iter_blocks_async(
+                scan_res.stack_blocks,
+                symbol_dir,
+                arch,
+                scan_res.images_dict,
+                max_blocks=config.stack_block_limit,
+                time_budget=config.symbol_time_budget,
+                frame_budget=config.symbol_frame_budget
+        ):
+            yield idx, thread_block
+        logger.debug('Symbolization process completed')
+
+    async def symbolize_many_async(
+            self,
+            reports: Iterable[BatchReport | tuple],
+            return_exceptions: bool = False
+    ) -> list:
+        """
+        Symbolize a batch of crash reports together. Reports are grouped by
+        (version, arch, isBackup) so every symbol set is downloaded and every
+        dSYM searched once, then the frames of all reports are merged into one
+        atos call per binary image.
+        :param reports: BatchReport items or (content_or_path, version, arch[, isBackup]) tuples
+        :param return_exceptions: put a failed report's exception in its slot
+            instead of raising it, like asyncio.gather
+        :return: symbolized thread blocks per report, in input order
+        """
+        reports = [x if isinstance(x, BatchReport) else BatchReport(*x) for x in reports]
+        results: list = [None] * len(reports)
+        config = self.config
+
+        scanned = await asyncio.gather(
+            *[self._scan_report(x.content_or_path, x.version, x.arch) for x in reports],
+            return_exceptions=True
+        )
+        groups: dict[tuple, list[int]] = {}
+        for idx, res in enumerate(scanned):
+            if isinstance(res, BaseException):
+                results[idx] = res
+            elif not res[0]:
+                results[idx] = Exception(f'Unsupported crash report: {reports[idx].content_or_path[:100]}')
+            else:
+                _, version, arch = res
+                groups.setdefault((version, arch, reports[idx].isBackup), []).append(idx)
+        logger.info(f'[{__name__}] symbolizing {len(reports)} reports in {len(groups)} version groups')
+
+        dsym_caches: dict[str, dict] = {}
+        misses: list[tuple[str, ScannedLine]] = []
+        # id of a frame line -> index of its report, to fail only the report of a failed lookup
+        line_owners: dict[int, int] = {}
+
+        async def prepare_group(version: str, arch: Arch, isBackup: bool, idxs: list[int]) -> list:
+            error = None
+            try:
+                ok, symbol_dir = await self.download_symbols(version=version, arch=arch, isBackup=isBackup)
+                if not ok:
+                    error = Exception("Failed to download or validate symbol files.")
+            except Exception as e:  # noqa: BLE001 - becomes the result of every report of the group
+                error = e
+            if error:
+                for idx in idxs:
+                    results[idx] = error
+                return []
+
+            frame_lines = []
+            dsym_cache = dsym_caches.setdefault(symbol_dir, {})
+            for idx in idxs:
+                scan_res = scanned[idx][0]
+                stack_blocks = scan_res.stack_blocks
+                lines = [a_line for thread_block in stack_blocks for a_line in thread_block]
+                misses.extend(await self._restore_symbols(lines, symbol_dir, arch, scan_res.images_dict))
+                await self._resolve_binaries(lines, symbol_dir, arch, scan_res.images_dict, dsym_cache)
+                planned = Symbolizer._plan_blocks(stack_blocks, config.stack_block_limit, config.symbol_frame_budget,
+                                                  self._needs_symbol)
+                report_lines = [a_line for i in planned for a_line in stack_blocks[i] if self._needs_symbol(a_line)]
+                line_owners.update((id(a_line), idx) for a_line in report_lines)
+                frame_lines += report_lines
+                results[idx] = stack_blocks
+            return frame_lines
+
+        with metrics.timer('report_stage_seconds', stage='prepare_batch'):
+            frame_lines = await asyncio.gather(*[prepare_group(*key, idxs) for key, idxs in groups.items()])
+        with metrics.timer('report_stage_seconds', stage='symbolize_batch'):
+            failed = await self._symbolize_lines_batched([a_line for group in frame_lines for a_line in group])
+        for a_line, error in failed:
+            idx = line_owners[id(a_line)]
+            if not isinstance(results[idx], BaseException):
+                results[idx] = error
+        await self._store_symbols(misses)
+
+        if not return_exceptions:
+            for res in results:
+                if isinstance(res, BaseException):
+                    raise res
+        return results
+
+    def symbolize_many(
+            self,
+            reports: Iterable[BatchReport | tuple],
+            return_exceptions: bool = False
+    ) -> list:
+        """Synchronous wrapper of symbolize_many_async, not for use inside a running event loop"""
+        return asyncio.run(self.symbolize_many_async(reports, return_exceptions))
+
+    def symbolize(
+            self,
+            content_or_path: str,
+            version: str,
+            arch: str,
+            isBackup: bool = False
+    ):
+        """Synchronous wrapper of symbolize_async_report, not for use inside a running event loop"""
+        return asyncio.run(self.symbolize_async_report(
+            content_or_path=content_or_path,
+            version=version,
+            arch=arch,
+            isBackup=isBackup
+        ))
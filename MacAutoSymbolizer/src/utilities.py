@@ -4,8 +4,11 @@ import logging
 import subprocess
 import shutil
 import configparser
+import codecs
+import threading
+from collections.abc import Iterator
+from dataclasses import dataclass, field
 from enum import Enum
-from pydantic import BaseModel
 
 # --- Constants --- #
 ROOT_DIR = os.path.abspath(os.curdir)
@@ -30,16 +33,130 @@ DEFAULT_CRASH_IDENTIFIERS = [
 
 
 # --- Config --- #
-Config = configparser.ConfigParser()
-def read_config(path: str = None):
+def _default_config_path() -> str:
+    return os.path.join(ROOT_DIR, 'config.ini')
+
+
+class LazyConfigParser(configparser.ConfigParser):
+    """
+    Reads config.ini of the working directory the first time an option is looked up, unless
+    read_config was called before, so importing the package does no file access. Without a
+    config.ini, lookups with a fallback= return the fallback and the others raise.
+    `generation` changes on every read or set, so snapshots built from it can tell they are stale.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._generation = 0
+        super().__init__(*args, **kwargs)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def generation(self) -> int:
+        self._ensure_loaded(required=False)
+        return self._generation
+
+    def _ensure_loaded(self, required: bool = True) -> bool:
+        """:return: whether a config is loaded, False only when config.ini is missing and not required"""
+        if self._loaded:
+            return True
+        with self._load_lock:
+            if not self._loaded:
+                path = _default_config_path()
+                if not os.path.exists(path):
+                    if required:
+                        raise FileNotFoundError(f'Invalid path: {path}, run in the directory of config.ini or call read_config')
+                    return False
+                self.read(path)
+        return True
+
+    def read(self, filenames, encoding=None):
+        res = super().read(filenames, encoding)
+        self._loaded = True
+        self._generation += 1
+        return res
+
+    def read_file(self, f, source=None):
+        super().read_file(f, source)
+        self._loaded = True
+        self._generation += 1
+
+    def set(self, section, option, value=None):
+        super().set(section, option, value)
+        self._generation += 1
+
+    def remove_option(self, section, option) -> bool:
+        self._generation += 1
+        return super().remove_option(section, option)
+
+    def remove_section(self, section) -> bool:
+        self._generation += 1
+        return super().remove_section(section)
+
+    def get(self, section, option, **kwargs):
+        if not self._ensure_loaded(required='fallback' not in kwargs):
+            return kwargs['fallback']
+        return super().get(section, option, **kwargs)
+
+    def getint(self, section, option, **kwargs):
+        if not self._ensure_loaded(required='fallback' not in kwargs):
+            return kwargs['fallback']
+        return super().getint(section, option, **kwargs)
+
+    def getfloat(self, section, option, **kwargs):
+        if not self._ensure_loaded(required='fallback' not in kwargs):
+            return kwargs['fallback']
+        return super().getfloat(section, option, **kwargs)
+
+    def getboolean(self, section, option, **kwargs):
+        if not self._ensure_loaded(required='fallback' not in kwargs):
+            return kwargs['fallback']
+        return super().getboolean(section, option, **kwargs)
+
+    def has_section(self, section) -> bool:
+        self._ensure_loaded()
+        return super().has_section(section)
+
+    def has_option(self, section, option) -> bool:
+        self._ensure_loaded()
+        return super().has_option(section, option)
+
+    def sections(self) -> list[str]:
+        self._ensure_loaded()
+        return super().sections()
+
+    def options(self, section) -> list[str]:
+        self._ensure_loaded()
+        return super().options(section)
+
+    def items(self, *args, **kwargs):
+        self._ensure_loaded()
+        return super().items(*args, **kwargs)
+
+    def __getitem__(self, key):
+        self._ensure_loaded()
+        return super().__getitem__(key)
+
+
+Config = LazyConfigParser()
+def read_config(path: str | None = None) -> 'ConfigSnapshot':
+    """
+    Read config.ini into Config and swap in a new snapshot of it; calling it again reloads
+    :return: the new snapshot
+    """
     if not path:
-        path = os.path.join(ROOT_DIR, 'config.ini')
+        path = _default_config_path()
 
     if path:
         if os.path.exists(path):
             Config.read(path)
         else:
-            raise Exception(f'Invalid path: {path}')
+            raise FileNotFoundError(f'Invalid path: {path}')
+    return config_snapshot()
 
 
 # --- Enums --- #
@@ -48,6 +165,183 @@ class Arch(str, Enum):
     arm = 'arm64'
 
 
+# --- Config snapshot --- #
+def _compile(regex: str) -> re.Pattern | None:
+    return re.compile(regex) if regex else None
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Immutable, typed view of a config: regexes compiled and URL templates resolved once, so
+    the per-line and per-frame paths never parse config. A CrashScanner or Symbolizer keeps
+    the snapshot it was given, or follows config_snapshot(); a scan uses one snapshot from
+    start to end, so swapping in a new one never mixes two configs inside a report.
+    """
+    # [regex]
+    stack_line_regex: re.Pattern
+    symbolized_line_regex: re.Pattern
+    binary_image_regex: re.Pattern
+    thread_start_regex: re.Pattern
+    diag_line_regex: re.Pattern
+    arch_x86_regex: re.Pattern
+    arch_arm64_regex: re.Pattern
+    version_full_regex: re.Pattern | None
+    # [constants]
+    crash_identifiers: tuple[str, ...]
+    thread_identifier: str
+    binary_with_version: str
+    stack_block_limit: int
+    symbol_time_budget: float
+    symbol_frame_budget: int
+    # [symbols]
+    symbol_dir: str
+    symbol_zip: str
+    atos_path: str
+    max_cached_symbol_count: int
+    max_downloaded_versions: int
+    symbol_cache_path: str
+    symbol_cache_max_entries: int
+    symbol_cache_max_age_days: float
+    # [signature]
+    signature_top_frames: int
+    bucket_index_path: str
+    # [prefetch]
+    prefetch_versions: tuple[str, ...]
+    prefetch_archs: tuple[str, ...]
+    prefetch_max_bandwidth_mb: float
+    prefetch_window: str
+    prefetch_history_size: int
+    prefetch_interval_minutes: int
+    # {(arch, isBackup): url with a {version} placeholder}, only the configured ones
+    url_templates: dict[tuple[str, bool], str] = field(repr=False)
+    generation: int = 0
+
+    @classmethod
+    def from_parser(cls, parser: configparser.ConfigParser) -> 'ConfigSnapshot':
+        generation = getattr(parser, 'generation', 0)
+        regex = parser['regex']
+        if parser.has_option('constants', 'crash_identifiers'):
+            identifiers = parser.get('constants', 'crash_identifiers').split(', ')
+            identifiers.append(parser.get('constants', 'thread_identifier', fallback=CRASH_THREAD_IDENTIFIERS))
+        else:
+            identifiers = DEFAULT_CRASH_IDENTIFIERS
+        symbol_zip = parser.get('symbols', 'symbol_zip')
+
+        def url_template(arch: Arch, isBackup: bool) -> str:
+            suffix = '_backup' if isBackup else ''
+            base_url = parser.get('symbols', f'url_{"arm64" if arch == Arch.arm else "x86"}{suffix}', fallback=None)
+            url = parser.get('symbols', f'symbol_file_format{suffix}', fallback=None)
+            if base_url is None or url is None:
+                return ''
+            # {version} stays, it is the only part that changes per download
+            return url.replace('{base_url}', base_url).replace('{symbol_zip}', symbol_zip)
+
+        def split(value: str) -> tuple[str, ...]:
+            return tuple(x.strip() for x in value.split(',') if x.strip())
+
+        templates = {
+            (arch.value, isBackup): url_template(arch, isBackup) for arch in Arch for isBackup in (False, True)
+        }
+
+        return cls(
+            stack_line_regex=re.compile(regex['stack_line_regex']),
+            symbolized_line_regex=re.compile(regex['symbolized_line_regex']),
+            binary_image_regex=re.compile(regex['binary_image_regex']),
+            thread_start_regex=re.compile(regex['thread_start_regex']),
+            diag_line_regex=re.compile(regex['diag_line_regex']),
+            arch_x86_regex=re.compile(regex['arch_x86_regex']),
+            arch_arm64_regex=re.compile(regex['arch_arm64_regex']),
+            version_full_regex=_compile(regex.get('version_full_regex', '')),
+            crash_identifiers=tuple(identifiers),
+            thread_identifier=parser.get('constants', 'thread_identifier', fallback=CRASH_THREAD_IDENTIFIERS),
+            binary_with_version=parser.get('constants', 'binary_with_version', fallback=''),
+            stack_block_limit=parser.getint('constants', 'symbol_thread_count', fallback=10),
+            symbol_time_budget=parser.getfloat('constants', 'symbol_time_budget', fallback=0),
+            symbol_frame_budget=parser.getint('constants', 'symbol_frame_budget', fallback=0),
+            symbol_dir=parser.get('symbols', 'symbol_dir'),
+            symbol_zip=symbol_zip,
+            atos_path=parser.get('symbols', 'atos_path', fallback=''),
+            max_cached_symbol_count=parser.getint('symbols', 'max_cached_symbol_count', fallback=10),
+            max_downloaded_versions=parser.getint('symbols', 'max_downloaded_versions', fallback=10),
+            symbol_cache_path=parser.get('symbols', 'symbol_cache_path', fallback='').strip(),
+            symbol_cache_max_entries=parser.getint('symbols', 'symbol_cache_max_entries', fallback=0),
+            symbol_cache_max_age_days=parser.getfloat('symbols', 'symbol_cache_max_age_days', fallback=0),
+            signature_top_frames=parser.getint('signature', 'top_frames', fallback=5),
+            bucket_index_path=parser.get('signature', 'index_path', fallback='').strip(),
+            prefetch_versions=split(parser.get('prefetch', 'versions', fallback='')),
+            prefetch_archs=split(parser.get('prefetch', 'archs', fallback='arm64, x86_64')),
+            prefetch_max_bandwidth_mb=parser.getfloat('prefetch', 'max_bandwidth_mb', fallback=0),
+            prefetch_window=parser.get('prefetch', 'window', fallback='').strip(),
+            prefetch_history_size=parser.getint('prefetch', 'history_size', fallback=3),
+            prefetch_interval_minutes=parser.getint('prefetch', 'interval_minutes', fallback=0),
+            url_templates={key: url for key, url in templates.items() if url},
+            generation=generation,
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> 'ConfigSnapshot':
+        """A snapshot of another config file, independent of Config"""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'Invalid path: {path}')
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        return cls.from_parser(parser)
+
+    def version_full_match(self, version: str) -> str | None:
+        match_obj = self.version_full_regex.fullmatch(version) if self.version_full_regex else None
+        return match_obj.group() if match_obj else None
+
+    def get_arch(self, line: str) -> Arch | None:
+        line = line.lower().rstrip() if line else ''
+        if line and self.arch_x86_regex.search(line):
+            return Arch.osx
+        if self.arch_arm64_regex.search(line):
+            return Arch.arm
+        return None
+
+    def download_url(self, version: str, arch: Arch, isBackup: bool) -> str:
+        arch = Arch.arm if arch == Arch.arm else Arch.osx
+        template = self.url_templates.get((arch.value, bool(isBackup)))
+        if not template:
+            suffix = '_backup' if isBackup else ''
+            raise ValueError(f'No symbol url for {arch.value}, set url_{"arm64" if arch == Arch.arm else "x86"}{suffix} '
+                             f'and symbol_file_format{suffix} in [symbols]')
+        return template.replace('{version}', version)
+
+    def dst_information(self, version: str, architecture: Arch, ndi: bool = False) -> tuple[str, str]:
+        if ndi:
+            dst_dir = os.path.join(self.symbol_dir, f'{version}_backup', architecture)
+        else:
+            dst_dir = os.path.join(self.symbol_dir, version, architecture)
+        return dst_dir, os.path.join(dst_dir, self.symbol_zip)
+
+    def atos_tool_path(self) -> str:
+        """MAC_SYMBOLIZER_ATOS, then atos_path, then atos from PATH"""
+        return os.getenv('MAC_SYMBOLIZER_ATOS') or self.atos_path or 'atos'
+
+
+_snapshot: ConfigSnapshot | None = None
+_snapshot_lock = threading.Lock()
+
+
+def config_snapshot() -> ConfigSnapshot:
+    """
+    The snapshot of Config. It is built once and rebuilt only after Config changed (read_config,
+    set_symbol_dir, ...); the new one replaces the old in a single assignment, holders of the
+    old one keep using it.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None or snapshot.generation != Config.generation:
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.generation != Config.generation:
+                snapshot = ConfigSnapshot.from_parser(Config)
+                _snapshot = snapshot
+    return snapshot
+
+
 def version_search(version: str):
     matchObj = re.search(r'(4[4-9].[1-9][0-2]?|43.1[1-2]).0.[0-9]+', version)
     if matchObj:
@@ -56,36 +350,29 @@ def version_search(version: str):
 
 
 def version_full_match(version: str):
-    regex = Config.get('regex', 'version_full_regex')
-    if regex:
-        match_obj = re.fullmatch(regex, version)
-        if match_obj:
-            return match_obj.group()
-    return None
+    return config_snapshot().version_full_match(version)
 
 
 def stack_block_limit() -> int:
-    return Config.getint('constants', 'symbol_thread_count')
+    return config_snapshot().stack_block_limit
+
+
+def symbol_time_budget() -> float:
+    # seconds, 0 means no limit
+    return config_snapshot().symbol_time_budget
+
+
+def symbol_frame_budget() -> int:
+    # frames sent to atos per report, 0 means no limit
+    return config_snapshot().symbol_frame_budget
 
 
 def crash_identifiers() -> list:
-    identifiers = []
-    if Config.has_option('constants', 'crash_identifiers'):
-        identifiers += str(Config.get('constants', 'crash_identifiers')).split(', ')
-    else:
-        return DEFAULT_CRASH_IDENTIFIERS
-    if Config.has_option('constants', 'thread_identifier'):
-        identifiers.append(Config.get('constants', 'thread_identifier'))
-    else:
-        identifiers.append(CRASH_THREAD_IDENTIFIERS)
-    return identifiers
+    return list(config_snapshot().crash_identifiers)
 
 
 def thread_identifier() -> str:
-    if Config.has_option('constants', 'thread_identifier'):
-        return Config.get('constants', 'thread_identifier')
-    else:
-        return CRASH_THREAD_IDENTIFIERS
+    return config_snapshot().thread_identifier
 
 
 def empty_crash_id() -> str:
@@ -104,41 +391,88 @@ def load_address_idx() -> int:
     return Config.getint('constants', 'load_address_idx')
 
 def binary_with_version() -> str:
-    return Config.get('constants', 'binary_with_version')
+    return config_snapshot().binary_with_version
 
 
 def arch_x86_regex() -> str:
-    return Config.get('regex', 'arch_x86_regex')
+    return config_snapshot().arch_x86_regex.pattern
 
 
 def arch_arm64_regex() -> str:
-    return Config.get('regex', 'arch_arm64_regex')
+    return config_snapshot().arch_arm64_regex.pattern
 
 
 def stack_line_regex() -> str:
-    return Config.get('regex', 'stack_line_regex')
+    return config_snapshot().stack_line_regex.pattern
 
 
 def symbolized_line_regex() -> str:
-    return Config.get('regex', 'symbolized_line_regex')
+    return config_snapshot().symbolized_line_regex.pattern
 
 
 def binary_image_regex() -> str:
-    return Config.get('regex', 'binary_image_regex')
+    return config_snapshot().binary_image_regex.pattern
 
 
 def thread_start_regex() -> str:
-    return Config.get('regex', 'thread_start_regex')
+    return config_snapshot().thread_start_regex.pattern
 
 def diag_line_regex() -> str:
-    return Config.get('regex', 'diag_line_regex')
+    return config_snapshot().diag_line_regex.pattern
 
 def get_diff_list(listA: list, listB: list) -> list:
     return list(set(listA).difference(set(listB)))
 
 
 def max_cached_symbol_count() -> int:
-    return Config.getint('symbols', 'max_cached_symbol_count')
+    return config_snapshot().max_cached_symbol_count
+
+
+def max_downloaded_versions() -> int:
+    return config_snapshot().max_downloaded_versions
+
+def prefetch_versions() -> list[str]:
+    return list(config_snapshot().prefetch_versions)
+
+
+def prefetch_archs() -> list[str]:
+    return list(config_snapshot().prefetch_archs)
+
+
+def prefetch_max_bandwidth_mb() -> float:
+    # MB/s, 0 means no limit
+    return config_snapshot().prefetch_max_bandwidth_mb
+
+
+def prefetch_window() -> str:
+    # off-peak window such as 01:00-06:00 (local time), empty means any time
+    return config_snapshot().prefetch_window
+
+
+def prefetch_history_size() -> int:
+    # most recently requested versions to prefetch, 0 disables learning from history
+    return config_snapshot().prefetch_history_size
+
+
+def prefetch_interval_minutes() -> int:
+    # background prefetch interval of the web service, 0 disables it
+    return config_snapshot().prefetch_interval_minutes
+
+
+def signature_top_frames() -> int:
+    # app frames of the crashed thread a crash signature covers
+    return config_snapshot().signature_top_frames
+
+
+def bucket_index_path() -> str:
+    # crash bucket database, empty disables bucketing
+    return config_snapshot().bucket_index_path
+
+
+def symbol_cache_path() -> str:
+    # atos result cache reused across runs, empty disables it
+    return config_snapshot().symbol_cache_path
+
 
 def word_freq_hash() -> int:
     return Config.getboolean('symbols', 'word_freq_hash')
@@ -147,26 +481,18 @@ def word_freq_hash() -> int:
 def get_dst_dir_file(
         version: str, architecture: Arch
 ) -> tuple[str, str]:
-    symbol_dir = Config.get('symbols', 'symbol_dir')
-    zipfile = Config.get('symbols', 'symbol_zip')
-    return os.path.join(symbol_dir, version, architecture), zipfile
+    snapshot = config_snapshot()
+    return os.path.join(snapshot.symbol_dir, version, architecture), snapshot.symbol_zip
 
 def get_dst_information(
         version: str,
         architecture: Arch,
         ndi: bool = False
 ) -> tuple[str, str]:
-    symbol_dir = Config.get('symbols', 'symbol_dir')
-    zipfile = Config.get('symbols', 'symbol_zip')
-    if ndi:
-        dst_dir = os.path.join(symbol_dir, f'{version}_backup', architecture)
-    else:
-        dst_dir = os.path.join(symbol_dir, version, architecture)
-    dst_file = os.path.join(dst_dir, zipfile)
-    return dst_dir, dst_file
+    return config_snapshot().dst_information(version, architecture, ndi)
 
 def get_symbol_dir() -> str:
-    return Config.get('symbols', 'symbol_dir')
+    return config_snapshot().symbol_dir
 
 
 def set_symbol_dir(symbol_dir: str):
@@ -267,15 +593,7 @@ def version_sort(version: str):
 
 
 def get_download_full_url(version: str, arch: Arch, isBackup: bool) -> str:
-    zipfile = Config.get('symbols', 'symbol_zip')
-    arm_url = Config.get('symbols', 'url_arm64_backup') if isBackup else Config.get('symbols', 'url_arm64')
-    x86_url = Config.get('symbols', 'url_x86_backup') if isBackup else Config.get('symbols', 'url_x86')
-    base_url = arm_url if arch == Arch.arm else x86_url
-    url = Config.get('symbols', 'symbol_file_format_backup')  if isBackup else Config.get('symbols', 'symbol_file_format')
-    url = url.replace('{base_url}', base_url)
-    url = url.replace('{version}', version)
-    url = url.replace('{symbol_zip}', zipfile)
-    return url
+    return config_snapshot().download_url(version, arch, isBackup)
 
 def get_download_token() -> str:
     return Config.get('symbols', 'basic_token')
@@ -285,8 +603,12 @@ def get_download_token_backup() -> str:
 
 
 def get_atos_tool_path() -> str:
-    
-    return 'atos'
+    """MAC_SYMBOLIZER_ATOS, then [symbols] atos_path, then atos from PATH"""
+    return config_snapshot().atos_tool_path()
+
+
+# 候选编码，按顺序尝试；latin1能解码任意字节，排在它后面的编码实际不会被选中
+FILE_ENCODINGS = ['utf-8', 'utf-8-sig', 'latin1', 'cp1252', 'iso-8859-1', 'gbk', 'big5']
 
 
 def safe_read_file(file_path: str) -> str:
@@ -307,9 +629,7 @@ def safe_read_file(file_path: str) -> str:
         raise FileNotFoundError(f"文件不存在: {file_path}")
     
     # 尝试多种编码方式
-    encodings = ['utf-8', 'utf-8-sig', 'latin1', 'cp1252', 'iso-8859-1', 'gbk', 'big5']
-    
-    for encoding in encodings:
+    for encoding in FILE_ENCODINGS:
         try:
             with open(file_path, 'r', encoding=encoding) as f:
                 return f.read()
@@ -330,6 +650,47 @@ def safe_read_file(file_path: str) -> str:
         raise IOError(f"读取文件失败 {file_path}: {e}")
 
 
+def detect_file_encoding(file_path: str, prefix_size: int = 64 * 1024) -> str:
+    """
+    按FILE_ENCODINGS的顺序找到第一个能解码文件开头prefix_size字节的编码，只读这一段，不读整个文件
+    开头之后才出现的无法解码的字节由调用方按errors='replace'替换
+
+    Args:
+        file_path: 文件路径
+        prefix_size: 用于检测的字节数
+
+    Returns:
+        编码名称
+    """
+    with open(file_path, 'rb') as f:
+        prefix = f.read(prefix_size)
+    for encoding in FILE_ENCODINGS:
+        try:
+            # 不带final，截断在多字节字符中间的结尾不算解码失败
+            codecs.getincrementaldecoder(encoding)().decode(prefix)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'utf-8'
+
+
+def iter_file_lines(file_path: str) -> Iterator[str]:
+    """
+    逐行读取文件（保留换行符），编码由文件开头检测（见detect_file_encoding），内存占用与文件大小无关
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        行迭代器
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    encoding = detect_file_encoding(file_path)
+    with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+        yield from f
+
+
 def get_list_chunks(iterable, chunks: int) -> list:
     divided_version_list = []
     for i in range(0, len(iterable), chunks):
@@ -1,10 +1,26 @@
 # WordFrequency Module
+import re
 import string
 from collections import Counter
-import matplotlib.pyplot as plt
-from pygments import lex
-from pygments.token import Token
-from pygments.lexers import SwiftLexer
+
+# identifiers, not the hex digits of addresses; the same pattern works in polars (Rust regex)
+TOKEN_PATTERN = r'\b[A-Za-z_][A-Za-z0-9_]*'
+_TOKEN = re.compile(TOKEN_PATTERN)
+
+# Swift keywords, and the 'in' of atos' "(in Image)"
+KEYWORDS = frozenset([
+    'as', 'associatedtype', 'break', 'case', 'catch', 'class', 'continue', 'default', 'defer', 'deinit',
+    'do', 'else', 'enum', 'extension', 'fallthrough', 'false', 'fileprivate', 'for', 'func', 'guard',
+    'if', 'import', 'in', 'init', 'inout', 'internal', 'is', 'let', 'nil', 'open', 'operator', 'private',
+    'protocol', 'public', 'repeat', 'rethrows', 'return', 'self', 'static', 'struct', 'subscript',
+    'super', 'switch', 'throw', 'throws', 'true', 'try', 'typealias', 'var', 'where', 'while',
+])
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase identifiers of text, keywords dropped"""
+    return [x for x in _TOKEN.findall(text.lower()) if x not in KEYWORDS]
+
 
 class WordFrequency:
     def __init__(self, text):
@@ -13,8 +29,7 @@ class WordFrequency:
     @staticmethod
     def get_frequency_words(text, top: int = 10):
         # tokenizing each word
-        tokens = list(lex(text.lower(), SwiftLexer()))
-        words = [token[1] for token in tokens if token[0] == Token.Name]
+        words = tokenize(text)
 
         # Removing stopwords like "the", "is" .etc
         stop_words = set(['none'])
@@ -60,6 +75,7 @@ class WordFrequency:
     def create_chart(self, top_words):
         if not top_words:
             raise ValueError("Usage: obj.create_chart(top_words)")
+        import matplotlib.pyplot as plt
         plt.bar(top_words.keys(), top_words.values())
         plt.title('Top 10 Word Frequencies')
         plt.xlabel('Words')
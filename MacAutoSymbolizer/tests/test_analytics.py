@@ -0,0 +1,121 @@
+"""
+Frame statistics tests: the frames DataFrame, top-N per version, crash rate deltas, lazy
+scans over Parquet and the batched frame export
+"""
+
+import polars as pl
+
+from MacAutoSymbolizer.src import analytics
+from MacAutoSymbolizer.src.scanner import CrashScanner
+from MacAutoSymbolizer.src.word_frequency import WordFrequency, tokenize
+
+
+def report(crashed: list[tuple[str, str]], other: list[tuple[str, str]] = ()) -> str:
+    """A symbolized report, frames are (image, function)"""
+    lines = ['Thread 0 Crashed:']
+    lines += [f'{i}   {image}  \t0x{0x100001000 + i:x} {function} + {i * 4}' for i, (image, function) in enumerate(crashed)]
+    lines += ['', 'Thread 1:']
+    lines += [f'{i}   {image}  \t0x{0x100002000 + i:x} {function} + 8' for i, (image, function) in enumerate(other)]
+    return '\n'.join(lines)
+
+
+HANG = [('spark-core', 'webex::Call::hangup(int)'), ('Webex', '-[AppDelegate run]')]
+QUEUE = [('spark-core', 'webex::Queue<int>::push(int const&)'), ('Webex', 'main')]
+KILL = [('libsystem_kernel.dylib', '__pthread_kill'), ('Webex', 'main')]
+
+
+def corpus() -> pl.DataFrame:
+    outputs = [('a1', report(HANG, KILL), '45.10', 'arm64'), ('a2', report(HANG), '45.10', 'arm64'),
+               ('a3', report(QUEUE), '45.10', 'x86_64'), ('a4', report(KILL), '45.10', 'arm64'),
+               ('b1', report(QUEUE), '45.11', 'arm64'), ('b2', report(QUEUE), '45.11', 'arm64'),
+               ('b3', report(HANG), '45.11', 'arm64'), ('b4', report(QUEUE), '45.11', 'arm64')]
+    return analytics.frames_from_outputs(outputs)
+
+
+def test_frames_dataframe():
+    frames = corpus()
+    assert frames.schema == pl.Schema(analytics.FRAME_SCHEMA)
+    a1 = frames.filter(pl.col('report_id') == 'a1')
+    assert a1.select('thread', 'crashed', 'frame_idx', 'image', 'function').rows() == [
+        (0, True, 0, 'spark-core', 'webex::Call::hangup'),
+        (0, True, 1, 'Webex', '-[AppDelegate run]'),
+        (1, False, 0, 'libsystem_kernel.dylib', '__pthread_kill'),
+        (1, False, 1, 'Webex', 'main'),
+    ]
+
+
+def test_top_functions_and_images_per_version():
+    frames = corpus()
+    top = analytics.top_functions(frames, n=1, top_frames=1)
+    assert top.select('version', 'function', 'reports').rows() == [
+        ('45.10', 'webex::Call::hangup', 2), ('45.11', 'webex::Queue::push', 3)
+    ]
+    # all threads, the whole corpus
+    top = analytics.top_functions(frames, n=2, by=[], crashed_only=False)
+    assert top.select('function', 'reports').rows() == [('main', 6), ('webex::Queue::push', 4)]
+
+    images = analytics.top_images(frames, n=1, by=['version', 'arch'])
+    assert images.select('version', 'arch', 'image', 'reports').rows() == [
+        ('45.10', 'arm64', 'Webex', 3), ('45.10', 'x86_64', 'Webex', 1), ('45.11', 'arm64', 'Webex', 4)
+    ]
+
+    words = analytics.top_words(frames, n=3, by=[])
+    assert words.select('word', 'reports').rows() == [('webex', 7), ('main', 5), ('push', 4)]
+
+
+def test_crash_rate_deltas():
+    deltas = analytics.crash_rate_deltas(corpus(), '45.10', '45.11')
+    assert deltas.rows() == [
+        ('webex::Queue::push', 0.25, 0.75, 0.5),
+        ('__pthread_kill', 0.25, 0.0, -0.25),
+        ('webex::Call::hangup', 0.5, 0.25, -0.25),
+    ]
+    images = analytics.crash_rate_deltas(corpus(), '45.10', '45.11', column='image')
+    assert images.rows()[-1] == ('libsystem_kernel.dylib', 0.25, 0.0, -0.25)
+
+
+def test_statistics_over_parquet(tmp_path):
+    frames = corpus()
+    analytics.write_frames(frames.filter(pl.col('version') == '45.10'), str(tmp_path / 'a.parquet'))
+    analytics.write_frames(frames.filter(pl.col('version') == '45.11').lazy(), str(tmp_path / 'b.parquet'))
+
+    scanned = analytics.scan_frames(str(tmp_path / '*.parquet'))
+    assert isinstance(scanned, pl.LazyFrame)
+    assert analytics.top_functions(scanned, n=1, top_frames=1).equals(analytics.top_functions(frames, n=1, top_frames=1))
+    assert analytics.crash_rate_deltas(scanned, '45.10', '45.11').equals(analytics.crash_rate_deltas(frames, '45.10', '45.11'))
+
+
+def test_frame_writer_exports_batches(tmp_path):
+    scanner = CrashScanner()
+    stack_blocks = scanner.scan_crash(report(HANG, KILL)).stack_blocks
+    with analytics.FrameWriter(str(tmp_path / 'frames'), batch_size=6) as writer:
+        for i in range(5):
+            assert writer.add(f'r{i}', stack_blocks, '45.10', 'arm64') == 4
+        assert len(writer.parts) == 2
+    assert len(writer.parts) == 3 and writer.frame_count == 20
+    assert analytics.frame_parts(str(tmp_path / 'frames')) == sorted(writer.parts)
+
+    frames = analytics.scan_frames(str(tmp_path / 'frames')).collect()
+    # image and function stay dictionary-encoded
+    assert frames.schema == pl.Schema(analytics.FRAME_SCHEMA)
+    assert frames.height == 20 and frames['image'].dtype == pl.Categorical
+    assert frames.filter(pl.col('report_id') == 'r0').select('address', 'function', 'symbol').row(0) == (
+        '0x100001000', 'webex::Call::hangup', 'webex::Call::hangup(int)'
+    )
+    assert analytics.exported_reports(str(tmp_path / 'frames')) == {f'r{i}' for i in range(5)}
+    assert analytics.exported_reports(str(tmp_path / 'empty')) == set()
+
+    # Arrow IPC parts answer the same statistics
+    with analytics.FrameWriter(str(tmp_path / 'arrow'), fmt='arrow') as writer:
+        for i in range(5):
+            writer.add(f'r{i}', stack_blocks, '45.10', 'arm64')
+    assert writer.parts[0].endswith('.arrow')
+    assert analytics.top_functions(analytics.scan_frames(str(tmp_path / 'arrow'))).equals(
+        analytics.top_functions(frames))
+
+
+def test_regex_tokenizer():
+    text = '-[SparkCall hangup:] (in Webex) (SparkCall.mm:120)\n0x100001000 __pthread_kill + 8 applicationWillTerminate'
+    assert tokenize(text) == ['sparkcall', 'hangup', 'webex', 'sparkcall', 'mm', '__pthread_kill', 'applicationwillterminate']
+    top_words, app_terminate, pthread_kill = WordFrequency.get_frequency_words(text, top=1)
+    assert top_words == [('sparkcall', 2)] and app_terminate and pthread_kill
@@ -0,0 +1,100 @@
+"""
+Benchmark infrastructure tests: synthetic corpora scan, the stub atos answers and the local
+symbol server serves ranges the downloader can use
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+
+import pytest
+
+from benchmarks import corpus, fake_atos, run
+from benchmarks.symbol_server import SymbolServer, build_archive, parse_range
+from MacAutoSymbolizer.src.scanner import CrashScanner, DiagLine, RawLine
+from MacAutoSymbolizer.src.symbolizer import Symbolizer
+from MacAutoSymbolizer.src.utilities import (
+    Arch,
+    Config,
+    get_atos_tool_path,
+    get_symbol_dir,
+    set_symbol_dir,
+)
+
+
+@pytest.fixture
+def symbol_dir(tmp_path):
+    old = get_symbol_dir()
+    set_symbol_dir(str(tmp_path / 'symbols'))
+    yield tmp_path / 'symbols'
+    set_symbol_dir(old)
+
+
+@pytest.mark.parametrize('fmt', corpus.FORMATS)
+def test_corpus_scans_to_the_generated_frames(tmp_path, fmt):
+    path, = corpus.write_corpus(str(tmp_path), formats=(fmt,), threads=3, frames=4, images=4)
+    result = CrashScanner().scan_file(path)
+
+    frames = [x for block in result.stack_blocks for x in block if isinstance(x, (RawLine, DiagLine))]
+    assert len(frames) == 3 * 4
+    assert {x.binary.name for x in frames} <= {'Webex', 'spark-core', 'libbench0', 'libbench1'}
+    # the same seed gives the same report
+    with open(path) as f:
+        assert corpus.generate(fmt, 3, 4, 4) == f.read()
+
+
+def test_fake_atos_prints_one_symbol_per_address(tmp_path, monkeypatch):
+    atos = fake_atos.install(str(tmp_path / 'bin'))
+    out = subprocess.run(
+        [atos, '-arch', 'arm64', '-o', '/x/Webex.app.dSYM/Contents/Resources/DWARF/Webex', '-l', '0x100000000',
+         '0x100001000', '0x100002000'],
+        capture_output=True, text=True, check=True
+    ).stdout
+    assert out.splitlines() == [
+        'bench_Webex_0x100001000 (in Webex) (bench.cpp:392)',
+        'bench_Webex_0x100002000 (in Webex) (bench.cpp:488)',
+    ]
+
+    monkeypatch.setenv('MAC_SYMBOLIZER_ATOS', atos)
+    assert get_atos_tool_path() == atos
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range('bytes=0-9', 100) == (0, 9)
+    assert parse_range('bytes=90-', 100) == (90, 99)
+    assert parse_range('bytes=-10', 100) == (90, 99)
+    assert parse_range('bytes=50-500', 100) == (50, 99)
+    with pytest.raises(ValueError):
+        parse_range('bytes=100-', 100)
+
+
+def test_symbol_server_download_and_extract(tmp_path, symbol_dir, monkeypatch):
+    build_archive(str(tmp_path / 'www' / corpus.VERSION / Config.get('symbols', 'symbol_zip')),
+                  images=3, dwarf_size=300 * 1024)
+    symbolizer = Symbolizer()
+    symbolizer.downloader.chunk_size = 256 * 1024
+
+    with SymbolServer(str(tmp_path / 'www')) as server:
+        monkeypatch.setitem(Config['symbols'], 'url_arm64', server.url)
+        ok, dst_dir = asyncio.run(symbolizer.download_symbols(corpus.VERSION, Arch.arm))
+
+    assert ok
+    assert sorted(os.listdir(dst_dir)) == ['Webex.app.dSYM', 'libbench0.framework.dSYM', 'spark-core.framework.dSYM']
+    assert os.path.getsize(os.path.join(dst_dir, 'Webex.app.dSYM', 'Contents', 'Resources', 'DWARF', 'Webex')) == 300 * 1024
+    # one HEAD, then the archive in 256KB ranges
+    assert server.requests[0] == ('HEAD', None)
+    assert len(server.requests) > 3 and all(r.startswith('bytes=') for _, r in server.requests[1:])
+
+
+def test_runner_writes_comparable_results(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    assert run.main(['--quick', '--filter', r'ScanSuite\.', '-o', str(baseline)]) == 0
+    report = json.loads(baseline.read_text())
+    assert report['environment']['schema'] == run.RESULTS_SCHEMA
+    assert report['results'][0]['name'] == 'ScanSuite.time_scan_file'
+    assert report['results'][0]['params'] == {'format': 'crash', 'threads': 8}
+
+    rows = run.compare(report, report)
+    assert [(key, ratio) for key, _, _, ratio in rows] == [('ScanSuite.time_scan_file(format=crash,threads=8)', 1.0)]
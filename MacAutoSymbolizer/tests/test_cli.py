@@ -0,0 +1,137 @@
+"""
+Command-line batch driver tests: discovery, header inference, outputs, frame export and resume
+"""
+
+import json
+
+import polars as pl
+import pytest
+
+from MacAutoSymbolizer import cli
+from MacAutoSymbolizer.src.analytics import scan_frames
+from MacAutoSymbolizer.src.scanner import CrashScanner
+
+CRASH_TEXT = (
+    'Process:               Webex [4242]\n'
+    'Version:               45.10.0.32891 (32891)\n'
+    'Code Type:             X86-64 (Native)\n'
+    '\n'
+    'Thread 0 Crashed:\n'
+)
+
+
+def _ips(meta: dict, body: dict) -> str:
+    return json.dumps(meta) + '\n' + json.dumps(body)
+
+
+class FakeSymbolizer:
+    def __init__(self):
+        self.reports = []
+        self.failing = set()
+        self.blocks = None
+
+    def symbolize_many(self, reports, return_exceptions=False):
+        self.reports.extend(reports)
+        return [
+            ValueError('broken report') if x.content_or_path.endswith(tuple(self.failing))
+            else self.blocks or [[f'{x.version} {x.arch}', 'frame']]
+            for x in reports
+        ]
+
+
+@pytest.fixture
+def fake_symbolizer(monkeypatch):
+    symbolizer = FakeSymbolizer()
+    monkeypatch.setattr(cli, '_symbolizer', symbolizer)
+    return symbolizer
+
+
+def test_find_crash_files_walks_directories_and_globs(tmp_path):
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    for name in ('a/one.ips', 'a/b/two.crash', 'a/b/three.diag', 'a/notes.txt', 'four.spin'):
+        (tmp_path / name).write_text('')
+
+    found = cli.find_crash_files([str(tmp_path / 'a'), str(tmp_path / '*.spin'), str(tmp_path / 'a' / 'one.ips')])
+    assert sorted(rel for _, rel in found) == ['b/three.diag', 'b/two.crash', 'four.spin', 'one.ips']
+
+    found = cli.find_crash_files([str(tmp_path / '**' / '*.crash')])
+    assert [rel for _, rel in found] == ['a/b/two.crash']
+
+
+def test_infer_report_info(tmp_path):
+    crash = tmp_path / 'report.crash'
+    crash.write_text(CRASH_TEXT)
+    assert cli.infer_report_info(str(crash)) == ('45.10.0.32891', 'x86_64')
+
+    ips = tmp_path / 'meta.ips'
+    ips.write_text(_ips({'app_version': '45.10.0', 'build_version': '32891'}, {'cpuType': 'ARM-64'}))
+    assert cli.infer_report_info(str(ips)) == ('45.10.0.32891', 'arm64')
+
+    # without versions in the metadata line the bundle info is used
+    ips.write_text(_ips({'bug_type': '309'}, {
+        'cpuType': 'X86-64',
+        'bundleInfo': {'CFBundleShortVersionString': '44.9.0', 'CFBundleVersion': '30000'},
+    }))
+    assert cli.infer_report_info(str(ips)) == ('44.9.0.30000', 'x86_64')
+
+    unknown = tmp_path / 'unknown.spin'
+    unknown.write_text('nothing here\n')
+    assert cli.infer_report_info(str(unknown)) == (None, None)
+
+
+def test_main_writes_outputs_and_resumes(tmp_path, fake_symbolizer):
+    inputs = tmp_path / 'in'
+    (inputs / 'sub').mkdir(parents=True)
+    (inputs / 'sub' / 'report.crash').write_text(CRASH_TEXT)
+    (inputs / 'broken.crash').write_text(CRASH_TEXT)
+    (inputs / 'headerless.spin').write_text('nothing here\n')
+    out = tmp_path / 'out'
+    fake_symbolizer.failing.add('broken.crash')
+
+    assert cli.main([str(inputs), '-o', str(out), '-f', 'json']) == 1
+    result = json.loads((out / 'sub' / 'report.crash.symbolized.json').read_text())
+    assert result['version'] == '45.10.0.32891' and result['blocks'] == [['45.10.0.32891 x86_64', 'frame']]
+    assert not (out / 'broken.crash.symbolized.json').exists()
+    assert not list(out.rglob('*.tmp'))
+
+    # finished reports are skipped, the rest are retried with the fallback arguments
+    fake_symbolizer.reports.clear()
+    fake_symbolizer.failing.clear()
+    (inputs / 'broken.crash').write_text(CRASH_TEXT.replace('Version', 'Build'))
+    assert cli.main([str(inputs), '-o', str(out), '-f', 'json', '--version', '44.9.0.30000', '--arch', 'arm64']) == 0
+    assert sorted((x.content_or_path.split('/')[-1], x.version, x.arch) for x in fake_symbolizer.reports) == [
+        ('broken.crash', '44.9.0.30000', 'x86_64'), ('headerless.spin', '44.9.0.30000', 'arm64')
+    ]
+
+    # text outputs go next to the inputs by default
+    assert cli.main([str(inputs / 'sub' / 'report.crash')]) == 0
+    text = (inputs / 'sub' / 'report.crash.symbolized.txt').read_text()
+    assert text == '-' * 100 + '\n45.10.0.32891 x86_64\nframe\n'
+
+
+def test_main_exports_frames_to_parquet(tmp_path, fake_symbolizer):
+    fake_symbolizer.blocks = CrashScanner().scan_crash(
+        'Thread 0 Crashed:\n0   Webex  \t0x100001000 main + 8\n1   spark-core  \t0x100002000 -[Call hangup] + 4'
+    ).stack_blocks
+    for name in ('one.crash', 'two.crash', 'broken.crash'):
+        (tmp_path / name).write_text(CRASH_TEXT)
+    fake_symbolizer.failing.add('broken.crash')
+    out = tmp_path / 'frames'
+
+    assert cli.main([str(tmp_path / '*.crash'), '-f', 'parquet', '-o', str(out), '-b', '2']) == 1
+    frames = scan_frames(str(out)).collect()
+    assert len(list(out.glob('part-*.parquet'))) == 2
+    assert frames.select('report_id', 'frame_idx', 'image', 'function', 'version').rows() == [
+        (str(tmp_path / 'one.crash'), 0, 'Webex', 'main', '45.10.0.32891'),
+        (str(tmp_path / 'one.crash'), 1, 'spark-core', '-[Call hangup]', '45.10.0.32891'),
+        (str(tmp_path / 'two.crash'), 0, 'Webex', 'main', '45.10.0.32891'),
+        (str(tmp_path / 'two.crash'), 1, 'spark-core', '-[Call hangup]', '45.10.0.32891'),
+    ]
+    assert frames['function'].dtype == pl.Categorical
+
+    # exported reports are skipped on the next run
+    fake_symbolizer.reports.clear()
+    fake_symbolizer.failing.clear()
+    assert cli.main([str(tmp_path / '*.crash'), '-f', 'parquet', '-o', str(out)]) == 0
+    assert [x.content_or_path for x in fake_symbolizer.reports] == [str(tmp_path / 'broken.crash')]
+    assert scan_frames(str(out)).select(pl.col('report_id').n_unique()).collect().item() == 3
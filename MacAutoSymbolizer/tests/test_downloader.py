@@ -9,12 +9,15 @@ import tempfile
 import time
 from unittest.mock import Mock
 from MacAutoSymbolizer.src.advanced_downloader import AdvancedDownloader, SevenZipValidator, DownloadProgress
+from benchmarks.symbol_server import SymbolServer
 
 
 class DownloadTester:
     """下载器测试类"""
 
-    def __init__(self):
+    def __init__(self, base_url: str):
+        # 本地测试服务器，提供 /bytes/<n> 文件
+        self.base_url = base_url
         self.test_results = []
 
     async def test_basic_download(self):
@@ -27,7 +30,7 @@ class DownloadTester:
         )
 
         # 使用一个小文件进行测试
-        test_url = "https://httpbin.org/bytes/1024"  # 1KB test file
+        test_url = f"{self.base_url}/bytes/1024"  # 1KB test file
 
         with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
             temp_path = tmp_file.name
@@ -67,7 +70,7 @@ class DownloadTester:
             progress_callback=test_progress_callback
         )
 
-        test_url = "https://httpbin.org/bytes/2048"  # 2KB test file
+        test_url = f"{self.base_url}/bytes/2048"  # 2KB test file
 
         with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
             temp_path = tmp_file.name
@@ -98,7 +101,7 @@ class DownloadTester:
 
         try:
             # 测试一个已知大小的文件
-            test_url = "https://httpbin.org/bytes/5120"  # 5KB
+            test_url = f"{self.base_url}/bytes/5120"  # 5KB
             file_size, supports_range = await downloader.get_file_info(test_url)
 
             if file_size > 0:
@@ -280,15 +283,27 @@ class DownloadTester:
         return failed == 0
 
 
+def make_test_files() -> str:
+    """生成测试文件的临时目录，root/bytes/<size> 为 size 字节的随机内容"""
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, 'bytes'))
+    for size in (1024, 2048, 5120):
+        with open(os.path.join(root, 'bytes', str(size)), 'wb') as f:
+            f.write(os.urandom(size))
+    return root
+
+
 async def main():
     """主测试函数"""
     print("🧪 高级文件下载器 - 测试套件")
     print("=" * 60)
 
-    tester = DownloadTester()
+    # 在临时目录生成测试文件，由本地服务器提供，不依赖外网
+    root = make_test_files()
 
     try:
-        success = await tester.run_all_tests()
+        with SymbolServer(root) as server:
+            success = await DownloadTester(server.url).run_all_tests()
 
         if success:
             print("\n🎯 测试套件执行完成 - 所有功能正常!")
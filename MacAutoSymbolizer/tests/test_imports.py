@@ -0,0 +1,56 @@
+"""
+Import tests: the package and the command line import without config.ini and without heavy
+or side-effecting work, config and resource limits are loaded on first use
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from MacAutoSymbolizer.src import utilities
+from MacAutoSymbolizer.src.utilities import LazyConfigParser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHECK = '''
+import sys
+import MacAutoSymbolizer
+import MacAutoSymbolizer.cli
+from MacAutoSymbolizer.src import resource_config, utilities
+
+heavy = sorted(x for x in ('aiohttp', 'aiofiles', 'polars', 'numpy', 'matplotlib', 'pygments') if x in sys.modules)
+print(heavy, utilities.Config.loaded, resource_config._resource_config is None, MacAutoSymbolizer.Arch.arm.value)
+'''
+
+
+def test_import_is_lazy(tmp_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.getenv('PYTHONPATH')])))
+    out = subprocess.run([sys.executable, '-c', CHECK], cwd=tmp_path, env=env,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.split('\n')[-2] == '[] False True arm64'
+    # nothing configures logging or touches rlimits on import
+    assert out.stderr == ''
+
+
+def test_config_is_read_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(utilities, 'ROOT_DIR', str(tmp_path))
+    config = LazyConfigParser()
+    with pytest.raises(Exception, match='config.ini'):
+        config.getint('constants', 'symbol_thread_count')
+    # lookups with a fallback do not need a config.ini
+    assert config.getint('constants', 'symbol_thread_count', fallback=10) == 10
+    assert config.get('prefetch', 'window', fallback='') == ''
+    assert not config.loaded
+
+    (tmp_path / 'config.ini').write_text('[constants]\nsymbol_thread_count = 7\n')
+    assert config.getint('constants', 'symbol_thread_count') == 7
+    assert config.loaded and config.has_section('constants') and 'constants' in config
+
+    # an explicit read wins over the working directory
+    other = tmp_path / 'other.ini'
+    other.write_text('[constants]\nsymbol_thread_count = 3\n')
+    config = LazyConfigParser()
+    config.read(str(other))
+    assert config['constants']['symbol_thread_count'] == '3'
@@ -0,0 +1,79 @@
+"""
+Web job queue tests, the symbolizer is replaced by a controllable fake
+"""
+
+import asyncio
+
+import pytest
+
+from webPage.jobs import JobManager, JobQueueFull, JobStatus
+
+
+class FakeSymbolizer:
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = []
+
+    async def symbolize_report_async(self, content_or_path, version, arch, isBackup=False):
+        self.started.append(content_or_path)
+        await self.release.wait()
+        if content_or_path == 'boom':
+            raise ValueError('bad crash')
+        return [[content_or_path]], True
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_jobs_run_with_bounded_workers_and_admission_control():
+    async def scenario():
+        symbolizer = FakeSymbolizer()
+        manager = JobManager(symbolizer, workers=1, max_queued=1)
+        await manager.start()
+        try:
+            first = manager.submit('45.10.0.1', 'arm64', False, 'a')
+            await _settle()
+            second = manager.submit('45.10.0.1', 'arm64', False, 'boom')
+            with pytest.raises(JobQueueFull):
+                manager.submit('45.10.0.1', 'arm64', False, 'c')
+
+            assert first.status == JobStatus.RUNNING
+            assert manager.queue_position(second) == 0
+            assert symbolizer.started == ['a']
+
+            symbolizer.release.set()
+            await manager._queue.join()
+            return first, second
+        finally:
+            await manager.stop()
+
+    first, second = asyncio.run(scenario())
+    assert first.status == JobStatus.SUCCEEDED and first.output.endswith('\na')
+    assert second.status == JobStatus.FAILED and second.error == 'bad crash'
+
+
+def test_cancel_queued_and_running_jobs(tmp_path):
+    upload = tmp_path / 'crash.txt'
+    upload.write_text('crash')
+
+    async def scenario():
+        manager = JobManager(FakeSymbolizer(), workers=1, max_queued=4)
+        await manager.start()
+        try:
+            running = manager.submit('45.10.0.1', 'arm64', False, 'a')
+            queued = manager.submit('45.10.0.1', 'arm64', False, str(upload), temp_file_path=str(upload))
+            await _settle()
+
+            assert manager.cancel(queued.id)
+            assert manager.cancel(running.id)
+            await manager._queue.join()
+            assert not manager.cancel(running.id)
+            return running, queued
+        finally:
+            await manager.stop()
+
+    running, queued = asyncio.run(scenario())
+    assert running.status == queued.status == JobStatus.CANCELLED
+    assert not upload.exists()
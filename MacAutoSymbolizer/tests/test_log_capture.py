@@ -0,0 +1,57 @@
+"""
+Per-request log capture tests
+"""
+
+import asyncio
+import logging
+
+from webPage.log_capture import LogCapture, LogCaptureSystem, current_capture
+
+
+def test_concurrent_requests_capture_only_their_own_logs():
+    system = LogCaptureSystem()
+    system.install(['webPage.tests'])
+    logger = logging.getLogger('webPage.tests')
+
+    async def request(name):
+        capture = LogCapture()
+        current_capture.set(capture)
+        for i in range(3):
+            logger.info(f'{name} step {i}')
+            await asyncio.sleep(0)
+        # records from worker threads keep the request's capture
+        await asyncio.to_thread(logger.info, f'{name} in thread')
+        await system.flush()
+        return capture.lines()
+
+    async def scenario():
+        system.start()
+        try:
+            return await asyncio.gather(request('a'), request('b'))
+        finally:
+            system.stop()
+
+    a, b = asyncio.run(scenario())
+    assert [x.split(' - ')[-1] for x in a] == ['a step 0', 'a step 1', 'a step 2', 'a in thread']
+    assert all(' - b ' not in x for x in a) and len(b) == 4
+    assert len(system.recent) == 8
+
+
+def test_follow_replays_then_streams_until_closed():
+    async def scenario():
+        capture = LogCapture(maxlen=2)
+        for i in range(3):
+            capture.append(f'old {i}')
+
+        async def produce():
+            await asyncio.sleep(0.01)
+            capture.append('new')
+            capture.close()
+
+        producer = asyncio.create_task(produce())
+        lines = [x async for x in capture.follow()]
+        await producer
+        return lines
+
+    # the ring buffer only kept the last two lines
+    assert asyncio.run(scenario()) == ['old 1', 'old 2', 'new']
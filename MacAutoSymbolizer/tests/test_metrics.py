@@ -0,0 +1,97 @@
+"""
+Metrics tests: no-op when disabled, in-memory histograms, Prometheus text and symbolizer instrumentation
+"""
+
+import pytest
+
+from MacAutoSymbolizer.src import metrics
+from MacAutoSymbolizer.src.symbolizer import Symbolizer
+from MacAutoSymbolizer.tests.test_symbolizer import CRASH
+
+
+@pytest.fixture
+def sink():
+    sink = metrics.InMemorySink()
+    metrics.set_sinks(sink)
+    yield sink
+    metrics.set_sinks()
+
+
+def test_disabled_metrics_do_nothing():
+    metrics.set_sinks()
+    assert not metrics.enabled()
+    assert metrics.timer('scan_seconds') is metrics.timer('atos_seconds', mode='batch')
+    metrics.inc('atos_calls_total')
+    metrics.observe('scan_seconds', 1.0)
+
+
+def test_in_memory_sink_renders_prometheus(sink):
+    metrics.inc('atos_calls_total', mode='batch')
+    metrics.inc('atos_calls_total', 2, mode='batch')
+    metrics.observe('scan_seconds', 0.02, format='crash')
+    metrics.observe('scan_seconds', 2000, format='crash')
+    with metrics.timer('extract_seconds'):
+        pass
+
+    assert sink.counter('atos_calls_total', mode='batch') == 3
+    histogram = sink.histogram('scan_seconds', format='crash')
+    assert histogram.count == 2 and histogram.sum == pytest.approx(2000.02)
+
+    text = sink.render_prometheus()
+    assert '# TYPE mac_symbolizer_atos_calls_total counter' in text
+    assert 'mac_symbolizer_atos_calls_total{mode="batch"} 3' in text
+    assert 'mac_symbolizer_scan_seconds_bucket{format="crash",le="0.025"} 1' in text
+    # the 2000s observation only lands in +Inf
+    assert 'mac_symbolizer_scan_seconds_bucket{format="crash",le="900"} 1' in text
+    assert 'mac_symbolizer_scan_seconds_bucket{format="crash",le="+Inf"} 2' in text
+    assert 'mac_symbolizer_extract_seconds_count 1' in text
+
+
+def test_symbolizer_records_stages(sink, tmp_path, monkeypatch):
+    for name in ('Webex.app.dSYM', 'spark-core.framework.dSYM'):
+        (tmp_path / name).mkdir()
+    symbolizer = Symbolizer(max_concurrent_symbolize=4)
+
+    async def fake_download(version, arch, isBackup=False):
+        return True, str(tmp_path)
+
+    async def batch_atos(*args):
+        return 0, ''.join(f'func_{x}\n' for x in args[6:]), ''
+
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', batch_atos)
+    symbolizer.symbolize_many([(CRASH, '45.10.0.32891', 'arm64'), (CRASH, '45.10.0.32891', 'arm64')])
+
+    assert sink.counter('atos_calls_total', mode='batch') == 2
+    # six unique addresses, shared by both reports
+    assert sink.histogram('atos_batch_addresses').sum == 6
+    assert sink.histogram('scan_seconds', format='crash').count == 2
+    assert sink.histogram('resolve_binaries_seconds').count == 2
+    # the second report finds both images in the batch's dSYM cache
+    assert sink.counter('dsym_searches_total', result='found') == 2
+    assert sink.counter('dsym_cache_hits_total') == 2
+    assert sink.histogram('symbolize_queue_seconds').count == 2
+
+
+def test_configure_from_env(monkeypatch):
+    monkeypatch.setenv('MAC_SYMBOLIZER_METRICS', 'memory, otel')
+    try:
+        memory = metrics.configure_from_env()
+        assert isinstance(memory, metrics.InMemorySink)
+        assert len(metrics.get_sinks()) == (2 if _otel_installed() else 1)
+        metrics.inc('atos_calls_total', mode='single')
+        metrics.observe('atos_seconds', 0.1, mode='single')
+        assert memory.counter('atos_calls_total', mode='single') == 1
+    finally:
+        metrics.set_sinks()
+
+    monkeypatch.setenv('MAC_SYMBOLIZER_METRICS', 'off')
+    assert metrics.configure_from_env() is None and not metrics.enabled()
+
+
+def _otel_installed() -> bool:
+    try:
+        import opentelemetry.metrics  # noqa: F401
+        return True
+    except ImportError:
+        return False
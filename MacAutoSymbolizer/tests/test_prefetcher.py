@@ -0,0 +1,172 @@
+"""
+Symbol prefetcher tests: planning against the cache budget, off-peak window and bandwidth cap
+"""
+
+import asyncio
+import dataclasses
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from MacAutoSymbolizer.src.advanced_downloader import BandwidthLimiter
+from MacAutoSymbolizer.src.prefetcher import (
+    PrefetchTarget,
+    SymbolPrefetcher,
+    parse_window,
+    seconds_until_window,
+)
+from MacAutoSymbolizer.src.symbolizer import Symbolizer
+from MacAutoSymbolizer.src.utilities import (
+    Arch,
+    config_snapshot,
+    get_symbol_dir,
+    set_symbol_dir,
+)
+
+
+@pytest.fixture
+def symbol_dir(tmp_path):
+    old = get_symbol_dir()
+    set_symbol_dir(str(tmp_path))
+    yield tmp_path
+    set_symbol_dir(old)
+
+
+class FakeSymbolizer:
+    def __init__(self, symbol_dir):
+        self.symbol_dir = symbol_dir
+        self.downloads = []
+
+    async def download_symbols(self, version, arch, isBackup=False, downloader=None):
+        self.downloads.append((version, arch, downloader))
+        if version == '45.9.0.30000':
+            return False, None
+        (self.symbol_dir / version / arch.value / 'Webex.app.dSYM').mkdir(parents=True)
+        return True, str(self.symbol_dir / version / arch.value)
+
+
+def test_plan_skips_cached_and_respects_cache_budget(symbol_dir):
+    (symbol_dir / '45.10.0.32891' / 'arm64' / 'Webex.app.dSYM').mkdir(parents=True)
+    prefetcher = SymbolPrefetcher(FakeSymbolizer(symbol_dir), cache_budget=2)
+
+    targets = [
+        PrefetchTarget('45.10.0.32891', 'arm64'),
+        PrefetchTarget('45.10.0.32891', 'x86_64'),
+        PrefetchTarget('45.10.0.32891', 'x86_64'),
+        PrefetchTarget('45.11.0.33000', 'arm64'),
+        PrefetchTarget('45.12.0.34000', 'arm64'),
+        PrefetchTarget('45.11.0.33000', 'sparc'),
+    ]
+    assert prefetcher.plan(targets) == [
+        PrefetchTarget('45.10.0.32891', 'x86_64'),
+        PrefetchTarget('45.11.0.33000', 'arm64'),
+    ]
+
+
+def test_prefetch_downloads_with_its_own_downloader(symbol_dir):
+    symbolizer = FakeSymbolizer(symbol_dir)
+    prefetcher = SymbolPrefetcher(symbolizer, max_bytes_per_second=1024 * 1024)
+    targets = [PrefetchTarget('45.10.0.32891', 'arm64'), PrefetchTarget('45.9.0.30000', 'arm64')]
+
+    results = asyncio.run(prefetcher.prefetch(targets, wait_for_window=False))
+    assert list(results.values()) == [True, False]
+    assert [(v, a) for v, a, _ in symbolizer.downloads] == [('45.10.0.32891', Arch.arm), ('45.9.0.30000', Arch.arm)]
+    assert all(x is prefetcher.downloader for _, _, x in symbolizer.downloads)
+    assert prefetcher.downloader.rate_limiter.rate == 1024 * 1024
+
+    # cached now, nothing left to do
+    symbolizer.downloads.clear()
+    asyncio.run(prefetcher.prefetch(targets[:1], wait_for_window=False))
+    assert symbolizer.downloads == []
+    assert prefetcher.status()['results'][0] == {
+        'version': '45.10.0.32891', 'arch': 'arm64', 'isBackup': False, 'success': True
+    }
+
+
+def test_run_waiting_for_the_window_is_not_busy(symbol_dir):
+    symbolizer = FakeSymbolizer(symbol_dir)
+    later = datetime.now() + timedelta(hours=2)
+    window = f'{later:%H:%M}-{later + timedelta(hours=1):%H:%M}'
+    prefetcher = SymbolPrefetcher(symbolizer, window=window)
+
+    async def scenario():
+        waiting = asyncio.create_task(prefetcher.prefetch([PrefetchTarget('45.11.0.33000', 'arm64')]))
+        await asyncio.sleep(0.05)
+        assert not prefetcher.busy
+        # POST /prefetch with now=True goes ahead of the run waiting for the window
+        results = await prefetcher.prefetch([PrefetchTarget('45.10.0.32891', 'arm64')], wait_for_window=False)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return results
+
+    assert asyncio.run(scenario()) == {PrefetchTarget('45.10.0.32891', 'arm64'): True}
+    assert [(v, a) for v, a, _ in symbolizer.downloads] == [('45.10.0.32891', Arch.arm)]
+
+
+def test_download_cleanup_keeps_the_retention(symbol_dir, monkeypatch):
+    kept = []
+
+    def fake_cleanup(dst_dir, max_folders=10):
+        kept.append(max_folders)
+        raise RuntimeError('stop before downloading')
+
+    monkeypatch.setattr(Symbolizer, '_cleanup_old_downloads', staticmethod(fake_cleanup))
+    config = dataclasses.replace(config_snapshot(), max_cached_symbol_count=3, max_downloaded_versions=6)
+    with pytest.raises(RuntimeError):
+        asyncio.run(Symbolizer(config=config).download_symbols('45.10.0.32891', Arch.arm))
+    assert kept == [6]
+
+
+def test_download_cleanup_removes_the_least_recently_used(symbol_dir):
+    for idx, version in enumerate(['45.1.0.1', '45.2.0.1', '45.3.0.1']):
+        (symbol_dir / version / 'arm64' / 'Webex.app.dSYM').mkdir(parents=True)
+        os.utime(symbol_dir / version, (1000 + idx, 1000 + idx))
+
+    # a request reads the oldest download, it is used again and stays
+    assert asyncio.run(Symbolizer().download_symbols('45.1.0.1', Arch.arm))[0]
+    Symbolizer._cleanup_old_downloads(str(symbol_dir / '45.4.0.1' / 'arm64'), max_folders=2)
+    assert sorted(x.name for x in symbol_dir.iterdir() if not x.name.startswith('.')) == ['45.1.0.1', '45.3.0.1']
+
+
+def test_plan_only_uses_the_headroom_of_the_retention(symbol_dir):
+    (symbol_dir / '45.10.0.32891' / 'arm64' / 'Webex.app.dSYM').mkdir(parents=True)
+    # 4 versions kept, 3 of them for the versions in use: one new version per run
+    prefetcher = SymbolPrefetcher(FakeSymbolizer(symbol_dir), cache_budget=3, retention=4)
+    targets = [
+        PrefetchTarget('45.10.0.32891', 'arm64'),
+        PrefetchTarget('45.11.0.33000', 'arm64'),
+        PrefetchTarget('45.11.0.33000', 'x86_64'),
+        PrefetchTarget('45.12.0.34000', 'arm64'),
+    ]
+    assert prefetcher.plan(targets) == [
+        PrefetchTarget('45.11.0.33000', 'arm64'),
+        PrefetchTarget('45.11.0.33000', 'x86_64'),
+    ]
+    assert SymbolPrefetcher(FakeSymbolizer(symbol_dir), cache_budget=3, retention=3).plan(targets) == []
+
+
+def test_off_peak_window():
+    night = parse_window('22:00-06:00')
+    assert seconds_until_window(night, datetime(2025, 1, 1, 23, 0)) == 0
+    assert seconds_until_window(night, datetime(2025, 1, 1, 5, 59)) == 0
+    assert seconds_until_window(night, datetime(2025, 1, 1, 21, 0)) == 3600
+
+    early = parse_window('01:00-06:00')
+    assert seconds_until_window(early, datetime(2025, 1, 1, 7, 0)) == 18 * 3600
+    assert seconds_until_window(None) == 0
+    with pytest.raises(ValueError):
+        parse_window('tonight')
+
+
+def test_bandwidth_limiter_caps_the_rate():
+    async def scenario():
+        limiter = BandwidthLimiter(100 * 1024)
+        start = time.monotonic()
+        # one second of burst is free, the rest is paid for at the capped rate
+        await asyncio.gather(*[limiter.consume(25 * 1024) for _ in range(6)])
+        return time.monotonic() - start
+
+    assert 0.4 < asyncio.run(scenario()) < 1.0
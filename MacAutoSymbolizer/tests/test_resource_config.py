@@ -0,0 +1,118 @@
+"""
+Adaptive concurrency tests: the resizable semaphore and its AIMD decisions
+"""
+
+import asyncio
+import errno
+
+import pytest
+
+from MacAutoSymbolizer.src.resource_config import AdaptiveSemaphore, ResourceConfig
+
+
+def calm():
+    return 0.1, 0.1
+
+
+def test_semaphore_follows_its_limit():
+    async def scenario():
+        limiter = AdaptiveSemaphore(2, maximum=4, probe=calm)
+        running, peak = 0, 0
+        release = asyncio.Event()
+
+        async def task():
+            nonlocal running, peak
+            async with limiter:
+                running += 1
+                peak = max(peak, running)
+                await release.wait()
+                running -= 1
+
+        tasks = [asyncio.create_task(task()) for _ in range(6)]
+        await asyncio.sleep(0.01)
+        assert running == 2 and limiter.locked()
+
+        # a higher limit lets waiters in right away
+        limiter.set_limit(4)
+        await asyncio.sleep(0.01)
+        assert running == 4
+
+        # a lower limit only stops new acquisitions
+        limiter.set_limit(1)
+        release.set()
+        await asyncio.gather(*tasks)
+        return peak
+
+    assert asyncio.run(scenario()) == 4
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        limiter = AdaptiveSemaphore(1, probe=calm)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        limiter.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # the slot freed by release() is still available
+        await asyncio.wait_for(limiter.acquire(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_aimd_decisions():
+    pressure = [0.1, 0.1]
+    limiter = AdaptiveSemaphore(10, minimum=2, maximum=12, window=4, probe=lambda: tuple(pressure))
+
+    def window(latency, saturated=False, error=None):
+        limiter._saturated = saturated
+        for _ in range(limiter.window):
+            limiter.record(latency, error)
+
+    # the first window sets the baseline, saturation grows the limit by one up to the ceiling
+    for _ in range(3):
+        window(0.1, saturated=True)
+    assert limiter.value == 12
+
+    # latency above twice the baseline backs off
+    window(0.3)
+    assert limiter.value == 8
+    # unsaturated and healthy: unchanged
+    window(0.1)
+    assert limiter.value == 8
+
+    # failures, fd pressure and cpu load back off too
+    window(0.1, error=asyncio.TimeoutError())
+    assert limiter.value == 5
+    pressure[0] = 0.9
+    window(0.1, saturated=True)
+    assert limiter.value == 3
+    pressure[:] = [0.1, 4.0]
+    window(0.1)
+    assert limiter.value == 2  # floor
+
+    # too many open files halves at once, never below the floor
+    pressure[:] = [0.1, 0.1]
+    limiter.set_limit(12)
+    limiter.record(0.1, OSError(errno.EMFILE, 'Too many open files'))
+    assert limiter.value == 6
+
+
+def test_fixed_limit_when_adaptive_is_off(monkeypatch):
+    monkeypatch.setenv('MAC_SYMBOLIZER_ADAPTIVE', '0')
+    monkeypatch.setenv('MAC_SYMBOLIZER_MAX_CONCURRENT', '6')
+    config = ResourceConfig()
+    limiter = config.symbolize_limiter()
+    assert not limiter.adaptive and limiter.value == 6
+    for _ in range(limiter.window):
+        limiter.record(100.0, asyncio.TimeoutError())
+    assert limiter.value == 6
+
+    monkeypatch.setenv('MAC_SYMBOLIZER_ADAPTIVE', '1')
+    monkeypatch.setenv('MAC_SYMBOLIZER_CONCURRENT_CEILING', '30')
+    limiter = ResourceConfig().symbolize_limiter(8)
+    assert (limiter.minimum, limiter.value, limiter.maximum) == (2, 8, 30)
+    downloads = ResourceConfig().download_limiter(10)
+    assert (downloads.minimum, downloads.value, downloads.maximum) == (1, 10, 10)
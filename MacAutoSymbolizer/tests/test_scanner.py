@@ -0,0 +1,249 @@
+"""
+Scanner tests for the structured IPS path, line streams and config snapshots
+"""
+
+import dataclasses
+import json
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from MacAutoSymbolizer.src import utilities
+from MacAutoSymbolizer.src.ips_converter import IPSConverter
+from MacAutoSymbolizer.src.scanner import (
+    CrashScanner,
+    RawLine,
+    SymbolizedLine,
+    TheadLine,
+)
+from MacAutoSymbolizer.src.utilities import Arch, ConfigSnapshot, config_snapshot
+
+APP_UUID = '11EB37AE-355B-3A35-AF1B-13B599244410'
+
+
+def _ips_report() -> str:
+    meta = {"app_name": "Webex", "bug_type": "309"}
+    body = {
+        "procName": "Webex",
+        "pid": 4242,
+        "cpuType": "ARM-64",
+        "captureTime": "2025-08-12 11:30:51.0000 +0800",
+        "faultingThread": 1,
+        "bundleInfo": {"CFBundleShortVersionString": "45.10.0", "CFBundleVersion": "32891",
+                       "CFBundleIdentifier": "Cisco-Systems.Spark"},
+        "exception": {"type": "EXC_BAD_ACCESS", "signal": "SIGSEGV"},
+        "usedImages": [
+            {"base": 4294967296, "size": 65536, "arch": "arm64", "uuid": APP_UUID,
+             "name": "Webex", "path": "/Applications/Webex.app/Contents/MacOS/Webex",
+             "CFBundleIdentifier": "Cisco-Systems.Spark"},
+            {"base": 6666666000, "size": 4096, "arch": "arm64",
+             "uuid": "338fa253-2b8f-3b4c-8adf-665fd7c5e9ef",
+             "name": "spark-core", "path": "/Applications/Webex.app/Contents/Frameworks/libspark-core.dylib"},
+            {"base": 7000000000, "size": 4096, "arch": "arm64",
+             "uuid": "00000000-0000-0000-0000-000000000001",
+             "name": "libsystem_kernel.dylib", "path": "/usr/lib/system/libsystem_kernel.dylib"},
+        ],
+        "threads": [
+            {"id": 1, "queue": "com.apple.main-thread", "frames": [
+                {"imageIndex": 2, "imageOffset": 100, "symbol": "mach_msg2_trap", "symbolLocation": 8},
+                {"imageIndex": 0, "imageOffset": 4096},
+            ]},
+            {"id": 2, "name": "worker", "triggered": True, "frames": [
+                {"imageIndex": 1, "imageOffset": 512},
+                {"imageIndex": 0, "imageOffset": 8192},
+                {"imageIndex": 0, "imageOffset": 12288},
+            ]},
+        ],
+    }
+    return json.dumps(meta) + '\n' + json.dumps(body)
+
+
+@pytest.fixture
+def ips_file(tmp_path):
+    path = tmp_path / 'Webex-2025-08-12-113051.ips'
+    path.write_text(_ips_report())
+    return str(path)
+
+
+def test_scan_ips_builds_frames_from_json(ips_file):
+    res = CrashScanner().scan_file(ips_file)
+
+    crashed = res.stack_blocks[0]
+    assert isinstance(crashed[0], TheadLine)
+    assert crashed[0].crashed and crashed[0].threadIdx == 1
+
+    frames = crashed[1:]
+    assert all(isinstance(x, RawLine) for x in frames)
+    assert frames[0].binary.name == 'spark-core'
+    assert frames[0].binary.loadAddress == f'0x{6666666000:x}'
+    assert frames[0].addressesToSymbolicate == f'0x{6666666000 + 512:x}'
+    assert frames[1].binary.uuid == APP_UUID.lower()
+    assert frames[1].binary.binaryArc == Arch.arm
+
+    # `name` and path basename differ for spark-core; both paths must agree on `name`
+    assert 'spark-core' in res.images_dict
+    assert res.crash_info['Crashed Thread:'].startswith('1')
+
+
+def test_scan_ips_matches_text_rendering(ips_file):
+    structured = CrashScanner().scan_file(ips_file)
+    text = IPSConverter().convert(json_file_path=ips_file)
+    rendered = CrashScanner().scan_crash(text)
+
+    def frames(result):
+        return [
+            (x.addressesToSymbolicate, str(x))
+            for block in result.stack_blocks for x in block
+            if isinstance(x, (RawLine, SymbolizedLine))
+        ]
+
+    assert frames(structured) == frames(rendered)
+    assert structured.crash_info == rendered.crash_info
+
+
+def test_symbolized_ips_frame_keeps_console_layout(ips_file):
+    res = CrashScanner().scan_file(ips_file)
+    main_thread = next(b for b in res.stack_blocks if isinstance(b[0], TheadLine) and b[0].threadIdx == 0)
+    line = next(x for x in main_thread if type(x) is RawLine)
+    line.symbolizedRes = 'main + 12'
+    line.isSymbolized = True
+    assert str(line) == f"1   {'Webex':<30}\t       {line.addressesToSymbolicate} main + 12"
+
+
+def test_scan_ips_frames_are_plain_lines(ips_file, monkeypatch):
+    def no_binary_image(self, image):
+        raise AssertionError('binary images are not rendered while scanning')
+
+    monkeypatch.setattr(IPSConverter, '_format_binary_image', no_binary_image)
+    res = CrashScanner().scan_file(ips_file)
+
+    monkeypatch.undo()
+
+    frame = res.stack_blocks[0][1]
+    assert str(frame).startswith('0   spark-core')
+    assert frame.line in IPSConverter().convert(json_file_path=ips_file)
+    # no closure over the scanner or the report: the line pickles on its own
+    assert pickle.loads(pickle.dumps(frame)) == frame
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson', 'msgspec'])
+def test_json_backends_render_the_same_report(ips_file, backend):
+    pytest.importorskip(backend)
+    assert IPSConverter(json_backend=backend).convert(json_file_path=ips_file) == \
+        IPSConverter(json_backend='json').convert(json_file_path=ips_file)
+
+
+@pytest.mark.parametrize('backend', ['json', 'orjson', 'msgspec'])
+def test_scan_ips_decodes_only_selected_threads(ips_file, backend):
+    pytest.importorskip(backend)
+    report = IPSConverter(json_backend=backend).load(json_file_path=ips_file)
+    assert not any(x.decoded for x in report.threads)
+    assert [len(x.frames) for x in report.threads] == [2, 3]
+
+    scanner = CrashScanner()
+    scanner.ips_converter = IPSConverter(json_backend=backend)
+    res = scanner.scan_ips(json_file_path=ips_file, max_threads=0)
+    threads = [b[0] for b in res.stack_blocks if isinstance(b[0], TheadLine)]
+    assert [x.threadIdx for x in threads] == [1]
+
+
+def test_shared_scanner_is_reentrant(ips_file):
+    scanner = CrashScanner()
+    text = IPSConverter().convert(json_file_path=ips_file)
+    expected = scanner.scan_crash(text).crash_info
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: scanner.scan_crash(text), range(8)))
+
+    # every scan sees the full identifier list, nothing leaks between scans
+    assert all(x.crash_info == expected for x in results)
+    assert 'Crashed Thread:' in expected
+
+
+CRASH_TEXT = """Process:               Webex [4242]
+Crashed Thread:        0
+
+Thread 0 Crashed:
+0   Webex                          \t       0x100001000 0x100000000 + 4096
+"""
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'gbk'])
+def test_text_files_are_scanned_as_a_line_stream(tmp_path, monkeypatch, encoding):
+    # a non-ascii line makes gbk fall through utf-8 to a later candidate
+    path = tmp_path / 'crash.txt'
+    path.write_bytes(('# 崩溃日志\n' + CRASH_TEXT).encode(encoding))
+
+    seen = []
+    scan_lines = CrashScanner._scan_lines
+
+    def spy(self, lines, ctx):
+        seen.append(type(lines))
+        return scan_lines(self, lines, ctx)
+
+    monkeypatch.setattr(CrashScanner, '_scan_lines', spy)
+    res = CrashScanner().scan_file(str(path))
+
+    assert seen[0] not in (str, list)
+    assert res.stack_blocks[0][0].crashed
+    assert res.crash_info == CrashScanner().scan_crash(CRASH_TEXT).crash_info
+
+
+def test_encoding_is_detected_from_the_start_of_the_file(tmp_path):
+    path = tmp_path / 'crash.txt'
+    path.write_bytes('# 崩溃日志\n'.encode('gbk') + b'x' * 100)
+    assert utilities.detect_file_encoding(str(path)) == 'latin1'
+    # bytes past the detection prefix are not read, they are replaced when the file is iterated
+    path.write_bytes(b'x' * 64 * 1024 + '崩溃'.encode('gbk'))
+    assert utilities.detect_file_encoding(str(path)) == 'utf-8'
+    assert ''.join(utilities.iter_file_lines(str(path))).endswith('x\ufffd\ufffd\ufffd\ufffd')
+
+
+def test_scanners_with_different_config_snapshots(tmp_path, monkeypatch):
+    with open(utilities._default_config_path()) as f:
+        text = f.read()
+    text = text.replace('crash_identifiers=', 'crash_identifiers=Process:\nunused=')
+    text = text.replace('thread_identifier=Crashed Thread:', 'thread_identifier=Faulting Thread:')
+    # no backup urls, only the backup downloads need them
+    text = '\n'.join(x for x in text.splitlines() if not x.startswith(('url_x86_backup', 'url_arm64_backup')))
+    (tmp_path / 'config.ini').write_text(text + '\n[prefetch]\nversions = 45.10.0.1, 45.11.0.2\nwindow = 01:00-06:00\n')
+    other = ConfigSnapshot.from_file(str(tmp_path / 'config.ini'))
+    assert other.crash_identifiers == ('Process:', 'Faulting Thread:')
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        other.symbol_dir = str(tmp_path)
+
+    # both configs in one process, the default scanner follows config_snapshot()
+    assert CrashScanner(other).scan_crash(CRASH_TEXT).crash_info == {'Process:': 'Webex [4242]'}
+    assert CrashScanner().scan_crash(CRASH_TEXT).crash_info['Crashed Thread:'] == '0'
+    assert CrashScanner.is_thread_start_line('Thread 0 Crashed:', other)[0]
+    assert other.get_arch('ARM-64') == Arch.arm and other.get_arch('X86-64 (Native)') == Arch.osx
+    assert other.download_url('45.10.0.1', Arch.arm, False).endswith('/45.10.0.1/osxsymbols.7z')
+    with pytest.raises(ValueError, match='url_arm64_backup'):
+        other.download_url('45.10.0.1', Arch.arm, True)
+    assert other.prefetch_versions == ('45.10.0.1', '45.11.0.2') and other.prefetch_window == '01:00-06:00'
+    assert other.prefetch_archs == ('arm64', 'x86_64') and other.max_cached_symbol_count == config_snapshot().max_cached_symbol_count
+
+    # the atos of a line's command comes from the snapshot it is given
+    frame = CrashScanner(other).scan_crash(CRASH_TEXT).stack_blocks[0][1]
+    frame.binary.pathToDSYMFile = str(tmp_path / 'Webex.app.dSYM')
+    frame.binary.binaryArc = Arch.arm
+    monkeypatch.delenv('MAC_SYMBOLIZER_ATOS', raising=False)
+    custom = dataclasses.replace(other, atos_path='/opt/xcode/atos')
+    assert frame.cmd_args(custom) == ['/opt/xcode/atos', *frame.atos_args()]
+
+
+def test_config_snapshot_follows_reloads(tmp_path):
+    before = config_snapshot()
+    assert config_snapshot() is before
+    symbol_dir = utilities.get_symbol_dir()
+    try:
+        utilities.set_symbol_dir(str(tmp_path))
+        after = config_snapshot()
+        assert after is not before and after.symbol_dir == str(tmp_path)
+        # a snapshot handed out earlier never changes
+        assert before.symbol_dir == symbol_dir
+        assert utilities.get_dst_information('45.10.0.1', Arch.arm)[0] == str(tmp_path / '45.10.0.1' / 'arm64')
+    finally:
+        utilities.set_symbol_dir(symbol_dir)
+    assert config_snapshot().symbol_dir == symbol_dir
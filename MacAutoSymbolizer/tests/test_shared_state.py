@@ -0,0 +1,117 @@
+"""
+Multi-worker shared state tests: SQLite result cache, worker heartbeats and the download file lock
+"""
+
+import asyncio
+import subprocess
+import sys
+import time
+
+import pytest
+
+from MacAutoSymbolizer.src.resource_config import InterProcessFileLock, fcntl
+from webPage.jobs import symbolize_cached
+from webPage.shared_state import SharedState, result_cache_key
+
+
+class CountingSymbolizer:
+    def __init__(self, complete=True):
+        self.calls = 0
+        self.complete = complete
+
+    async def symbolize_report_async(self, content_or_path, version, arch, isBackup=False):
+        self.calls += 1
+        return [[f'symbolized {content_or_path}']], self.complete
+
+
+def test_result_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    crash = tmp_path / 'crash.txt'
+    crash.write_text('Thread 0 Crashed:')
+    symbolizer = CountingSymbolizer()
+
+    async def run(state):
+        return await symbolize_cached(symbolizer, state, str(crash), '45.10.0.1', 'arm64', False)
+
+    # two instances on one file stand in for two worker processes
+    first = asyncio.run(run(SharedState(path)))
+    second = asyncio.run(run(SharedState(path)))
+    assert first == second and symbolizer.calls == 1
+
+    # a different architecture is a different result
+    assert result_cache_key('45.10.0.1', 'arm64', False, str(crash)) != \
+        result_cache_key('45.10.0.1', 'x86_64', False, str(crash))
+
+
+def test_partial_results_are_not_cached(tmp_path):
+    state = SharedState(str(tmp_path / 'state.sqlite3'))
+    crash = tmp_path / 'crash.txt'
+    crash.write_text('Thread 0 Crashed:')
+    # e.g. blocks cut by the time budget, or a bucket hit with only the crashed thread symbolized
+    symbolizer = CountingSymbolizer(complete=False)
+
+    async def run():
+        return await symbolize_cached(symbolizer, state, str(crash), '45.10.0.1', 'arm64', False)
+
+    assert asyncio.run(run()) == asyncio.run(run())
+    assert symbolizer.calls == 2
+    assert state.get_result(result_cache_key('45.10.0.1', 'arm64', False, str(crash))) is None
+
+
+def test_result_cache_evicts_oldest(tmp_path):
+    state = SharedState(str(tmp_path / 'state.sqlite3'), max_results=2)
+    for key in ('a', 'b', 'c'):
+        state.put_result(key, key.upper())
+        time.sleep(0.01)
+    assert [state.get_result(x) for x in 'abc'] == [None, 'B', 'C']
+
+
+def test_workers_report_their_load(tmp_path):
+    state = SharedState(str(tmp_path / 'state.sqlite3'))
+    state.heartbeat(running=2, queued=1, capacity=4, processed=7, started_at=time.time())
+    workers = state.workers()
+    assert [(x['pid'], x['running'], x['queued'], x['processed']) for x in workers] == \
+        [(state.pid, 2, 1, 7)]
+    state.remove_worker()
+    assert state.workers() == []
+
+
+@pytest.mark.skipif(fcntl is None, reason='fcntl is not available')
+def test_file_lock_excludes_other_processes(tmp_path):
+    lock_path = str(tmp_path / '.locks' / '45.10.0.1_arm64.lock')
+    holder = (
+        'import fcntl, os, sys, time\n'
+        f'fd = os.open({lock_path!r}, os.O_RDWR | os.O_CREAT)\n'
+        'fcntl.flock(fd, fcntl.LOCK_EX)\n'
+        'print("locked", flush=True)\n'
+        'time.sleep(0.5)\n'
+    )
+
+    async def acquire_once(lock):
+        await lock.acquire()
+        lock.release()
+
+    async def wait_for(lock):
+        start = time.monotonic()
+        async with lock:
+            return time.monotonic() - start
+
+    lock = InterProcessFileLock(lock_path, poll_interval=0.02)
+    asyncio.run(acquire_once(lock))
+
+    proc = subprocess.Popen([sys.executable, '-c', holder], stdout=subprocess.PIPE, text=True)
+    try:
+        assert proc.stdout.readline().strip() == 'locked'
+        waited = asyncio.run(wait_for(lock))
+    finally:
+        proc.wait()
+    assert waited > 0.2
+
+
+def test_recent_versions_are_most_recent_first(tmp_path):
+    state = SharedState(str(tmp_path / 'state.sqlite3'))
+    for version, arch in [('45.9.0.1', 'arm64'), ('45.10.0.1', 'arm64'), ('45.9.0.1', 'x86_64')]:
+        state.record_version(version, arch, False)
+        time.sleep(0.01)
+    assert state.recent_versions(5) == [('45.9.0.1', False), ('45.10.0.1', False)]
+    assert state.recent_versions(1) == [('45.9.0.1', False)]
@@ -0,0 +1,126 @@
+"""
+Crash signature and bucket tests: normalization, stable hashes, the on-disk index and
+skipping the other threads of an already symbolized crash
+"""
+
+import asyncio
+import dataclasses
+
+import pytest
+
+from MacAutoSymbolizer.src.processors import symbolized_blocks_totable
+from MacAutoSymbolizer.src.scanner import RawLine
+from MacAutoSymbolizer.src.signature import (
+    BucketIndex,
+    crash_signature,
+    normalize_symbol,
+    signature_of,
+)
+from MacAutoSymbolizer.src.symbolizer import Symbolizer
+from MacAutoSymbolizer.tests.test_symbolizer import CRASH, symbol_dir  # noqa: F401
+
+
+@pytest.mark.parametrize('symbol, expected', [
+    ('webex::Queue<std::vector<int>>::push(int const&) (in spark-core) (queue.cpp:42)', 'webex::Queue::push'),
+    ('-[SparkCall hangup:] (in Webex) (SparkCall.mm:120)', '-[SparkCall hangup:]'),
+    ('__pthread_kill + 8', '__pthread_kill'),
+    ('__41-[Foo bar]_block_invoke_2 (in Webex) (Foo.m:7) [inlined]', '__41-[Foo bar]_block_invoke'),
+    ('closure #2 in Meeting.join(id:) (in Webex) (Meeting.swift:88)', 'closure # in Meeting.join'),
+    ('(anonymous namespace)::$_3::operator() const (in spark-core) (a.cpp:1)', '::$_::operator const'),
+    ('0x0000000100ab1234 (in Webex) + 1234', '?'),
+    (None, '?'),
+])
+def test_normalize_symbol(symbol, expected):
+    assert normalize_symbol(symbol) == expected
+
+
+def test_signature_ignores_offsets_and_lines():
+    a = signature_of(['Webex', 'Webex'], ['Foo::run(int) (in Webex) (foo.cpp:10)', 'main + 12'], top_n=5)
+    b = signature_of(['Webex', 'Webex'], ['Foo::run(long) (in Webex) (foo.cpp:97)', 'main + 40'], top_n=5)
+    assert a == b and len(a.hash) == 16
+    assert a.frames == ('Webex!Foo::run', 'Webex!main')
+
+    assert signature_of(['Webex'], ['Foo::stop() (in Webex)'], top_n=5) != a
+    # only the top frames count
+    assert signature_of(['Webex', 'Webex'], ['Foo::run', 'other'], top_n=1).frames == ('Webex!Foo::run',)
+    # nothing symbolized, nothing to group by
+    assert signature_of(['Webex'], ['0x100001000 (in Webex) + 4'], top_n=5) is None
+
+
+def test_bucket_index_counts_reports(tmp_path):
+    path = str(tmp_path / 'buckets' / 'index.sqlite3')
+    index = BucketIndex(path)
+    signature = signature_of(['Webex'], ['Foo::run'], top_n=5)
+    assert index.lookup(signature.hash) is None
+
+    first = index.add(signature, '45.10.0.32891', 'arm64', symbolized=False)
+    assert (first.count, first.symbolized, first.frames) == (1, False, ['Webex!Foo::run'])
+
+    # a second process sees the same buckets
+    again = BucketIndex(path).add(signature, '45.11.0.1', 'arm64', symbolized=True)
+    assert (again.count, again.symbolized, again.version) == (2, True, '45.11.0.1')
+    index.add(signature, '45.11.0.2', 'arm64', symbolized=False)
+    assert index.lookup(signature.hash).symbolized
+    assert len(index) == 1 and index.buckets()[0].count == 3
+
+
+@pytest.fixture
+def bucketed(tmp_path, symbol_dir, monkeypatch):  # noqa: F811
+    symbolizer = Symbolizer(max_concurrent_symbolize=4, bucket_index=BucketIndex(str(tmp_path / 'buckets.sqlite3')))
+    calls = []
+
+    async def fake_atos(*args):
+        calls.append(args[-1])
+        # the function depends on the offset into the image, file lines vary between builds
+        offset = int(args[-1], 16) - int(args[-2], 16)
+        return 0, f'func_{offset}(int) (in {args[3].split("/")[-1]}) (file.cpp:{len(calls)})\n', ''
+
+    async def fake_download(version, arch, isBackup=False):
+        return True, symbol_dir
+
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', fake_atos)
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+    symbolizer.atos_calls = calls
+    return symbolizer
+
+
+def test_known_crash_only_symbolizes_the_crashed_thread(bucketed):
+    blocks, bucket = asyncio.run(bucketed.symbolize_bucketed_async(CRASH, '45.10.0.32891', 'arm64'))
+    assert len(bucketed.atos_calls) == 6
+    assert (bucket.count, bucket.symbolized) == (1, True)
+    assert bucket.frames == ['spark-core!func_1024', 'Webex!func_8192', 'Webex!func_12288']
+    assert bucket.signature == crash_signature(blocks).hash
+
+    # the same crash from another build: the load address moved, the crashed thread is all it takes
+    moved = CRASH.replace('0x1000', '0x1010').replace('0x100000000', '0x101000000')
+    bucketed.atos_calls.clear()
+    blocks, complete = asyncio.run(bucketed.symbolize_report_async(moved, '45.10.0.32891', 'arm64'))
+    assert len(bucketed.atos_calls) == 3 and not complete
+    assert [x.isSymbolized for x in blocks[0] if isinstance(x, RawLine)] == [True] * 3
+    assert not any(x.isSymbolized for b in blocks[1:] for x in b if isinstance(x, RawLine))
+    assert bucketed.bucket_index.lookup(bucket.signature).count == 2
+
+
+def test_bucket_cut_by_the_block_limit_is_not_symbolized(bucketed):
+    # the crashed thread and one other of the three blocks
+    bucketed.scanner.config = dataclasses.replace(bucketed.config, stack_block_limit=2)
+    _, bucket = asyncio.run(bucketed.symbolize_bucketed_async(CRASH, '45.10.0.32891', 'arm64'))
+    assert (bucket.count, bucket.symbolized) == (1, False)
+    _, complete = asyncio.run(bucketed.symbolize_report_async(CRASH, '45.10.0.32891', 'arm64'))
+    assert not complete
+
+    # the next report of the crash symbolizes the other threads again, all of them this time
+    bucketed.scanner.config = dataclasses.replace(bucketed.config, stack_block_limit=0)
+    bucketed.atos_calls.clear()
+    blocks, bucket = asyncio.run(bucketed.symbolize_bucketed_async(CRASH, '45.10.0.32891', 'arm64'))
+    assert len(bucketed.atos_calls) == 6
+    assert all(x.isSymbolized for b in blocks for x in b if isinstance(x, RawLine))
+    assert (bucket.count, bucket.symbolized) == (3, True)
+
+
+def test_table_tags_come_from_the_signature(bucketed):
+    blocks, bucket = asyncio.run(bucketed.symbolize_bucketed_async(CRASH, '45.10.0.32891', 'arm64'))
+    table = symbolized_blocks_totable(blocks)
+    assert table['tags'] == [bucket.signature, 'spark-core', 'Webex']
+    assert table['rows'][1][:4] == ['0', 'spark-core', '0x18d5cb400', 'func_1024(int) (in spark-core) (file.cpp:1)']
+    assert table['rows'][1][4] == '1024'
@@ -0,0 +1,90 @@
+"""
+Near-duplicate clustering tests: MinHash estimates, LSH candidates, clusters, persistence and
+tokens from symbolized outputs
+"""
+
+import asyncio
+import random
+
+import numpy as np
+
+from MacAutoSymbolizer.src.similarity import MinHashLSH, stack_tokens, text_tokens
+from MacAutoSymbolizer.tests.test_signature import bucketed  # noqa: F401
+from MacAutoSymbolizer.tests.test_symbolizer import CRASH, symbol_dir  # noqa: F401
+from webPage.jobs import format_blocks
+from webPage.shared_state import SharedState
+
+
+def crash(seed: int, depth: int = 20) -> list[str]:
+    rng = random.Random(seed)
+    return [f'spark-core!webex::f{rng.randrange(10000)}' for _ in range(depth)]
+
+
+def test_sketch_estimates_jaccard_similarity():
+    index = MinHashLSH(num_perm=256, bands=32)
+    stack = crash(1)
+    inlined = stack[:5] + ['spark-core!webex::inlined'] + stack[5:]
+    # 19 shingles in common out of 21
+    assert abs(MinHashLSH.similarity(index.sketch(stack), index.sketch(inlined)) - 19 / 21) < 0.08
+    assert MinHashLSH.similarity(index.sketch(stack), index.sketch(crash(2))) < 0.1
+
+    # a batch gives the same sketches as one at a time, empty stacks are all 0xFFFF
+    batch = index.sketch_many([stack, [], ['Webex!main']])
+    assert (batch[0] == index.sketch(stack)).all() and (batch[2] == index.sketch(['Webex!main'])).all()
+    assert (batch[1] == 0xFFFF).all()
+    # the same seed gives the same sketches in another index
+    assert (MinHashLSH(num_perm=256, bands=32).sketch(stack) == batch[0]).all()
+
+
+def test_near_duplicates_are_found_and_clustered():
+    index = MinHashLSH()
+    keys, token_lists = [], []
+    for family in range(50):
+        stack = crash(family)
+        for variant in range(4):
+            tokens = list(stack)
+            if variant:
+                tokens.insert(variant * 3, f'Webex!inlined_{variant}')  # one extra frame
+            keys.append(f'{family}-{variant}')
+            token_lists.append(tokens)
+    assert index.add_many(keys, token_lists) == 200
+    assert not index.add('0-0', crash(0)) and not index.add('empty', [])
+
+    found = index.query(crash(7))
+    assert {key for key, _ in found} == {f'7-{x}' for x in range(4)}
+    assert found[0] == ('7-0', 1.0)
+
+    clusters = index.clusters()
+    assert len(clusters) == 50 and all(len(x) == 4 for x in clusters)
+    assert min(clusters[0]).split('-')[0] == max(clusters[0]).split('-')[0]
+
+    # incremental adds land in the cluster of their family
+    index.add('3-new', crash(3)[1:])
+    assert {'3-0', '3-new'} <= set(next(x for x in index.clusters() if '3-0' in x))
+
+
+def test_rebuild_and_persistence(tmp_path):
+    items = [(f'{i}', crash(i % 10)) for i in range(100)]
+    index = MinHashLSH()
+    assert index.rebuild(iter(items), batch_size=7) == 100
+    index.save(str(tmp_path / 'index.npz'))
+
+    loaded = MinHashLSH.load(str(tmp_path / 'index.npz'))
+    assert len(loaded) == 100 and '42' in loaded
+    assert np.array_equal(loaded._sketches[:100], index._sketches[:100])
+    assert loaded.query(crash(3)) == index.query(crash(3))
+    assert index.rebuild([]) == 0 and index.query(crash(3)) == []
+
+
+def test_tokens_of_symbolized_results(bucketed, tmp_path):  # noqa: F811
+    blocks, _ = asyncio.run(bucketed.symbolize_bucketed_async(CRASH, '45.10.0.32891', 'arm64'))
+    tokens = stack_tokens(blocks)
+    assert tokens == ['spark-core!func_1024', 'Webex!func_8192', 'Webex!func_12288']
+
+    # historical outputs from the web result cache give the same tokens
+    state = SharedState(str(tmp_path / 'state.sqlite3'))
+    state.put_result('a', format_blocks(blocks))
+    state.put_result('b', 'no crash here')
+    index = MinHashLSH()
+    assert index.rebuild((key, text_tokens(output)) for key, output in state.iter_results(batch_size=1)) == 1
+    assert index.query(tokens) == [('a', 1.0)]
@@ -0,0 +1,80 @@
+"""
+Subprocess layer tests with real child processes: bounded output, process group kill,
+decoding, stats and the concurrency limit of start()
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from MacAutoSymbolizer.src import subprocess_cmd
+from MacAutoSymbolizer.src.subprocess_cmd import SubProcessCmd
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    subprocess_cmd.reset_command_stats()
+    yield
+    subprocess_cmd.reset_command_stats()
+
+
+def python(code: str, **kwargs) -> tuple:
+    return asyncio.run(SubProcessCmd(sys.executable, **kwargs).cmd('-c', code))
+
+
+def test_output_is_capped_without_blocking_the_child():
+    code = "import sys; sys.stdout.write('x' * 1_000_000); sys.stderr.write('done')"
+    returncode, stdout, stderr = python(code, max_output=1000)
+    assert (returncode, len(stdout), stderr) == (0, 1000, 'done')
+
+    stats = subprocess_cmd.command_stats()[os.path.basename(sys.executable)]
+    assert stats['calls'] == 1 and stats['truncated'] == 1 and stats['output_bytes'] == 1004
+
+
+def test_single_pass_decoding_and_failures():
+    returncode, stdout, _ = python("import sys; sys.stdout.buffer.write(b'caf\\xc3\\xa9 \\xff'); sys.exit(3)")
+    assert returncode == 3
+    assert stdout == 'café �'
+    assert subprocess_cmd.command_stats()[os.path.basename(sys.executable)]['failures'] == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'killpg'), reason='process groups are POSIX only')
+def test_timeout_kills_the_process_group(tmp_path):
+    pid_file = tmp_path / 'grandchild.pid'
+    cmd = SubProcessCmd('/bin/sh', timeout=0.5)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(cmd.cmd('-c', f'sleep 30 & echo $! > {pid_file}; wait'))
+
+    grandchild = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while _alive(grandchild) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _alive(grandchild)
+    assert cmd.stats.timeouts == 1
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # zombies are dead, they only wait to be reaped
+            return f.read().split(')')[-1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+
+
+def test_start_limits_concurrency():
+    cmd = SubProcessCmd(sys.executable)
+    start = time.monotonic()
+    results = asyncio.run(cmd.start([('-c', f'import time; time.sleep(0.2); print({i})') for i in range(4)], 2))
+    assert [stdout.strip() for _, stdout, _ in results] == ['0', '1', '2', '3']
+    # two rounds of two
+    assert time.monotonic() - start >= 0.4
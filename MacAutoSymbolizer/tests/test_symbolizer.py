@@ -0,0 +1,353 @@
+"""
+Symbolizer pipeline tests, atos is replaced by an in-process fake
+"""
+
+import asyncio
+
+import pytest
+
+from MacAutoSymbolizer.src.scanner import CrashScanner, RawLine, SymbolizedLine
+from MacAutoSymbolizer.src.symbol_cache import SymbolCache, line_hash
+from MacAutoSymbolizer.src.symbolizer import Symbolizer
+from MacAutoSymbolizer.src.utilities import Arch
+
+CRASH = """Process:               Webex [4242]
+Code Type:             ARM-64 (Native)
+Crashed Thread:        1
+
+Thread 0:
+0   Webex                          \t       0x100001000 0x100000000 + 4096
+1   spark-core                     \t       0x18d5cb200 0x18d5cb000 + 512
+
+Thread 1 Crashed:
+0   spark-core                     \t       0x18d5cb400 0x18d5cb000 + 1024
+1   Webex                          \t       0x100002000 0x100000000 + 8192
+2   Webex                          \t       0x100003000 0x100000000 + 12288
+
+Thread 2:
+0   Webex                          \t       0x100004000 0x100000000 + 16384
+"""
+
+
+@pytest.fixture
+def symbol_dir(tmp_path):
+    for name in ('Webex.app.dSYM', 'spark-core.framework.dSYM'):
+        (tmp_path / name).mkdir()
+    return str(tmp_path)
+
+
+@pytest.fixture
+def symbolizer(monkeypatch):
+    symbolizer = Symbolizer(max_concurrent_symbolize=4)
+    calls = []
+
+    async def fake_atos(*args):
+        calls.append(args)
+        await asyncio.sleep(0)
+        return 0, f'func_{args[-1]} (in {args[3].split("/")[-1]})\n', ''
+
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', fake_atos)
+    symbolizer.atos_calls = calls
+    return symbolizer
+
+
+def test_symbolize_blocks_resolves_each_image_once(symbolizer, symbol_dir, monkeypatch):
+    searched = []
+    find_dsym_file = Symbolizer._find_dsym_file
+
+    def counting_find(*args):
+        searched.append(args[1:])
+        return find_dsym_file(*args)
+
+    monkeypatch.setattr(Symbolizer, '_find_dsym_file', staticmethod(counting_find))
+    scan_res = CrashScanner().scan_crash(CRASH)
+    blocks = asyncio.run(symbolizer.symbolize_blocks_async(scan_res.stack_blocks, symbol_dir, Arch.arm))
+
+    assert sorted(searched) == [('Webex', ''), ('spark-core', '')]
+    assert [len(b) for b in blocks] == [len(b) for b in scan_res.stack_blocks]
+    frames = [x for b in blocks for x in b if isinstance(x, RawLine)]
+    assert len(symbolizer.atos_calls) == len(frames) == 6
+    assert all(x.isSymbolized and x.symbolizedRes.startswith('func_') for x in frames)
+
+
+def test_symbolize_blocks_keeps_block_order(symbolizer, symbol_dir):
+    scan_res = CrashScanner().scan_crash(CRASH)
+    blocks = asyncio.run(symbolizer.symbolize_blocks_async(scan_res.stack_blocks, symbol_dir, Arch.arm))
+    assert [[x.idx for x in b] for b in blocks] == [[x.idx for x in b] for b in scan_res.stack_blocks]
+    # the crashed thread is still first
+    assert blocks[0][0].crashed
+
+
+def test_shared_symbolizer_serves_concurrent_reports(symbolizer, symbol_dir, monkeypatch):
+    async def fake_download(version, arch, isBackup=False):
+        return True, symbol_dir
+
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+
+    async def run_many():
+        return await asyncio.gather(*[
+            symbolizer.symbolize_async_report(CRASH, '45.10.0.32891', 'arm64') for _ in range(5)
+        ])
+
+    results = asyncio.run(run_many())
+    assert len(symbolizer.atos_calls) == 5 * 6
+    assert all(r[0][0].crashed for r in results)
+
+    # the sync wrapper runs on its own loop and reuses the same instance
+    assert symbolizer.symbolize(CRASH, '45.10.0.32891', 'arm64')[0][0].crashed
+
+
+PRIORITY_CRASH = CRASH + """
+Thread 3:
+0   spark-core                     \t       0x18d5cb600 0x18d5cb000 + 1536
+1   spark-core                     \t       0x18d5cb700 0x18d5cb000 + 1792
+2   spark-core                     \t       0x18d5cb800 0x18d5cb000 + 2048
+3   libsystem_kernel.dylib         \t       0x18d5cb900 0x18d5cb000 + 2304
+"""
+
+
+def _thread_order(blocks, planned):
+    return [blocks[idx][0].threadIdx for idx in planned]
+
+
+def test_plan_puts_crashed_thread_first_then_app_frames(symbolizer, symbol_dir):
+    scan_res = CrashScanner().scan_crash(PRIORITY_CRASH)
+    lines = [x for b in scan_res.stack_blocks for x in b]
+    asyncio.run(symbolizer._resolve_binaries(lines, symbol_dir, Arch.arm))
+    blocks = scan_res.stack_blocks
+
+    assert _thread_order(blocks, Symbolizer._plan_blocks(blocks)) == [1, 3, 0, 2]
+    assert _thread_order(blocks, Symbolizer._plan_blocks(blocks, max_blocks=2)) == [1, 3]
+    # thread 3 does not fit in the frame budget, the smaller thread 0 still does
+    assert _thread_order(blocks, Symbolizer._plan_blocks(blocks, frame_budget=5)) == [1, 0]
+
+
+def test_unplanned_blocks_are_returned_unsymbolized(symbolizer, symbol_dir):
+    scan_res = CrashScanner().scan_crash(PRIORITY_CRASH)
+    blocks = asyncio.run(symbolizer.symbolize_blocks_async(
+        scan_res.stack_blocks, symbol_dir, Arch.arm, max_blocks=1
+    ))
+    assert len(blocks) == len(scan_res.stack_blocks)
+    symbolized = [b[0].threadIdx for b in blocks if any(getattr(x, 'isSymbolized', False) for x in b)]
+    assert symbolized == [1]
+
+
+def test_time_budget_leaves_slow_blocks_unsymbolized(symbolizer, symbol_dir, monkeypatch):
+    async def slow_atos(*args):
+        await asyncio.sleep(0.01 if args[-1] == '0x18d5cb400' else 5)
+        return 0, 'crash_site\n', ''
+
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', slow_atos)
+    scan_res = CrashScanner().scan_crash(CRASH)
+    blocks = asyncio.run(symbolizer.symbolize_blocks_async(
+        scan_res.stack_blocks, symbol_dir, Arch.arm, time_budget=0.2
+    ))
+    frames = [x for b in blocks for x in b if isinstance(x, RawLine)]
+    assert [x.symbolizedRes for x in frames if x.isSymbolized] == ['crash_site']
+
+
+def test_symbolize_iter_streams_crashed_thread_first(symbolizer, symbol_dir, monkeypatch):
+    async def fake_download(version, arch, isBackup=False):
+        return True, symbol_dir
+
+    async def crashed_is_slowest(*args):
+        await asyncio.sleep(0.05 if args[-1] == '0x18d5cb400' else 0)
+        return 0, 'func\n', ''
+
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', crashed_is_slowest)
+
+    async def collect():
+        return [x async for x in symbolizer.symbolize_iter(PRIORITY_CRASH, '45.10.0.32891', 'arm64')]
+
+    streamed = asyncio.run(collect())
+    assert streamed[0][1][0].crashed
+    assert sorted(idx for idx, _ in streamed) == list(range(len(streamed)))
+
+
+def test_symbolize_many_batches_atos_per_image(symbolizer, tmp_path, monkeypatch):
+    downloads = []
+
+    async def fake_download(version, arch, isBackup=False):
+        downloads.append((version, arch))
+        version_dir = tmp_path / version
+        for name in ('Webex.app.dSYM', 'spark-core.framework.dSYM'):
+            (version_dir / name).mkdir(parents=True, exist_ok=True)
+        return True, str(version_dir)
+
+    async def batch_atos(*args):
+        symbolizer.atos_calls.append(args)
+        # -arch <arch> -o <path> -l <load address> <addresses...>
+        return 0, ''.join(f'func_{x} (in {args[3].split("/")[-1]})\n' for x in args[6:]), ''
+
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', batch_atos)
+
+    reports = [
+        (CRASH, '45.10.0.32891', 'arm64'),
+        (PRIORITY_CRASH, '45.10.0.32891', 'arm64'),
+        (CRASH, 'not-a-version', 'arm64'),
+        (CRASH, '45.9.0.32000', 'arm64'),
+    ]
+    results = symbolizer.symbolize_many(reports, return_exceptions=True)
+
+    assert sorted(downloads) == [('45.10.0.32891', Arch.arm), ('45.9.0.32000', Arch.arm)]
+    # one call per image, frames from both reports of a version share it
+    assert sorted(x[3].split('/')[-1] for x in symbolizer.atos_calls) == \
+        ['Webex', 'Webex', 'spark-core', 'spark-core']
+    assert isinstance(results[2], Exception)
+    for res, (content, _, _) in zip([results[0], results[1], results[3]], [reports[0], reports[1], reports[3]]):
+        frames = [x for b in res for x in b if isinstance(x, RawLine)]
+        assert len(frames) == len([x for b in CrashScanner().scan_crash(content).stack_blocks
+                                   for x in b if isinstance(x, RawLine)])
+        assert all(x.symbolizedRes == f'func_{x.addressesToSymbolicate} (in {x.binary.name})'
+                   for x in frames if x.binary.pathToDSYMFile)
+    assert results[0][0][0].crashed
+
+
+def test_symbolize_many_falls_back_when_atos_output_does_not_line_up(symbolizer, symbol_dir, monkeypatch):
+    async def fake_download(version, arch, isBackup=False):
+        return True, symbol_dir
+
+    async def flaky_atos(*args):
+        symbolizer.atos_calls.append(args)
+        if len(args) == 7:
+            return 0, f'single_{args[-1]}\n', ''
+        return 0, 'only one line\n', ''
+
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', flaky_atos)
+
+    [blocks] = symbolizer.symbolize_many([(CRASH, '45.10.0.32891', 'arm64')])
+    frames = [x for b in blocks for x in b if isinstance(x, RawLine)]
+    webex = [x for x in frames if x.binary.name == 'Webex']
+    # the Webex batch (4 addresses) did not line up and was retried one by one
+    assert all(x.symbolizedRes == f'single_{x.addressesToSymbolicate}' for x in webex)
+    spark = [x for x in frames if x.binary.name == 'spark-core']
+    assert all(x.isSymbolized for x in spark)
+
+
+def test_symbolize_many_fails_only_the_report_of_a_failed_lookup(symbolizer, symbol_dir, monkeypatch):
+    async def fake_download(version, arch, isBackup=False):
+        return True, symbol_dir
+
+    async def broken_atos(*args):
+        symbolizer.atos_calls.append(args)
+        if len(args) != 7:
+            raise asyncio.TimeoutError()
+        if args[-1] == '0x100005000':
+            raise OSError('atos crashed')
+        return 0, f'single_{args[-1]}\n', ''
+
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+    monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', broken_atos)
+
+    edited = CRASH.replace('0x100004000 0x100000000 + 16384', '0x100005000 0x100000000 + 20480')
+    blocks, error = symbolizer.symbolize_many(
+        [(CRASH, '45.10.0.32891', 'arm64'), (edited, '45.10.0.32891', 'arm64')], return_exceptions=True
+    )
+    # every batch timed out, the frames were looked up one by one
+    frames = [x for b in blocks for x in b if isinstance(x, RawLine)]
+    assert all(x.symbolizedRes == f'single_{x.addressesToSymbolicate}' for x in frames)
+    assert isinstance(error, OSError)
+    with pytest.raises(OSError):
+        symbolizer.symbolize_many([(edited, '45.10.0.32891', 'arm64')])
+
+
+def test_atos_argv_leaves_out_the_program(symbolizer, symbol_dir, monkeypatch):
+    async def fake_download(version, arch, isBackup=False):
+        return True, symbol_dir
+
+    monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+    scan_res = CrashScanner().scan_crash(CRASH)
+    webex = scan_res.stack_blocks[2][1]
+    asyncio.run(symbolizer.symbolize_blocks_async(scan_res.stack_blocks, symbol_dir, Arch.arm))
+    # SubProcessCmd already runs atos, the arguments start with the options
+    single = next(x for x in symbolizer.atos_calls if x[-1] == '0x100004000')
+    assert single == ('-arch', 'arm64', '-o', webex.binary.path(), '-l', '0x100000000', '0x100004000')
+
+    symbolizer.atos_calls.clear()
+    symbolizer.symbolize_many([(CRASH, '45.10.0.32891', 'arm64')])
+    batch = next(x for x in symbolizer.atos_calls if x[3] == webex.binary.path())
+    assert batch[:6] == ('-arch', 'arm64', '-o', webex.binary.path(), '-l', '0x100000000')
+    assert sorted(batch[6:]) == ['0x100001000', '0x100002000', '0x100003000', '0x100004000']
+
+
+PARTIAL_CRASH = CRASH.replace(
+    '0x18d5cb200 0x18d5cb000 + 512', '0x18d5cb200 webex::Queue::pop() + 12'
+).replace(
+    '0x18d5cb400 0x18d5cb000 + 1024', '0x18d5cb400 webex::Call::hangup(int) + 8'
+)
+
+
+def test_incremental_mode_skips_symbolized_frames(symbolizer, symbol_dir, monkeypatch):
+    searched = []
+    find_dsym_file = Symbolizer._find_dsym_file
+
+    def counting_find(*args):
+        searched.append(args[1])
+        return find_dsym_file(*args)
+
+    monkeypatch.setattr(Symbolizer, '_find_dsym_file', staticmethod(counting_find))
+    symbolizer.incremental = True
+    scan_res = CrashScanner().scan_crash(PARTIAL_CRASH)
+    blocks = asyncio.run(symbolizer.symbolize_blocks_async(scan_res.stack_blocks, symbol_dir, Arch.arm))
+
+    # every spark-core frame was already symbolized, its dSYM is not even looked for
+    assert searched == ['Webex']
+    assert sorted(x[-1] for x in symbolizer.atos_calls) == ['0x100001000', '0x100002000', '0x100003000', '0x100004000']
+    kept = [x for b in blocks for x in b if isinstance(x, SymbolizedLine)]
+    assert sorted(x.symbolizedRes for x in kept) == ['webex::Call::hangup(int)', 'webex::Queue::pop()']
+
+
+def test_symbol_cache_reuses_frames_across_runs(symbol_dir, tmp_path, monkeypatch):
+    calls = []
+
+    async def fake_atos(*args):
+        calls.append(args[-1])
+        return 0, f'func_{args[-1]}\n', ''
+
+    async def fake_download(version, arch, isBackup=False):
+        return True, symbol_dir
+
+    def new_symbolizer() -> Symbolizer:
+        # a new instance over the same file, like another run of the tool
+        symbolizer = Symbolizer(symbol_cache=SymbolCache(str(tmp_path / 'symbols.sqlite3')))
+        monkeypatch.setattr(symbolizer.sub_process_cmd, 'cmd', fake_atos)
+        monkeypatch.setattr(symbolizer, 'download_symbols', fake_download)
+        return symbolizer
+
+    first = new_symbolizer().symbolize(CRASH, '45.10.0.32891', 'arm64')
+    assert len(calls) == 6 and len(SymbolCache(str(tmp_path / 'symbols.sqlite3'))) == 6
+
+    # an edited report: one frame changed and the frames of thread 1 renumbered
+    calls.clear()
+    edited = CRASH.replace('0x100004000 0x100000000 + 16384', '0x100005000 0x100000000 + 20480').replace(
+        'Thread 1 Crashed:\n', 'Thread 1 Crashed:\n0   Webex                          \t       0x100002000 0x100000000 + 8192\n')
+    blocks = new_symbolizer().symbolize(edited, '45.10.0.32891', 'arm64')
+    assert calls == ['0x100005000']
+    frames = [x for b in blocks for x in b if isinstance(x, RawLine)]
+    assert all(x.symbolizedRes == f'func_{x.addressesToSymbolicate}' for x in frames)
+    assert str(first[0][1]) == str(blocks[0][2])
+
+    # the same frame in another symbol set is another entry
+    line = CrashScanner().scan_crash(CRASH).stack_blocks[0][1]
+    assert line_hash(line, symbol_dir, Arch.arm) != line_hash(line, str(tmp_path / '45.11'), Arch.arm)
+    assert line_hash(line, symbol_dir, Arch.arm) == line_hash(line.model_copy(update={'idx': 40}), symbol_dir, Arch.arm)
+
+
+def test_symbol_cache_prunes_by_count_and_age(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('MacAutoSymbolizer.src.symbol_cache.time.time', lambda: now[0])
+    cache = SymbolCache(str(tmp_path / 'symbols.sqlite3'), max_entries=3, max_age_days=1)
+
+    for i in range(5):
+        now[0] += 60
+        cache.put_many({f'h{i}': f'func_{i}'})
+    # the oldest stored go first
+    assert len(cache) == 3 and sorted(cache.get_many(f'h{i}' for i in range(5))) == ['h2', 'h3', 'h4']
+
+    # a day later the entries are misses before they are even pruned
+    now[0] += 86400 - 30
+    assert sorted(cache.get_many(['h2', 'h3', 'h4'])) == ['h4']
+    assert cache.prune() == 2 and len(cache) == 1
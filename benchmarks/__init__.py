@@ -0,0 +1,3 @@
+"""
+Offline benchmarks: synthetic crash corpora, a stub atos, a local symbol server and the scenarios
+"""
@@ -0,0 +1,267 @@
+"""
+Benchmark scenarios, in the asv layout: setup/teardown and time_* methods, params and
+param_names. Run them with `asv run` or without any extra dependency with
+`python -m benchmarks.run`. Everything is offline: reports come from benchmarks.corpus,
+atos from benchmarks.fake_atos and symbol archives from benchmarks.symbol_server.
+"""
+
+import asyncio
+import atexit
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import ClassVar
+
+from benchmarks import corpus, fake_atos
+from benchmarks.symbol_server import SymbolServer, build_archive
+from MacAutoSymbolizer.src.scanner import CrashScanner
+from MacAutoSymbolizer.src.similarity import MinHashLSH
+from MacAutoSymbolizer.src.symbol_cache import SymbolCache
+from MacAutoSymbolizer.src.symbolizer import Symbolizer
+from MacAutoSymbolizer.src.utilities import (
+    Arch,
+    Config,
+    get_dst_information,
+    get_symbol_dir,
+    set_symbol_dir,
+)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Offline:
+    """A private symbol directory with the corpus dSYMs extracted, and the fake atos on MAC_SYMBOLIZER_ATOS"""
+
+    def __init__(self, images: int = 8, atos_latency: float = 0.0, extract: bool = True):
+        self.tmp = tempfile.mkdtemp(prefix='mac-symbolizer-bench-')
+        self._old_symbol_dir = get_symbol_dir()
+        self._old_atos = os.environ.get('MAC_SYMBOLIZER_ATOS')
+        self.symbol_dir = os.path.join(self.tmp, 'symbols')
+        self.atos = fake_atos.install(os.path.join(self.tmp, 'bin'), latency=atos_latency)
+        set_symbol_dir(self.symbol_dir)
+        os.environ['MAC_SYMBOLIZER_ATOS'] = self.atos
+        if extract:
+            dst_dir, _ = get_dst_information(corpus.VERSION, Arch.arm)
+            corpus.write_symbol_dir(dst_dir, images)
+
+    def close(self):
+        set_symbol_dir(self._old_symbol_dir)
+        if self._old_atos is None:
+            os.environ.pop('MAC_SYMBOLIZER_ATOS', None)
+        else:
+            os.environ['MAC_SYMBOLIZER_ATOS'] = self._old_atos
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class ScanSuite:
+    """Scanning only, no atos and no downloads"""
+    params: ClassVar[list] = [list(corpus.FORMATS), [8, 64]]
+    param_names: ClassVar[list[str]] = ['format', 'threads']
+
+    def setup(self, fmt, threads):
+        self.tmp = tempfile.mkdtemp(prefix='mac-symbolizer-bench-')
+        self.path, = corpus.write_corpus(self.tmp, formats=(fmt,), threads=threads, frames=64)
+        self.scanner = CrashScanner()
+
+    def teardown(self, fmt, threads):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_scan_file(self, fmt, threads):
+        self.scanner.scan_file(self.path)
+
+
+class ImportSuite:
+    """Cold start of a fresh interpreter importing the package, the command line or the Symbolizer"""
+    params: ClassVar[list] = [['MacAutoSymbolizer', 'MacAutoSymbolizer.cli', 'MacAutoSymbolizer.src.symbolizer']]
+    param_names: ClassVar[list[str]] = ['module']
+    number = 1
+
+    def setup(self, module):
+        # no config.ini in the working directory, importing must not need one
+        self.tmp = tempfile.mkdtemp(prefix='mac-symbolizer-bench-')
+        self.env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.getenv('PYTHONPATH')])))
+
+    def teardown(self, module):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_import(self, module):
+        subprocess.run([sys.executable, '-c', f'import {module}'], cwd=self.tmp, env=self.env, check=True)
+
+
+class SimilaritySuite:
+    """MinHash sketches and LSH over synthetic crashed threads, one in three with an extra frame"""
+    params: ClassVar[list] = [[10000, 100000]]
+    param_names: ClassVar[list[str]] = ['stacks']
+    number = 1
+
+    def setup(self, stacks):
+        rng = random.Random(0)
+        families = [[f'spark-core!webex::f{rng.randrange(50000)}' for _ in range(24)] for _ in range(stacks // 50)]
+        self.items = []
+        for i in range(stacks):
+            tokens = list(families[i % len(families)])
+            if i % 3 == 0:
+                tokens.insert(rng.randrange(len(tokens)), f'Webex!inlined_{i % 7}')
+            self.items.append((str(i), tokens))
+        self.index = MinHashLSH()
+        self.index.rebuild(self.items)
+
+    def time_rebuild(self, stacks):
+        MinHashLSH().rebuild(self.items)
+
+    def time_query(self, stacks):
+        for _, tokens in self.items[:100]:
+            self.index.query(tokens)
+
+    def time_clusters(self, stacks):
+        self.index.clusters()
+
+
+class SymbolizeSuite:
+    """Scan, resolve dSYMs and run the fake atos over cached symbols"""
+    params: ClassVar[list] = [list(corpus.FORMATS), [0.0, 0.05]]
+    param_names: ClassVar[list[str]] = ['format', 'atos_latency']
+    number = 1
+
+    def setup(self, fmt, atos_latency):
+        self.env = _Offline(atos_latency=atos_latency)
+        self.reports = corpus.write_corpus(
+            os.path.join(self.env.tmp, 'reports'), formats=(fmt,), count=8, threads=8, frames=16
+        )
+        self.symbolizer = Symbolizer()
+        # a resubmitted report, every frame is in the symbol cache of an earlier run
+        self.cached = Symbolizer(symbol_cache=SymbolCache(os.path.join(self.env.tmp, 'symbols.sqlite3')))
+        self.cached.symbolize(self.reports[0], corpus.VERSION, corpus.ARCH)
+
+    def teardown(self, fmt, atos_latency):
+        self.env.close()
+
+    def time_symbolize_report(self, fmt, atos_latency):
+        self.symbolizer.symbolize(self.reports[0], corpus.VERSION, corpus.ARCH)
+
+    def time_symbolize_many(self, fmt, atos_latency):
+        self.symbolizer.symbolize_many([(x, corpus.VERSION, corpus.ARCH) for x in self.reports])
+
+    def time_resymbolize_cached(self, fmt, atos_latency):
+        self.cached.symbolize(self.reports[0], corpus.VERSION, corpus.ARCH)
+
+
+class DownloadSuite:
+    """Chunked download, validation and extraction of a synthetic osxsymbols.7z from a local server"""
+    params: ClassVar[list] = [[16, 128]]
+    param_names: ClassVar[list[str]] = ['archive_mb']
+    number = 1
+    timeout = 300
+
+    def setup(self, archive_mb):
+        self.env = _Offline(extract=False)
+        build_archive(
+            os.path.join(self.env.tmp, 'www', corpus.VERSION, Config.get('symbols', 'symbol_zip')),
+            images=8,
+            dwarf_size=archive_mb * 1024 * 1024 // 8
+        )
+        self.server = SymbolServer(os.path.join(self.env.tmp, 'www')).start()
+        self._old_url = Config.get('symbols', 'url_arm64')
+        Config.set('symbols', 'url_arm64', self.server.url)
+        self.symbolizer = Symbolizer()
+
+    def teardown(self, archive_mb):
+        Config.set('symbols', 'url_arm64', self._old_url)
+        self.server.stop()
+        self.env.close()
+
+    def time_download_symbols(self, archive_mb):
+        # every sample starts from an empty cache
+        shutil.rmtree(os.path.join(get_symbol_dir(), corpus.VERSION), ignore_errors=True)
+        ok, _ = asyncio.run(self.symbolizer.download_symbols(corpus.VERSION, Arch.arm))
+        if not ok:
+            raise RuntimeError('download failed')
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+_web_env: _Offline | None = None
+
+
+def _web_app():
+    """
+    webPage.app builds its symbolizer and shared state at import, so the web benchmarks share
+    one offline environment for the whole process
+    """
+    global _web_env
+    if _web_env is None:
+        _web_env = _Offline()
+        atexit.register(_web_env.close)
+        os.environ['MAC_SYMBOLIZER_SHARED_STATE'] = os.path.join(_web_env.tmp, 'web_state.sqlite3')
+        if Config.has_section('prefetch'):
+            Config.set('prefetch', 'interval_minutes', '0')
+    # other suites may have switched them in between
+    set_symbol_dir(_web_env.symbol_dir)
+    os.environ['MAC_SYMBOLIZER_ATOS'] = _web_env.atos
+    cwd = os.getcwd()
+    try:
+        from webPage.app import app
+    finally:
+        # importing the app changes to the project root
+        os.chdir(cwd)
+    return app
+
+
+class WebSuite:
+    """POST /symbolize against the FastAPI app under uvicorn, every request misses the result cache"""
+    params: ClassVar[list] = [[1, 8]]
+    param_names: ClassVar[list[str]] = ['concurrency']
+    number = 1
+    timeout = 300
+
+    def setup(self, concurrency):
+        import uvicorn
+
+        app = _web_app()
+        self.content = corpus.generate('crash', threads=8, frames=16)
+        self.port = _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=self.port, log_level='warning'))
+        self.thread = threading.Thread(target=self.server.run, name='bench-uvicorn', daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError('uvicorn did not start')
+            time.sleep(0.05)
+
+    def teardown(self, concurrency):
+        self.server.should_exit = True
+        self.thread.join()
+
+    async def _request(self, session) -> None:
+        import aiohttp
+
+        form = aiohttp.FormData()
+        form.add_field('version', corpus.VERSION)
+        form.add_field('arch', corpus.ARCH)
+        # a unique report, the result cache must not answer it
+        form.add_field('stack_content', f'Incident Identifier: {uuid.uuid4()}\n{self.content}')
+        async with session.post(f'http://127.0.0.1:{self.port}/symbolize', data=form) as response:
+            body = await response.json()
+            if not body.get('success'):
+                raise RuntimeError(body.get('error'))
+
+    def time_symbolize_request(self, concurrency):
+        import aiohttp
+
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                await asyncio.gather(*[self._request(session) for _ in range(concurrency)])
+
+        asyncio.run(run())
@@ -0,0 +1,200 @@
+"""
+Synthetic crash corpora
+Generates .crash, .ips, .diag and .spin reports in the formats the scanner understands,
+with a configurable number of images, threads and frames per thread. The same seed
+always produces the same report, so benchmark runs are comparable across releases.
+"""
+
+import json
+import os
+import random
+import uuid
+from dataclasses import dataclass
+
+VERSION = '45.10.0.32891'
+ARCH = 'arm64'
+FORMATS = ('crash', 'ips', 'diag', 'spin')
+
+_BASE_ADDRESS = 0x100000000
+_IMAGE_STRIDE = 0x1000000
+
+
+@dataclass(frozen=True)
+class SyntheticImage:
+    name: str
+    dsym: str
+    path: str
+    load_address: int
+    size: int
+    uuid: str
+
+
+def make_images(count: int = 8, seed: int = 0) -> list[SyntheticImage]:
+    """The app binary, spark-core, then numbered frameworks; every image gets its own dSYM name"""
+    rnd = random.Random(seed)
+    names = ['Webex', 'spark-core'] + [f'libbench{i}' for i in range(max(count - 2, 0))]
+    images = []
+    for i, name in enumerate(names[:count]):
+        if name == 'Webex':
+            dsym, path = 'Webex.app.dSYM', '/Applications/Webex.app/Contents/MacOS/Webex'
+        else:
+            dsym = f'{name}.framework.dSYM'
+            path = f'/Applications/Webex.app/Contents/Frameworks/{name}.framework/Versions/A/{name}'
+        images.append(SyntheticImage(
+            name=name,
+            dsym=dsym,
+            path=path,
+            load_address=_BASE_ADDRESS + i * _IMAGE_STRIDE,
+            size=_IMAGE_STRIDE - 1,
+            uuid=str(uuid.UUID(int=rnd.getrandbits(128))).upper(),
+        ))
+    return images
+
+
+def _frames(images: list[SyntheticImage], threads: int, frames: int, seed: int):
+    """[(thread index, [(image index, offset)])], offsets are 16 byte aligned like return addresses"""
+    rnd = random.Random(seed)
+    return [
+        (t, [(rnd.randrange(len(images)), rnd.randrange(0x1000, 0x800000) & ~0xf) for _ in range(frames)])
+        for t in range(threads)
+    ]
+
+
+def generate_crash(threads: int = 8, frames: int = 32, images: int = 8, seed: int = 0) -> str:
+    """A text crash report, thread 1 (or 0) crashed"""
+    image_list = make_images(images, seed)
+    crashed = min(1, threads - 1)
+    out = [
+        'Process:               Webex [4242]',
+        'Path:                  /Applications/Webex.app/Contents/MacOS/Webex',
+        'Identifier:            Cisco-Systems.Spark',
+        f'Version:               {VERSION} (32891)',
+        'Code Type:             ARM-64 (Native)',
+        'OS Version:            macOS 14.5 (23F79)',
+        'Exception Type:        EXC_BAD_ACCESS (SIGSEGV)',
+        f'Crashed Thread:        {crashed}',
+        '',
+    ]
+    for t, stack in _frames(image_list, threads, frames, seed):
+        out.append(f'Thread {t} Crashed:' if t == crashed else f'Thread {t}:')
+        for i, (image_idx, offset) in enumerate(stack):
+            image = image_list[image_idx]
+            address = image.load_address + offset
+            out.append(f'{i:<4}{image.name:<31}\t       {address:#x} {image.load_address:#x} + {offset}')
+        out.append('')
+    out.append('Binary Images:')
+    for image in image_list:
+        out.append(
+            f'       {image.load_address:#x} -        {image.load_address + image.size:#x} '
+            f'com.cisco.{image.name} (1.0) <{image.uuid}> {image.path}'
+        )
+    return '\n'.join(out) + '\n'
+
+
+def generate_ips(threads: int = 8, frames: int = 32, images: int = 8, seed: int = 0) -> str:
+    """An .ips report: the metadata line, then the JSON body"""
+    image_list = make_images(images, seed)
+    crashed = min(1, threads - 1)
+    short_version, build = VERSION.rsplit('.', 1)
+    meta = {'app_name': 'Webex', 'app_version': short_version, 'build_version': build, 'bug_type': '309'}
+    body = {
+        'procName': 'Webex',
+        'pid': 4242,
+        'cpuType': 'ARM-64',
+        'captureTime': '2025-08-12 11:30:51.0000 +0800',
+        'faultingThread': crashed,
+        'bundleInfo': {'CFBundleShortVersionString': short_version, 'CFBundleVersion': build,
+                       'CFBundleIdentifier': 'Cisco-Systems.Spark'},
+        'exception': {'type': 'EXC_BAD_ACCESS', 'signal': 'SIGSEGV'},
+        'usedImages': [
+            {'base': x.load_address, 'size': x.size, 'arch': ARCH, 'uuid': x.uuid.lower(),
+             'name': x.name, 'path': x.path}
+            for x in image_list
+        ],
+        'threads': [
+            dict(
+                {'id': 1000 + t, 'frames': [{'imageIndex': i, 'imageOffset': offset} for i, offset in stack]},
+                **({'triggered': True} if t == crashed else {})
+            )
+            for t, stack in _frames(image_list, threads, frames, seed)
+        ],
+    }
+    return json.dumps(meta) + '\n' + json.dumps(body)
+
+
+def generate_diagnostic(threads: int = 8, frames: int = 32, images: int = 8, seed: int = 0, kind: str = 'spin') -> str:
+    """A spindump style report, kind is 'spin' or 'diag' and only changes the header"""
+    image_list = make_images(images, seed)
+    event = 'hang' if kind == 'spin' else 'cpu usage'
+    out = [
+        'Date/Time:        2025-08-12 11:30:51.000 +0800',
+        'OS Version:       macOS 14.5 (Build 23F79)',
+        'Architecture:     arm64',
+        f'Event:            {event}',
+        '',
+        'Process:          Webex [4242]',
+        'Path:             /Applications/Webex.app/Contents/MacOS/Webex',
+        f'Version:          {VERSION} (32891)',
+        '',
+    ]
+    for t, stack in _frames(image_list, threads, frames, seed):
+        out.append(f'  Thread {t:#x}    {frames} samples (1-{frames})    priority 31 (base 31)')
+        for depth, (image_idx, offset) in enumerate(stack):
+            image = image_list[image_idx]
+            address = image.load_address + offset
+            out.append(f'  {" " * min(depth, 20)}{frames - depth}  ??? ({image.name} + {offset}) [{address:#x}]')
+        out.append('')
+    out.append('Binary Images:')
+    for image in image_list:
+        out.append(
+            f'       {image.load_address:#x} -        {image.load_address + image.size:#x}  '
+            f'com.cisco.{image.name} 1.0 <{image.uuid}>  {image.path}'
+        )
+    return '\n'.join(out) + '\n'
+
+
+def generate(fmt: str, threads: int = 8, frames: int = 32, images: int = 8, seed: int = 0) -> str:
+    if fmt == 'crash':
+        return generate_crash(threads, frames, images, seed)
+    if fmt == 'ips':
+        return generate_ips(threads, frames, images, seed)
+    if fmt in ('diag', 'spin'):
+        return generate_diagnostic(threads, frames, images, seed, kind=fmt)
+    raise ValueError(f'Unknown format: {fmt}, expected one of {FORMATS}')
+
+
+def write_corpus(
+        directory: str,
+        formats: tuple[str, ...] = FORMATS,
+        count: int = 1,
+        threads: int = 8,
+        frames: int = 32,
+        images: int = 8
+) -> list[str]:
+    """
+    Write count reports of every format
+    :return: paths of the written reports, report i of each format uses seed i
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        for seed in range(count):
+            path = os.path.join(directory, f'Webex-{seed:04d}.{fmt}')
+            with open(path, 'w') as f:
+                f.write(generate(fmt, threads, frames, images, seed))
+            paths.append(path)
+    return paths
+
+
+def write_symbol_dir(directory: str, images: int = 8, dwarf_size: int = 0, seed: int = 0) -> str:
+    """
+    Create the extracted layout of a symbol archive: <name>.dSYM/Contents/Resources/DWARF/<name>
+    :param dwarf_size: bytes of pseudo random DWARF content per image, makes archives realistically large
+    """
+    rnd = random.Random(seed)
+    for image in make_images(images, seed):
+        dwarf_dir = os.path.join(directory, image.dsym, 'Contents', 'Resources', 'DWARF')
+        os.makedirs(dwarf_dir, exist_ok=True)
+        with open(os.path.join(dwarf_dir, image.name), 'wb') as f:
+            f.write(rnd.randbytes(dwarf_size))
+    return directory
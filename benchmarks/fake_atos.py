@@ -0,0 +1,67 @@
+"""
+Stub atos
+Accepts the atos command line the symbolizer builds (-arch, -o, -l and addresses) and prints
+one symbol per address after a configurable delay, so symbolization can be measured on any
+platform without real dSYMs:
+
+    FAKE_ATOS_LATENCY      seconds per invocation, models the dSYM load of the real atos
+    FAKE_ATOS_PER_ADDRESS  seconds per looked up address
+
+install() writes an executable wrapper, point MAC_SYMBOLIZER_ATOS at it.
+"""
+
+import os
+import stat
+import sys
+import time
+
+
+def parse_args(args: list[str]) -> tuple[str, list[str]]:
+    """:return: (binary path, addresses), stray arguments are ignored like atos does"""
+    binary, addresses = '', []
+    it = iter(args)
+    for arg in it:
+        if arg in ('-arch', '-l'):
+            next(it, None)
+        elif arg == '-o':
+            binary = next(it, '')
+        elif arg.startswith('0x'):
+            addresses.append(arg)
+    return binary, addresses
+
+
+def symbolize(binary: str, addresses: list[str]) -> list[str]:
+    image = os.path.basename(binary) or 'unknown'
+    return [f'bench_{image}_{address} (in {image}) (bench.cpp:{int(address, 16) % 1000})' for address in addresses]
+
+
+def main(args: list[str] | None = None) -> int:
+    binary, addresses = parse_args(sys.argv[1:] if args is None else args)
+    delay = float(os.getenv('FAKE_ATOS_LATENCY', '0')) + float(os.getenv('FAKE_ATOS_PER_ADDRESS', '0')) * len(addresses)
+    if delay > 0:
+        time.sleep(delay)
+    sys.stdout.write(''.join(f'{x}\n' for x in symbolize(binary, addresses)))
+    return 0
+
+
+def install(directory: str, latency: float = 0.0, per_address: float = 0.0) -> str:
+    """
+    Write an executable 'atos' into directory that runs this module with the given delays
+    :return: path of the executable
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'atos')
+    with open(path, 'w') as f:
+        f.write(
+            '#!/bin/sh\n'
+            f'FAKE_ATOS_LATENCY="${{FAKE_ATOS_LATENCY:-{latency}}}" '
+            f'FAKE_ATOS_PER_ADDRESS="${{FAKE_ATOS_PER_ADDRESS:-{per_address}}}" '
+            # -S skips site-packages, the stub only needs the standard library and starts faster
+            f'exec "{sys.executable}" -S "{os.path.abspath(__file__)}" "$@"\n'
+        )
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Run the benchmark scenarios without asv and write the timings as JSON
+
+    python -m benchmarks.run --output results/3.0.0.json
+    python -m benchmarks.run --quick --filter Scan --compare results/3.0.0.json
+
+Every benchmark is named Suite.time_method and identified by its parameters, so the result
+files of two releases can be compared entry by entry.
+"""
+
+import argparse
+import inspect
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+RESULTS_SCHEMA = 1
+
+
+def discover(module) -> list[type]:
+    """Classes of module with time_* methods, in definition order"""
+    return [
+        cls for _, cls in inspect.getmembers(module, inspect.isclass)
+        if cls.__module__ == module.__name__ and any(x.startswith('time_') for x in dir(cls))
+    ]
+
+
+def param_combinations(cls) -> list[dict]:
+    params = getattr(cls, 'params', [])
+    names = getattr(cls, 'param_names', [])
+    if not params:
+        return [{}]
+    if names and len(names) == 1 and not isinstance(params[0], list):
+        params = [params]
+    return [dict(zip(names, values)) for values in itertools.product(*params)]
+
+
+def run_benchmark(cls, method: str, params: dict, repeat: int, warmup: bool = True) -> dict:
+    """
+    Time one method with one parameter combination, setup and teardown are not timed
+    :return: statistics in seconds per call
+    """
+    instance = cls()
+    args = list(params.values())
+    number = getattr(cls, 'number', 0) or 1
+    samples = []
+    if hasattr(instance, 'setup'):
+        instance.setup(*args)
+    try:
+        func = getattr(instance, method)
+        if warmup:
+            func(*args)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func(*args)
+            samples.append((time.perf_counter() - start) / number)
+    finally:
+        if hasattr(instance, 'teardown'):
+            instance.teardown(*args)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'max': max(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'samples': len(samples),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _package_version() -> str | None:
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version('maccrashautosymbolizer')
+    except PackageNotFoundError:
+        return None
+
+
+def environment() -> dict:
+    return {
+        'schema': RESULTS_SCHEMA,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'package_version': _package_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def result_key(result: dict) -> str:
+    params = ','.join(f'{k}={v}' for k, v in result['params'].items())
+    return f'{result["name"]}({params})'
+
+
+def compare(baseline: dict, current: dict) -> list[tuple[str, float, float, float]]:
+    """:return: (benchmark, baseline median, current median, current / baseline) for benchmarks in both"""
+    old = {result_key(x): x['stats']['median'] for x in baseline['results']}
+    rows = []
+    for result in current['results']:
+        key = result_key(result)
+        if key in old and old[key] > 0:
+            rows.append((key, old[key], result['stats']['median'], result['stats']['median'] / old[key]))
+    return rows
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Run the offline benchmarks')
+    parser.add_argument('--filter', default='', help='only benchmarks whose Suite.method matches this regex')
+    parser.add_argument('--repeat', type=int, default=5, help='timed samples per benchmark (default 5)')
+    parser.add_argument('--quick', action='store_true',
+                        help='first parameter combination only, one sample and no warmup')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='print the ratio to an earlier results file')
+    parser.add_argument('--fail-above', type=float, metavar='RATIO',
+                        help='with --compare, exit with 1 when a benchmark is slower than RATIO times the baseline')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the symbolizer (default WARNING)')
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    from benchmarks import benchmarks
+
+    pattern = re.compile(args.filter)
+    results = []
+    for cls in discover(benchmarks):
+        methods = sorted(x for x in dir(cls) if x.startswith('time_') and pattern.search(f'{cls.__name__}.{x}'))
+        combinations = param_combinations(cls)
+        if args.quick:
+            combinations = combinations[:1]
+        for method, params in itertools.product(methods, combinations):
+            name = f'{cls.__name__}.{method}'
+            stats = run_benchmark(cls, method, params, 1 if args.quick else args.repeat, warmup=not args.quick)
+            results.append({'name': name, 'params': params, 'stats': stats})
+            print(f'{name:<45} {json.dumps(params):<40} median {stats["median"] * 1000:10.2f} ms', flush=True)
+
+    report = {'environment': environment(), 'results': results}
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            rows = compare(json.load(f), report)
+        for key, old, new, ratio in rows:
+            print(f'{key:<85} {old * 1000:10.2f} ms -> {new * 1000:10.2f} ms  x{ratio:.2f}')
+        if args.fail_above and any(ratio > args.fail_above for *_, ratio in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
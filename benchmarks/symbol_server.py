@@ -0,0 +1,178 @@
+"""
+Local symbol server
+Serves synthetic osxsymbols.7z archives over HTTP with HEAD and single Range requests,
+the way the real symbol server does, so downloads can be measured without a network:
+
+    with SymbolServer(root) as server:
+        Config.set('symbols', 'url_arm64', server.url)
+
+Files are served from root/<version>/<symbol_zip>, matching symbol_file_format.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import write_symbol_dir
+
+_RANGE_REGEX = re.compile(r'bytes=(\d*)-(\d*)')
+_PIECE_SIZE = 64 * 1024
+
+
+def build_archive(path: str, images: int = 8, dwarf_size: int = 1024 * 1024, compress: bool = False) -> str:
+    """
+    Pack a synthetic symbol directory into a 7z archive
+    :param dwarf_size: bytes per image, the archive is about images * dwarf_size
+    :param compress: LZMA2 like the real archives, slower to build and extract; stored otherwise
+    """
+    import py7zr
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with tempfile.TemporaryDirectory() as src:
+        write_symbol_dir(src, images, dwarf_size)
+        filters = None if compress else [{'id': py7zr.FILTER_COPY}]
+        with py7zr.SevenZipFile(path, 'w', filters=filters) as archive:
+            for name in sorted(os.listdir(src)):
+                archive.writeall(os.path.join(src, name), name)
+    return path
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    :return: inclusive (start, end) of a single byte range, None for no or an ignored header
+    :raise ValueError: the range cannot be satisfied
+    """
+    if not header:
+        return None
+    match = _RANGE_REGEX.fullmatch(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: '_Server'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _resolve(self) -> str | None:
+        path = os.path.normpath(os.path.join(self.server.root, self.path.split('?', 1)[0].lstrip('/')))
+        if not path.startswith(self.server.root + os.sep) or not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        return path
+
+    def do_HEAD(self):
+        self.server.record(self.command, self.headers.get('Range'))
+        if path := self._resolve():
+            self.send_response(200)
+            self.send_header('Content-Length', str(os.path.getsize(path)))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+
+    def do_GET(self):
+        self.server.record(self.command, self.headers.get('Range'))
+        path = self._resolve()
+        if not path:
+            return
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(self.headers.get('Range'), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        if byte_range:
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                piece = f.read(min(_PIECE_SIZE, remaining))
+                if not piece:
+                    break
+                self.wfile.write(piece)
+                remaining -= len(piece)
+                if self.server.max_bytes_per_second:
+                    time.sleep(len(piece) / self.server.max_bytes_per_second)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, root: str, latency: float, max_bytes_per_second: float | None):
+        super().__init__(address, _Handler)
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.max_bytes_per_second = max_bytes_per_second
+        self.requests: list[tuple[str, str | None]] = []
+        self._lock = threading.Lock()
+
+    def record(self, method: str, byte_range: str | None):
+        with self._lock:
+            self.requests.append((method, byte_range))
+
+
+class SymbolServer:
+    """
+    :param root: directory served at /
+    :param latency: seconds before every GET body, models the time to first byte
+    :param max_bytes_per_second: per connection bandwidth, None means as fast as the loopback allows
+    """
+
+    def __init__(self, root: str, latency: float = 0.0, max_bytes_per_second: float | None = None):
+        self._server = _Server(('127.0.0.1', 0), root, latency, max_bytes_per_second)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self) -> list[tuple[str, str | None]]:
+        """(method, Range header) of every request so far"""
+        return self._server.requests
+
+    def start(self) -> 'SymbolServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='symbol-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
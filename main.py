@@ -1 +1,6 @@
+import sys
 
+from MacAutoSymbolizer.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
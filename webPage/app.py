@@ -1,20 +1,28 @@
+import asyncio
+import json
 import logging
 import os
+import sqlite3
+import sys
 import tempfile
-import asyncio
-import concurrent.futures
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List
-from pathlib import Path
+from typing import Annotated
 
-from fastapi import FastAPI, Request, Form, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse
+import aiofiles
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
 # 导入MacAutoSymbolizer
-import sys
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
@@ -24,226 +32,492 @@ original_cwd = os.getcwd()
 os.chdir(project_root)
 
 from MacAutoSymbolizer import Symbolizer
+from MacAutoSymbolizer.src import metrics
+from MacAutoSymbolizer.src.prefetcher import (
+    PrefetchTarget,
+    SymbolPrefetcher,
+    configured_targets,
+)
+from MacAutoSymbolizer.src.resource_config import get_resource_config
+from MacAutoSymbolizer.src.signature import BucketIndex
+from MacAutoSymbolizer.src.symbol_cache import SymbolCache
+from MacAutoSymbolizer.src.utilities import (
+    get_symbol_dir,
+    prefetch_archs,
+    prefetch_history_size,
+    prefetch_interval_minutes,
+)
+from webPage.jobs import (
+    JobManager,
+    JobQueueFull,
+    format_block,
+    record_version,
+    symbolize_cached,
+)
+from webPage.log_capture import LogCapture, LogCaptureSystem, current_capture
+from webPage.shared_state import SharedState
+
+logger = logging.getLogger('webPage.app')
+
+# 日志经队列交给后台线程分发，按请求/任务捕获
+log_system = LogCaptureSystem()
+log_system.install()
+
+# 各阶段耗时和计数，默认保存在内存中供/metrics导出，可通过MAC_SYMBOLIZER_METRICS调整（memory,otel,off）
+metrics_sink = metrics.configure_from_env(default='memory')
+
+# 共享的符号化器，所有请求在同一个事件循环中并发执行
+# 配置了[signature] index_path时按崩溃签名分桶，已完整符号化过的崩溃只符号化崩溃线程
+# 配置了[symbols] symbol_cache_path时按帧缓存atos结果，重复提交的报告只符号化改动过的帧
+symbolizer = Symbolizer(bucket_index=BucketIndex.from_config(), symbol_cache=SymbolCache.from_config())
+
+# 多worker进程共享的结果缓存和负载心跳，默认放在共享的符号目录下
+shared_state = SharedState(
+    os.getenv('MAC_SYMBOLIZER_SHARED_STATE', os.path.join(get_symbol_dir(), '.web_state.sqlite3'))
+)
+
+# 后台任务队列，worker数量和等待上限来自resource_config
+resource_config = get_resource_config()
+job_manager = JobManager(
+    symbolizer,
+    workers=resource_config.max_concurrent_jobs,
+    max_queued=resource_config.max_queued_jobs,
+    log_system=log_system,
+    shared_state=shared_state
+)
+
+# 后台预下载：配置中的版本和最近请求过的版本，限速并只在空闲时段下载
+prefetcher = SymbolPrefetcher.from_config(symbolizer)
+prefetch_tasks: set[asyncio.Task] = set()
+
+def prefetch_targets() -> list[PrefetchTarget]:
+    """配置中的版本，加上最近请求过的版本（所有配置的架构都下载）"""
+    targets = configured_targets()
+    history_size = prefetch_history_size()
+    if history_size > 0:
+        targets += [
+            PrefetchTarget(version, arch, isBackup)
+            for version, isBackup in shared_state.recent_versions(history_size)
+            for arch in prefetch_archs()
+        ]
+    return targets
+
+def _start_prefetch(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    prefetch_tasks.add(task)
+    task.add_done_callback(prefetch_tasks.discard)
+    return task
 
-app = FastAPI(title="MacCrash Auto Symbolizer Web", version="1.0.0")
+HEARTBEAT_INTERVAL = 5
+
+async def heartbeat_loop():
+    """定期把本worker的负载写入共享状态，供/healthz汇总"""
+    while True:
+        try:
+            await asyncio.to_thread(shared_state.heartbeat, **job_manager.load())
+        except sqlite3.Error as e:
+            logger.warning(f"写入worker心跳失败: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_system.start()
+    await job_manager.start()
+    heartbeat = asyncio.create_task(heartbeat_loop())
+    if prefetch_interval_minutes() > 0:
+        _start_prefetch(prefetcher.run_forever(prefetch_targets, prefetch_interval_minutes() * 60))
+    yield
+    heartbeat.cancel()
+    for task in list(prefetch_tasks):
+        task.cancel()
+    await job_manager.stop()
+    await asyncio.to_thread(shared_state.remove_worker)
+    log_system.stop()
+
+app = FastAPI(title="MacCrash Auto Symbolizer Web", version="1.0.0", lifespan=lifespan)
 
 # 静态文件和模板设置
 webPage_dir = os.path.join(project_root, "webPage")
 app.mount("/static", StaticFiles(directory=os.path.join(webPage_dir, "static")), name="static")
 templates = Jinja2Templates(directory=os.path.join(webPage_dir, "templates"))
 
-# 全局变量存储日志输出
-log_output: List[str] = []
-
 class LogOutput(BaseModel):
-    logs: List[str]
+    logs: list[str]
 
 class SymbolizeResponse(BaseModel):
     success: bool
-    output: Optional[str] = None
-    error: Optional[str] = None
-    logs: List[str]
-
-class CustomLogHandler(logging.Handler):
-    """自定义日志处理器，将日志输出到全局变量"""
-    def emit(self, record):
-        global log_output
-        log_msg = self.format(record)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        formatted_msg = f"[{timestamp}] {record.levelname}: {log_msg}"
-        log_output.append(formatted_msg)
-        print(formatted_msg)  # 同时输出到控制台
-
-# 配置日志
-def setup_logging():
-    """设置日志配置"""
-    # 创建自定义处理器
-    custom_handler = CustomLogHandler()
-    custom_handler.setLevel(logging.DEBUG)
-    
-    # 设置日志格式
-    formatter = logging.Formatter('%(name)s - %(message)s')
-    custom_handler.setFormatter(formatter)
-    
-    # 获取所有相关的logger并添加处理器
-    loggers_to_configure = [
-        'MacAutoSymbolizer',
-        'MacAutoSymbolizer.src.symbolizer',
-        'MacAutoSymbolizer.src.scanner',
-        'MacAutoSymbolizer.src.advanced_downloader',
-        '__main__'
-    ]
-    
-    for logger_name in loggers_to_configure:
-        logger = logging.getLogger(logger_name)
-        logger.setLevel(logging.DEBUG)
-        logger.addHandler(custom_handler)
-        # 防止重复日志
-        logger.propagate = False
+    output: str | None = None
+    error: str | None = None
+    logs: list[str]
 
-# 初始化日志
-setup_logging()
-
-# 创建线程池执行器
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
-
-def run_symbolize_in_thread(content_or_path: str, version: str, arch: str, isBackup: bool = False):
-    """在线程中运行符号化，避免事件循环冲突"""
-    try:
-        # 在新线程中创建新的事件循环
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            symbolizer = Symbolizer()
-            result = symbolizer.symbolize(
-                content_or_path=content_or_path,
-                version=version,
-                arch=arch,
-                isBackup=isBackup
-            )
-            return result
-        finally:
-            # 清理事件循环
-            loop.close()
-            
-    except Exception as e:
-        raise e
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    queue_position: int | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    output: str | None = None
+    error: str | None = None
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """主页面"""
     return templates.TemplateResponse("index.html", {"request": request})
 
+async def _prepare_input(
+    version: str,
+    arch: str,
+    isNDI: bool,
+    stack_content: str | None,
+    crash_file: UploadFile | None
+) -> tuple[str | None, str | None]:
+    """验证输入参数并准备符号化输入，返回 (content_or_path, temp_file_path)"""
+    # 验证输入参数
+    if not version.strip():
+        raise HTTPException(status_code=400, detail="版本号不能为空")
+
+    if arch not in ["arm64", "x86"]:
+        raise HTTPException(status_code=400, detail="架构必须是 arm64 或 x86")
+
+    # 检查是否提供了stack内容或文件
+    if not stack_content and not crash_file:
+        raise HTTPException(status_code=400, detail="必须提供stack内容或上传文件")
+
+    if stack_content and crash_file:
+        raise HTTPException(status_code=400, detail="不能同时提供stack内容和文件")
+
+    # 添加初始日志
+    logger.info("开始符号化处理...")
+    logger.info(f"版本: {version}")
+    logger.info(f"架构: {arch}")
+    logger.info(f"NDI模式: {isNDI}")
+
+    # 准备输入内容
+    content_or_path = None
+    temp_file_path = None
+
+    if stack_content:
+        # 使用直接提供的stack内容
+        content_or_path = stack_content.strip()
+        logger.info("使用直接输入的stack内容")
+    elif crash_file.filename:
+        # 处理上传的文件
+        logger.info(f"处理上传文件: {crash_file.filename}")
+        temp_file_path = await _save_upload(crash_file)
+        content_or_path = temp_file_path
+        logger.info(f"文件已保存到临时位置: {temp_file_path}")
+
+    return content_or_path, temp_file_path
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def _save_upload(crash_file: UploadFile) -> str:
+    """
+    分块把上传文件写入临时文件，内存占用与文件大小无关
+    超过resource_config.max_upload_mb时删除临时文件并返回413
+    """
+    max_bytes = resource_config.max_upload_mb * 1024 * 1024
+    too_large = HTTPException(status_code=413, detail=f"上传文件不能超过 {resource_config.max_upload_mb}MB")
+    if crash_file.size is not None and crash_file.size > max_bytes:
+        raise too_large
+
+    # 只保留文件名部分，扩展名决定扫描方式；加随机后缀避免同名文件冲突
+    filename = os.path.basename(crash_file.filename)
+    temp_file_path = os.path.join(
+        tempfile.gettempdir(),
+        f"crash_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{filename}"
+    )
+    written = 0
+    try:
+        async with aiofiles.open(temp_file_path, 'wb') as f:
+            while chunk := await crash_file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise too_large
+                await f.write(chunk)
+    except BaseException:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        raise
+    return temp_file_path
+
+def _remove_temp_file(temp_file_path: str | None):
+    """清理临时文件"""
+    if temp_file_path and os.path.exists(temp_file_path):
+        try:
+            os.remove(temp_file_path)
+            logger.info("临时文件已清理")
+        except OSError as e:
+            logger.warning(f"临时文件清理失败: {e}")
+
+def _sse_event(event: str, data: dict) -> str:
+    """编码一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/symbolize", response_model=SymbolizeResponse)
 async def symbolize_crash(
     version: str = Form(..., description="版本号，必填"),
     arch: str = Form(..., description="架构，arm64或x86"),
     isNDI: bool = Form(False, description="是否启用NDI"),
-    stack_content: Optional[str] = Form(None, description="Stack内容"),
-    crash_file: Optional[UploadFile] = File(None, description="崩溃文件上传")
+    stack_content: Annotated[str | None, Form(description="Stack内容")] = None,
+    crash_file: Annotated[UploadFile | None, File(description="崩溃文件上传")] = None
 ):
     """处理符号化请求"""
-    global log_output
-    
-    # 清空之前的日志
-    log_output.clear()
+    # 本请求的日志只写入自己的捕获器
+    capture = LogCapture()
+    token = current_capture.set(capture)
+    temp_file_path = None
     
     try:
-        # 验证输入参数
-        if not version.strip():
-            raise HTTPException(status_code=400, detail="版本号不能为空")
-        
-        if arch not in ["arm64", "x86"]:
-            raise HTTPException(status_code=400, detail="架构必须是 arm64 或 x86")
-        
-        # 检查是否提供了stack内容或文件
-        if not stack_content and not crash_file:
-            raise HTTPException(status_code=400, detail="必须提供stack内容或上传文件")
+        content_or_path, temp_file_path = await _prepare_input(version, arch, isNDI, stack_content, crash_file)
         
-        if stack_content and crash_file:
-            raise HTTPException(status_code=400, detail="不能同时提供stack内容和文件")
-        
-        # 添加初始日志
-        log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 开始符号化处理...")
-        log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 版本: {version}")
-        log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 架构: {arch}")
-        log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: NDI模式: {isNDI}")
-        
-        # 准备输入内容
-        content_or_path = None
-        temp_file_path = None
-        
-        if stack_content:
-            # 使用直接提供的stack内容
-            content_or_path = stack_content.strip()
-            log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 使用直接输入的stack内容")
-        else:
-            # 处理上传的文件
-            if crash_file.filename:
-                log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 处理上传文件: {crash_file.filename}")
-                
-                # 创建临时文件保存上传内容
-                temp_dir = tempfile.gettempdir()
-                temp_file_path = os.path.join(temp_dir, f"crash_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{crash_file.filename}")
-                
-                # 读取并保存文件内容
-                file_content = await crash_file.read()
-                with open(temp_file_path, 'wb') as f:
-                    f.write(file_content)
-                
-                content_or_path = temp_file_path
-                log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 文件已保存到临时位置: {temp_file_path}")
-        
-        # 执行符号化（在线程池中运行避免事件循环冲突）
-        log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 开始符号化处理...")
+        # 执行符号化
+        logger.info("开始符号化处理...")
         
         # 调整架构格式
         arch_format = "x86_64" if arch == "x86" else arch
         
-        # 在线程池中运行符号化，避免事件循环冲突
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            run_symbolize_in_thread,
-            content_or_path,
-            version,
-            arch_format,
-            isNDI
+        output_result = await symbolize_cached(
+            symbolizer, shared_state, content_or_path, version, arch_format, isNDI
         )
         
-        output_lines = []
-        for block in result:
-            output_lines.append("-" * 100)
-            for line in block:
-                output_lines.append(str(line))
-
-        output_result = "\n".join(output_lines)
-        
-        log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 符号化处理完成!")
-        
-        # 清理临时文件
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] INFO: 临时文件已清理")
-            except Exception as e:
-                log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] WARNING: 临时文件清理失败: {str(e)}")
+        logger.info("符号化处理完成!")
+        await log_system.flush()
         
         return SymbolizeResponse(
             success=True,
             output=output_result,
-            logs=log_output.copy()
+            logs=capture.lines()
         )
         
     except Exception as e:
         error_msg = str(e)
-        log_output.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR: {error_msg}")
-        
-        # 清理临时文件
-        if 'temp_file_path' in locals() and temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-            except:
-                pass
+        logger.error(error_msg)
+        await log_system.flush()
         
         return SymbolizeResponse(
             success=False,
             error=error_msg,
-            logs=log_output.copy()
+            logs=capture.lines()
+        )
+    finally:
+        # 清理临时文件
+        _remove_temp_file(temp_file_path)
+        current_capture.reset(token)
+
+@app.post("/symbolize/stream")
+async def symbolize_crash_stream(
+    version: str = Form(..., description="版本号，必填"),
+    arch: str = Form(..., description="架构，arm64或x86"),
+    isNDI: bool = Form(False, description="是否启用NDI"),
+    stack_content: Annotated[str | None, Form(description="Stack内容")] = None,
+    crash_file: Annotated[UploadFile | None, File(description="崩溃文件上传")] = None
+):
+    """
+    流式符号化：以 SSE 推送每个完成的线程块，崩溃线程最先到达。
+    事件: block {index, text}，log {line}，done {logs}，error {error, logs}
+    """
+    capture = LogCapture()
+    token = current_capture.set(capture)
+
+    # 上传文件必须在响应开始前读取完毕
+    try:
+        content_or_path, temp_file_path = await _prepare_input(version, arch, isNDI, stack_content, crash_file)
+    except Exception as e:  # noqa: BLE001 - every failure is reported as an SSE error event
+        error_msg = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(error_msg)
+        await log_system.flush()
+        failed = _sse_event("error", {"error": error_msg, "logs": capture.lines()})
+        return StreamingResponse(iter([failed]), media_type="text/event-stream")
+    finally:
+        current_capture.reset(token)
+
+    arch_format = "x86_64" if arch == "x86" else arch
+
+    async def events():
+        # 响应体在另一段上下文中迭代，需要重新绑定捕获器
+        current_capture.set(capture)
+        seen = 0
+        try:
+            logger.info("开始符号化处理...")
+            async for idx, block in symbolizer.symbolize_iter(
+                content_or_path=content_or_path,
+                version=version,
+                arch=arch_format,
+                isBackup=isNDI
+            ):
+                # 先推送到目前为止已分发的日志，再推送线程块
+                lines, seen = capture.since(seen)
+                for line in lines:
+                    yield _sse_event("log", {"line": line})
+                yield _sse_event("block", {"index": idx, "text": format_block(block)})
+            logger.info("符号化处理完成!")
+            await record_version(shared_state, version, arch_format, isNDI)
+            await log_system.flush()
+            yield _sse_event("done", {"logs": capture.lines()})
+        except Exception as e:  # noqa: BLE001 - the stream has started, errors go to the client as events
+            logger.error(str(e))
+            await log_system.flush()
+            yield _sse_event("error", {"error": str(e), "logs": capture.lines()})
+        finally:
+            # 客户端断开时生成器被关闭，同样清理临时文件
+            _remove_temp_file(temp_file_path)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _job_response(job) -> JobResponse:
+    return JobResponse(
+        id=job.id,
+        status=job.status.value,
+        queue_position=job_manager.queue_position(job),
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        output=job.output,
+        error=job.error
+    )
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(
+    version: str = Form(..., description="版本号，必填"),
+    arch: str = Form(..., description="架构，arm64或x86"),
+    isNDI: bool = Form(False, description="是否启用NDI"),
+    stack_content: Annotated[str | None, Form(description="Stack内容")] = None,
+    crash_file: Annotated[UploadFile | None, File(description="崩溃文件上传")] = None
+):
+    """提交后台符号化任务，立即返回任务id"""
+    # 入队前先做准入检查，避免队列已满时还保存上传文件
+    if job_manager.queued >= job_manager.max_queued:
+        return JSONResponse(status_code=429, content={"detail": "任务队列已满，请稍后重试"}, headers={"Retry-After": "30"})
+
+    content_or_path, temp_file_path = await _prepare_input(version, arch, isNDI, stack_content, crash_file)
+    arch_format = "x86_64" if arch == "x86" else arch
+    try:
+        job = job_manager.submit(version, arch_format, isNDI, content_or_path, temp_file_path)
+    except JobQueueFull as e:
+        _remove_temp_file(temp_file_path)
+        return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": "30"})
+    return _job_response(job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """查询任务状态和结果"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return _job_response(job)
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """取消等待中或执行中的任务"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="任务已结束，无法取消")
+    return _job_response(job)
+
+@app.get("/jobs/{job_id}/logs")
+async def stream_job_logs(job_id: str):
+    """
+    以 SSE 推送任务日志：先推送已有日志，再持续推送新日志，任务结束后发送end事件
+    事件: log {line}，end {status}
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def events():
+        async for line in job.log_capture.follow():
+            yield _sse_event("log", {"line": line})
+        yield _sse_event("end", {"status": job.status.value})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/healthz")
+async def healthz():
+    """健康检查，返回本worker以及同一共享状态下所有存活worker的负载"""
+    workers = await asyncio.to_thread(shared_state.workers)
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "load": job_manager.load(),
+        "workers": workers
+    }
+
+@app.post("/prefetch", status_code=202)
+async def trigger_prefetch(
+    versions: str | None = Form(None, description="逗号分隔的版本号，为空时使用配置和最近请求过的版本"),
+    arch: str | None = Form(None, description="架构，arm64或x86，为空时使用配置的架构"),
+    isNDI: bool = Form(False, description="是否启用NDI"),
+    now: bool = Form(False, description="立即下载，不等待空闲时段")
+):
+    """触发后台预下载符号文件，立即返回计划下载的版本"""
+    if prefetcher.busy:
+        raise HTTPException(status_code=409, detail="预下载正在进行中")
+
+    if versions:
+        archs = ["x86_64" if arch == "x86" else arch] if arch else prefetch_archs()
+        targets = [
+            PrefetchTarget(version.strip(), a, isNDI)
+            for version in versions.split(",") if version.strip()
+            for a in archs
+        ]
+    else:
+        targets = await asyncio.to_thread(prefetch_targets)
+
+    planned = await asyncio.to_thread(prefetcher.plan, targets)
+    _start_prefetch(prefetcher.prefetch(planned, wait_for_window=not now))
+    return {
+        "planned": [{"version": x.version, "arch": x.arch, "isBackup": x.isBackup} for x in planned]
+    }
+
+@app.get("/prefetch")
+async def prefetch_status():
+    """预下载状态：是否在进行、正在下载的版本、各版本结果"""
+    return prefetcher.status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus文本格式的指标，只包含处理本次请求的worker进程"""
+    if metrics_sink is None:
+        raise HTTPException(status_code=404, detail="未启用内存指标，设置MAC_SYMBOLIZER_METRICS=memory")
+    lines = [metrics_sink.render_prometheus()]
+    # 当前负载作为gauge导出
+    for name, value in job_manager.load().items():
+        if name != 'started_at':
+            lines.append(f"# TYPE {metrics.PROMETHEUS_PREFIX}jobs_{name} gauge\n{metrics.PROMETHEUS_PREFIX}jobs_{name} {value}\n")
+    # 自适应并发的当前上限
+    lines.append(f"# TYPE {metrics.PROMETHEUS_PREFIX}concurrency_limit gauge\n")
+    limiters = [
+        ("request", symbolizer.symbolize_semaphore),
+        ("request", symbolizer.downloader.semaphore),
+        ("prefetch", prefetcher.downloader.semaphore),
+    ]
+    for owner, limiter in limiters:
+        lines.append(
+            f'{metrics.PROMETHEUS_PREFIX}concurrency_limit{{limiter="{limiter.name}",owner="{owner}"}} {limiter.value}\n'
         )
+    return PlainTextResponse("".join(lines), media_type="text/plain; version=0.0.4")
 
 @app.get("/logs", response_model=LogOutput)
 async def get_logs():
-    """获取当前日志输出"""
-    global log_output
-    return LogOutput(logs=log_output.copy())
+    """获取服务最近的日志输出（所有请求）"""
+    return LogOutput(logs=log_system.recent.lines())
 
 @app.post("/clear-logs")
 async def clear_logs():
-    """清空日志"""
-    global log_output
-    log_output.clear()
+    """清空服务最近的日志"""
+    log_system.recent.clear()
     return {"message": "日志已清空"}
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+"""
+后台符号化任务队列
+请求只负责入队并返回任务id，固定数量的worker从队列中取任务执行，
+冷版本的下载和符号化不再占用HTTP连接
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+
+from MacAutoSymbolizer import Symbolizer
+from MacAutoSymbolizer.src import metrics
+from webPage.log_capture import LogCapture, LogCaptureSystem, current_capture
+from webPage.shared_state import SharedState, result_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+
+FINISHED_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """等待中的任务数已达上限"""
+
+
+@dataclass
+class Job:
+    version: str
+    arch: str
+    isBackup: bool
+    content_or_path: str
+    temp_file_path: str | None = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.QUEUED
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    output: str | None = None
+    error: str | None = None
+    log_capture: LogCapture = field(default_factory=LogCapture, repr=False)
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+def format_blocks(blocks) -> str:
+    """把符号化结果格式化为输出文本，每个线程块前加分隔线"""
+    return "\n".join(format_block(block) for block in blocks)
+
+
+def format_block(block) -> str:
+    return "\n".join(["-" * 100] + [str(line) for line in block])
+
+
+async def symbolize_cached(
+        symbolizer: Symbolizer,
+        shared_state: SharedState | None,
+        content_or_path: str,
+        version: str,
+        arch: str,
+        isBackup: bool
+) -> str:
+    """
+    符号化并返回输出文本，先查共享结果缓存，其他worker处理过的相同崩溃直接复用
+    成功后记录请求的版本，供预下载参考；被预算截断或桶命中只符号化了崩溃线程的结果不写入缓存
+    """
+    key = None
+    if shared_state is not None:
+        key = await asyncio.to_thread(result_cache_key, version, arch, isBackup, content_or_path)
+        cached = await asyncio.to_thread(shared_state.get_result, key)
+        metrics.inc('result_cache_lookups_total', result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            logger.info(f'[{__name__}] 命中结果缓存: {key[:12]}')
+            await record_version(shared_state, version, arch, isBackup)
+            return cached
+
+    blocks, complete = await symbolizer.symbolize_report_async(
+        content_or_path=content_or_path,
+        version=version,
+        arch=arch,
+        isBackup=isBackup
+    )
+    output = format_blocks(blocks)
+    if key is not None:
+        if complete:
+            await asyncio.to_thread(shared_state.put_result, key, output)
+        await record_version(shared_state, version, arch, isBackup)
+    return output
+
+
+async def record_version(shared_state: SharedState | None, version: str, arch: str, isBackup: bool):
+    """记录请求过的版本，失败不影响请求本身"""
+    if shared_state is None:
+        return
+    try:
+        await asyncio.to_thread(shared_state.record_version, version, arch, isBackup)
+    except sqlite3.Error as e:
+        logger.warning(f'[{__name__}] 记录请求版本失败: {e}')
+
+
+class JobManager:
+    """
+    有界的后台任务池
+    :param symbolizer: 共享的符号化器
+    :param workers: worker数量，即同时执行的任务数
+    :param max_queued: 最多允许等待的任务数，超过后submit抛出JobQueueFull
+    :param max_finished: 最多保留的已结束任务数，超过后淘汰最早结束的
+    :param log_system: 日志捕获系统，任务结束时等其日志分发完再关闭日志流
+    :param shared_state: 多worker共享的结果缓存，命中时不再符号化
+    """
+
+    def __init__(self, symbolizer: Symbolizer, workers: int, max_queued: int, max_finished: int = 200,
+                 log_system: LogCaptureSystem | None = None, shared_state: SharedState | None = None):
+        self.symbolizer = symbolizer
+        self.log_system = log_system
+        self.shared_state = shared_state
+        self.processed = 0
+        self.started_at = time.time()
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.jobs: dict[str, Job] = {}
+        self._finished: OrderedDict[str, None] = OrderedDict()
+        self._queue: asyncio.Queue | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == JobStatus.QUEUED)
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == JobStatus.RUNNING)
+
+    def load(self) -> dict:
+        """当前worker的负载"""
+        return {
+            'running': self.running,
+            'queued': self.queued,
+            'capacity': self.workers,
+            'processed': self.processed,
+            'started_at': self.started_at
+        }
+
+    async def start(self):
+        """在当前事件循环中启动worker"""
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i), name=f'symbolize-worker-{i}') for i in range(self.workers)
+        ]
+        logger.info(f'[{__name__}] 任务队列已启动: worker={self.workers}, 最大等待数={self.max_queued}')
+
+    async def stop(self):
+        """停止worker，取消所有未结束的任务"""
+        for job in list(self.jobs.values()):
+            self.cancel(job.id)
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, version: str, arch: str, isBackup: bool, content_or_path: str,
+               temp_file_path: str | None = None) -> Job:
+        """任务入队。等待数已满时抛出JobQueueFull，临时文件由调用方清理"""
+        if self._queue is None:
+            raise RuntimeError('JobManager is not started')
+        if self.queued >= self.max_queued:
+            raise JobQueueFull(f'等待中的任务已达上限 ({self.max_queued})')
+
+        job = Job(version=version, arch=arch, isBackup=isBackup,
+                  content_or_path=content_or_path, temp_file_path=temp_file_path)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        logger.info(f'[{__name__}] 任务已入队: {job.id}')
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def queue_position(self, job: Job) -> int | None:
+        """任务在等待队列中的位置，从0开始；不在等待中时返回None"""
+        if job.status != JobStatus.QUEUED:
+            return None
+        return sum(1 for x in self.jobs.values() if x.status == JobStatus.QUEUED and x.created_at < job.created_at)
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务，返回是否取消成功（已结束的任务无法取消）"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        if job.status == JobStatus.QUEUED:
+            # 还在队列中，worker取到时会跳过
+            self._finish(job, JobStatus.CANCELLED)
+        elif job.task is not None:
+            job.task.cancel()
+        return True
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status != JobStatus.QUEUED:
+                    continue
+                job.status = JobStatus.RUNNING
+                job.started_at = datetime.now()
+                task = job.task = asyncio.create_task(self._run(job))
+                try:
+                    # asyncio.wait不会把任务的取消传播给worker
+                    await asyncio.wait([task])
+                finally:
+                    if not task.done():
+                        task.cancel()
+                if task.cancelled():
+                    self._finish(job, JobStatus.CANCELLED)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        # 任务在自己的上下文中运行，这里绑定的日志捕获器只对该任务生效
+        current_capture.set(job.log_capture)
+        metrics.observe('job_queue_seconds', (job.started_at - job.created_at).total_seconds())
+        logger.info(f'[{__name__}] 开始执行任务: {job.id}')
+        try:
+            job.output = await symbolize_cached(
+                self.symbolizer, self.shared_state, job.content_or_path, job.version, job.arch, job.isBackup
+            )
+            self._finish(job, JobStatus.SUCCEEDED)
+        except Exception as e:  # noqa: BLE001 - any failure fails the job, the worker keeps running
+            logger.error(f'[{__name__}] 任务失败 {job.id}: {e}')
+            job.error = str(e)
+            self._finish(job, JobStatus.FAILED)
+
+    def _finish(self, job: Job, status: JobStatus):
+        if job.finished:
+            return
+        job.status = status
+        job.finished_at = datetime.now()
+        metrics.inc('jobs_total', status=status.value)
+        if job.started_at is not None:
+            metrics.observe('job_run_seconds', (job.finished_at - job.started_at).total_seconds())
+        job.task = None
+        if status != JobStatus.CANCELLED:
+            self.processed += 1
+        if self.log_system is not None:
+            self.log_system.close_capture(job.log_capture)
+        else:
+            job.log_capture.close()
+        # 清理临时文件
+        if job.temp_file_path and os.path.exists(job.temp_file_path):
+            try:
+                os.remove(job.temp_file_path)
+            except OSError as e:
+                logger.warning(f'[{__name__}] 临时文件清理失败: {e}')
+        self._finished[job.id] = None
+        while len(self._finished) > self.max_finished:
+            old_id, _ = self._finished.popitem(last=False)
+            self.jobs.pop(old_id, None)
@@ -0,0 +1,199 @@
+"""
+按请求/任务捕获日志
+每个请求或后台任务持有一个LogCapture（有界环形缓冲），通过contextvar绑定到当前上下文。
+日志记录先进入队列，由QueueListener在后台线程中格式化并分发，记录日志不会阻塞事件循环。
+"""
+
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from collections import deque
+from collections.abc import AsyncIterator
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+# 当前请求/任务的日志捕获器
+current_capture: ContextVar[Optional['LogCapture']] = ContextVar('log_capture', default=None)
+
+# 需要捕获的logger
+CAPTURED_LOGGERS = ('MacAutoSymbolizer', 'webPage', '__main__')
+
+
+class LogCapture:
+    """
+    有界的日志环形缓冲，可被异步地跟随读取
+    :param maxlen: 最多保留的日志行数，超出后丢弃最早的
+    """
+
+    def __init__(self, maxlen: int = 2000):
+        self._lines: deque = deque(maxlen=maxlen)
+        self._total = 0
+        self._lock = threading.Lock()
+        self.closed = False
+        self._changed: asyncio.Event | None = None
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def lines(self) -> list[str]:
+        with self._lock:
+            return list(self._lines)
+
+    def append(self, line: str):
+        """追加一行日志，可以在任意线程调用"""
+        with self._lock:
+            self._lines.append(line)
+            self._total += 1
+        self._notify()
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+
+    def close(self):
+        """标记不再有新日志，结束所有follow"""
+        self.closed = True
+        self._notify()
+
+    def _notify(self):
+        if self._changed is None or self._loop is None or self._loop.is_closed():
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._changed.set)
+        except RuntimeError:
+            pass
+
+    def since(self, seen: int) -> tuple[list[str], int]:
+        """返回第seen行之后的新日志和新的位置，跟不上时跳过已被环形缓冲丢弃的日志"""
+        with self._lock:
+            total, lines = self._total, list(self._lines)
+        return lines[max(0, len(lines) - (total - seen)):], total
+
+    async def follow(self) -> AsyncIterator[str]:
+        """先输出缓冲中已有的日志，再持续输出新日志，直到close"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        if self._changed is None:
+            self._changed = asyncio.Event()
+
+        seen = 0
+        while True:
+            self._changed.clear()
+            closed = self.closed
+            lines, seen = self.since(seen)
+            for line in lines:
+                yield line
+            if closed:
+                return
+            if seen == self._total and not self.closed:
+                await self._changed.wait()
+
+
+class CaptureHandler(logging.Handler):
+    """在监听线程中把日志写入记录所属的LogCapture，以及全局的最近日志缓冲"""
+
+    def __init__(self, recent: LogCapture):
+        super().__init__()
+        self.recent = recent
+
+    def emit(self, record):
+        try:
+            timestamp = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S')
+            line = f"[{timestamp}] {record.levelname}: {self.format(record)}"
+            capture = getattr(record, 'log_capture', None)
+            if capture is not None:
+                capture.append(line)
+            self.recent.append(line)
+        except Exception:  # noqa: BLE001 - same contract as logging.Handler.emit
+            self.handleError(record)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """入队时记下当前上下文的LogCapture，监听线程中contextvar已不可用"""
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_capture = current_capture.get()
+        return record
+
+
+class CaptureQueueListener(logging.handlers.QueueListener):
+    """处理flush/close标记：标记与普通日志同队列，保证之前的日志都已分发"""
+
+    def handle(self, record):
+        flushed = getattr(record, 'flush_event', None)
+        if flushed is not None:
+            flushed.set()
+            return
+        closing = getattr(record, 'close_capture', None)
+        if closing is not None:
+            closing.close()
+            return
+        super().handle(record)
+
+
+class LogCaptureSystem:
+    """
+    管理日志队列和后台监听线程
+    日志级别默认INFO，可通过环境变量MAC_SYMBOLIZER_WEB_LOG_LEVEL调整
+    """
+
+    def __init__(self, recent_maxlen: int = 1000):
+        self.recent = LogCapture(maxlen=recent_maxlen)
+        self.level = logging.getLevelName(os.getenv('MAC_SYMBOLIZER_WEB_LOG_LEVEL', 'INFO').upper())
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.queue_handler = ContextQueueHandler(self._queue)
+
+        formatter = logging.Formatter('%(name)s - %(message)s')
+        capture_handler = CaptureHandler(self.recent)
+        capture_handler.setFormatter(formatter)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s: %(name)s - %(message)s',
+                                                       '%Y-%m-%d %H:%M:%S'))
+        self.listener = CaptureQueueListener(
+            self._queue, capture_handler, console_handler, respect_handler_level=True
+        )
+
+    def install(self, logger_names=CAPTURED_LOGGERS):
+        for logger_name in logger_names:
+            logger = logging.getLogger(logger_name)
+            logger.setLevel(self.level)
+            if self.queue_handler not in logger.handlers:
+                logger.addHandler(self.queue_handler)
+            # 防止重复日志
+            logger.propagate = False
+
+    def start(self):
+        if self.listener._thread is None:
+            self.listener.start()
+
+    def stop(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    @property
+    def running(self) -> bool:
+        return self.listener._thread is not None
+
+    async def flush(self, timeout: float = 1.0):
+        """等待此前记录的日志都已写入各自的LogCapture"""
+        if not self.running:
+            return
+        flushed = threading.Event()
+        self._queue.put_nowait(logging.makeLogRecord({'flush_event': flushed}))
+        await asyncio.to_thread(flushed.wait, timeout)
+
+    def close_capture(self, capture: LogCapture):
+        """在此前记录的日志都分发完之后关闭capture"""
+        if not self.running:
+            capture.close()
+            return
+        self._queue.put_nowait(logging.makeLogRecord({'close_capture': capture}))
@@ -0,0 +1,153 @@
+"""
+多worker进程共享的状态
+使用SQLite（WAL模式）保存符号化结果缓存、各worker的负载心跳和请求过的版本，
+同一节点上的所有worker进程读写同一个数据库文件
+"""
+
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 心跳超过这个时间没有更新的worker视为已退出
+WORKER_STALE_SECONDS = 30
+
+
+def result_cache_key(version: str, arch: str, isBackup: bool, content_or_path: str) -> str:
+    """按版本、架构和崩溃内容计算结果缓存的key，文件分块读取"""
+    digest = hashlib.sha256(f'{version}\0{arch}\0{int(isBackup)}\0'.encode())
+    if os.path.isfile(content_or_path):
+        with open(content_or_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    else:
+        digest.update(content_or_path.encode())
+    return digest.hexdigest()
+
+
+class SharedState:
+    """
+    :param path: SQLite数据库文件路径
+    :param max_results: 最多缓存的结果数，超过后淘汰最早写入的
+    """
+
+    def __init__(self, path: str, max_results: int = 500):
+        self.path = path
+        self.max_results = max_results
+        self.host = socket.gethostname()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, output TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS workers ('
+                'pid INTEGER PRIMARY KEY, host TEXT, started_at REAL, updated_at REAL, '
+                'running INTEGER, queued INTEGER, capacity INTEGER, processed INTEGER)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS versions ('
+                'version TEXT, arch TEXT, is_backup INTEGER, requests INTEGER, last_seen REAL, '
+                'PRIMARY KEY (version, arch, is_backup))'
+            )
+
+    @property
+    def pid(self) -> int:
+        # worker可能由fork产生，不能在构造时记录
+        return os.getpid()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 每次调用新建连接，可以在任意线程中使用；退出时提交并关闭
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- 结果缓存 --- #
+    def get_result(self, key: str) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute('SELECT output FROM results WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def put_result(self, key: str, output: str):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO results (key, output, created_at) VALUES (?, ?, ?)',
+                (key, output, time.time())
+            )
+            conn.execute(
+                'DELETE FROM results WHERE key NOT IN '
+                '(SELECT key FROM results ORDER BY created_at DESC LIMIT ?)',
+                (self.max_results,)
+            )
+
+    def iter_results(self, batch_size: int = 500) -> Iterator[tuple[str, str]]:
+        """按写入顺序分批读取所有缓存的结果 (key, output)，例如重建相似崩溃索引"""
+        last = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    'SELECT rowid, key, output FROM results WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, key, output in rows:
+                yield key, output
+            last = rows[-1][0]
+
+    # --- worker心跳 --- #
+    def heartbeat(self, running: int, queued: int, capacity: int, processed: int, started_at: float):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO workers '
+                '(pid, host, started_at, updated_at, running, queued, capacity, processed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.pid, self.host, started_at, time.time(), running, queued, capacity, processed)
+            )
+
+    def remove_worker(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM workers WHERE pid = ?', (self.pid,))
+
+    def workers(self) -> list[dict]:
+        """返回仍然存活的worker的负载"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM workers WHERE updated_at < ?', (time.time() - WORKER_STALE_SECONDS,))
+            rows = conn.execute(
+                'SELECT pid, host, started_at, updated_at, running, queued, capacity, processed '
+                'FROM workers ORDER BY pid'
+            ).fetchall()
+        keys = ('pid', 'host', 'started_at', 'updated_at', 'running', 'queued', 'capacity', 'processed')
+        return [dict(zip(keys, row)) for row in rows]
+
+    # --- 请求过的版本，供预下载参考 --- #
+    def record_version(self, version: str, arch: str, isBackup: bool):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO versions (version, arch, is_backup, requests, last_seen) VALUES (?, ?, ?, 1, ?) '
+                'ON CONFLICT (version, arch, is_backup) DO UPDATE SET '
+                'requests = requests + 1, last_seen = excluded.last_seen',
+                (version, arch, int(isBackup), time.time())
+            )
+
+    def recent_versions(self, limit: int) -> list[tuple[str, bool]]:
+        """最近请求过的版本 (version, isBackup)，不区分架构，最近的在前"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT version, is_backup FROM versions GROUP BY version, is_backup '
+                'ORDER BY MAX(last_seen) DESC LIMIT ?',
+                (limit,)
+            ).fetchall()
+        return [(version, bool(is_backup)) for version, is_backup in rows]
@@ -45,6 +45,14 @@ def main():
     # 只在开发环境添加reload选项
     if os.getenv('DEVELOPMENT', 'false').lower() == 'true':
         cmd.extend(["--reload", "--reload-dir", webPage_dir])
+    else:
+        # 多进程模式：各worker共享符号目录、下载文件锁和SQLite结果缓存
+        # WEB_WORKERS=0 表示使用全部CPU核心
+        workers = int(os.getenv('WEB_WORKERS', '1'))
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        if workers > 1:
+            cmd.extend(["--workers", str(workers)])
 
     print("启动命令:", " ".join(cmd))
     print("服务器将在 http://localhost:5001 启动")
@@ -495,12 +495,12 @@ async function handleFormSubmit(e) {
             formData.delete('stack_content');
         }
         
-        const response = await fetch('/symbolize', {
+        const response = await fetch('/symbolize/stream', {
             method: 'POST',
             body: formData
         });
         
-        const result = await response.json();
+        const result = await readSymbolizeStream(response);
         
         if (result.success) {
             symbolizeResult.textContent = result.output || (
@@ -549,6 +549,68 @@ async function handleFormSubmit(e) {
     }
 }
 
+// 读取 /symbolize/stream 的 SSE 响应，线程块到达后立即按原始顺序渲染
+async function readSymbolizeStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const blocks = [];
+    const logs = [];
+    const result = { success: false, output: '', error: null, logs: [] };
+    let buffer = '';
+    let firstBlock = true;
+    
+    const render = () => blocks.filter(text => text !== undefined).join('\n');
+    
+    const handleEvent = (raw) => {
+        let event = 'message';
+        const dataLines = [];
+        raw.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        if (dataLines.length === 0) return;
+        const data = JSON.parse(dataLines.join('\n'));
+        
+        if (event === 'log') {
+            logs.push(data.line);
+            logsResult.textContent = logs.join('\n');
+            logsResult.scrollTop = logsResult.scrollHeight;
+        } else if (event === 'block') {
+            blocks[data.index] = data.text;
+            symbolizeResult.textContent = render();
+            // 崩溃线程最先到达，立即切换到结果标签页
+            if (firstBlock) {
+                firstBlock = false;
+                switchOutputTab('result');
+            }
+        } else if (event === 'done') {
+            result.success = true;
+            result.logs = data.logs || [];
+        } else if (event === 'error') {
+            result.error = data.error;
+            result.logs = data.logs || [];
+        }
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            handleEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+        }
+    }
+    if (buffer.trim()) handleEvent(buffer);
+    
+    result.output = render();
+    return result;
+}
+
 function updateSymbolizeButton(processing) {
     if (!symbolizeBtn) return;
     
@@ -669,28 +731,3 @@ function showMessage(message, type = 'info') {
         }
     }, 3000);
 }
-
-// 轮询日志更新（可选功能）
-async function pollLogs() {
-    if (!isProcessing) return;
-    
-    try {
-        const response = await fetch('/logs');
-        const result = await response.json();
-        
-        if (result.logs && result.logs.length > 0) {
-            logsResult.textContent = result.logs.join('\n');
-            // 自动滚动到底部
-            logsResult.scrollTop = logsResult.scrollHeight;
-        }
-    } catch (error) {
-        console.error('获取日志失败:', error);
-    }
-}
-
-// 每秒轮询一次日志（当正在处理时）
-setInterval(() => {
-    if (isProcessing) {
-        pollLogs();
-    }
-}, 1000);
\ No newline at end of file